@@ -3,6 +3,7 @@ Django settings for NYC Harbor Vessel Tracker.
 """
 import os
 from pathlib import Path
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -79,6 +80,12 @@ CHANNEL_LAYERS = {
     },
 }
 
+# `manage.py benchmark` suites that run the real pipeline use this Redis
+# database (flushed around each run) and a "benchmark" channel layer prefix
+# instead of the live ones. BENCHMARK_REDIS_URL overrides it entirely
+BENCHMARK_REDIS_DB = int(os.environ.get("BENCHMARK_REDIS_DB", "15"))
+BENCHMARK_REDIS_URL = os.environ.get("BENCHMARK_REDIS_URL", "")
+
 import dj_database_url
 
 DATABASES = {
@@ -103,6 +110,9 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # CORS - allow React dev server
 CORS_ALLOW_ALL_ORIGINS = True
+# The frontend revalidates ports/zones with If-None-Match and reads the ETag
+CORS_ALLOW_HEADERS = (*default_headers, "if-none-match")
+CORS_EXPOSE_HEADERS = ["ETag", "Last-Modified"]
 
 # REST Framework
 REST_FRAMEWORK = {
@@ -116,6 +126,118 @@ REST_FRAMEWORK = {
 # AIS Configuration
 AIS_API_KEY = os.environ.get("AIS_API_KEY", "")
 AIS_USE_SIMULATOR = os.environ.get("AIS_USE_SIMULATOR", "False").lower() in ("true", "1", "yes")
+AIS_WS_URL = os.environ.get("AIS_WS_URL", "wss://stream.aisstream.io/v0/stream")
+
+# Offline feed (`manage.py simulate_ais`): ingest_ais connects here instead of
+# aisstream when AIS_USE_SIMULATOR is on. The synthetic fleet has
+# AIS_SIM_VESSELS ships sending AIS_SIM_RATE messages/s between them, one in
+# AIS_SIM_STATIC_EVERY being ShipStaticData
+AIS_SIMULATOR_URL = os.environ.get("AIS_SIMULATOR_URL", "ws://localhost:8765")
+AIS_SIM_VESSELS = int(os.environ.get("AIS_SIM_VESSELS", "1000"))
+AIS_SIM_RATE = float(os.environ.get("AIS_SIM_RATE", "200"))
+AIS_SIM_STATIC_EVERY = int(os.environ.get("AIS_SIM_STATIC_EVERY", "20"))
+# Where `manage.py record_ais` saves feeds (gzipped NDJSON)
+AIS_RECORDING_DIR = os.environ.get("AIS_RECORDING_DIR", str(BASE_DIR / "recordings"))
+
+# AIS ingestion batching: flush every AIS_BATCH_INTERVAL_MS or AIS_BATCH_SIZE
+# messages, and stop reading the feed once AIS_QUEUE_SIZE messages are waiting
+AIS_BATCH_SIZE = int(os.environ.get("AIS_BATCH_SIZE", "500"))
+AIS_BATCH_INTERVAL_MS = int(os.environ.get("AIS_BATCH_INTERVAL_MS", "250"))
+AIS_QUEUE_SIZE = int(os.environ.get("AIS_QUEUE_SIZE", "10000"))
+# Worker processes ingest_ais shards messages over (by MMSI hash), 1 keeps
+# everything in the one process
+AIS_WORKERS = int(os.environ.get("AIS_WORKERS", "1"))
+# What sits between the feed reader and processing: "queue" (in memory) or
+# "stream", AIS_STREAM_SHARDS Redis Streams (AIS_STREAM_PREFIX:{shard}) read by
+# the AIS_STREAM_GROUP consumer group, so bursts and restarts don't lose
+# messages. Processors are the reader's --workers and/or separate
+# `ingest_ais --consume --shard K --shards N` processes, each reading the
+# streams with shard % N == K. The stream count stays fixed whatever the
+# processor count, it's recorded in Redis and a mismatch won't start.
+# Delivery is at least once: a retried batch skips positions already
+# stored, its zone alerts and broadcasts may repeat. Streams are trimmed
+# to roughly AIS_STREAM_MAXLEN entries each
+AIS_BUFFER = os.environ.get("AIS_BUFFER", "queue")
+AIS_STREAM_SHARDS = int(os.environ.get("AIS_STREAM_SHARDS", "16"))
+AIS_STREAM_PREFIX = os.environ.get("AIS_STREAM_PREFIX", "ais:stream")
+AIS_STREAM_GROUP = os.environ.get("AIS_STREAM_GROUP", "ingest")
+AIS_STREAM_MAXLEN = int(os.environ.get("AIS_STREAM_MAXLEN", "100000"))
+
+# How often the ingest processes push their counters to Redis for
+# /api/metrics/ to pick up (0 turns that off). Web processes don't push, a
+# scrape shows the counters of the web process that answered it
+METRICS_PUSH_S = float(os.environ.get("METRICS_PUSH_S", "10"))
+
+# How many vessels the ingest process keeps in its MMSI lookup cache
+VESSEL_CACHE_SIZE = int(os.environ.get("VESSEL_CACHE_SIZE", "20000"))
+
+# Where vessel/zone membership lives: "memory" (this process) or "redis"
+# (shared by every ingest worker, survives restarts)
+ZONE_MEMBERSHIP_BACKEND = os.environ.get("ZONE_MEMBERSHIP_BACKEND", "memory")
+
+# How often ingestion re-encodes the initial_data snapshot websocket
+# clients get on connect (and how long the web process reuses it)
+SNAPSHOT_INTERVAL_MS = int(os.environ.get("SNAPSHOT_INTERVAL_MS", "2000"))
+
+# How many recent broadcasts are kept for clients resuming after a reconnect
+DELTA_BUFFER_SIZE = int(os.environ.get("DELTA_BUFFER_SIZE", "2000"))
+
+# Websocket clients zoomed out further than this get every vessel update,
+# closer in they only get the ones inside their map bounds
+VIEWPORT_MIN_ZOOM = float(os.environ.get("VIEWPORT_MIN_ZOOM", "5"))
+
+# Vessel updates are coalesced per vessel and sent once per tick (0 sends
+# each flush straight away). Rows that moved less than all of these
+# thresholds since the last one sent for that vessel are dropped
+BROADCAST_TICK_MS = int(os.environ.get("BROADCAST_TICK_MS", "500"))
+BROADCAST_MIN_DISTANCE_M = float(os.environ.get("BROADCAST_MIN_DISTANCE_M", "10"))
+BROADCAST_MIN_HEADING_DEG = float(os.environ.get("BROADCAST_MIN_HEADING_DEG", "5"))
+BROADCAST_MIN_SPEED_KN = float(os.environ.get("BROADCAST_MIN_SPEED_KN", "0.5"))
+
+# Position history retention: full resolution for the last
+# POSITION_FULL_RES_HOURS, one point per vessel per POSITION_DOWNSAMPLE_SECONDS
+# after that, and nothing older than POSITION_RETENTION_DAYS (0 keeps
+# everything). Expired rows are written to POSITION_ARCHIVE_DIR first if set
+POSITION_FULL_RES_HOURS = float(os.environ.get("POSITION_FULL_RES_HOURS", "24"))
+POSITION_DOWNSAMPLE_SECONDS = int(os.environ.get("POSITION_DOWNSAMPLE_SECONDS", "60"))
+POSITION_RETENTION_DAYS = float(os.environ.get("POSITION_RETENTION_DAYS", "30"))
+POSITION_ARCHIVE_DIR = os.environ.get("POSITION_ARCHIVE_DIR", "")
+# Pruning deletes at most POSITION_PRUNE_BATCH rows per statement and pauses
+# in between so ingestion isn't locked out. The ingest process runs it every
+# POSITION_PRUNE_INTERVAL_S seconds (0 = only via `manage.py prune_positions`)
+POSITION_PRUNE_BATCH = int(os.environ.get("POSITION_PRUNE_BATCH", "5000"))
+POSITION_PRUNE_PAUSE_MS = int(os.environ.get("POSITION_PRUNE_PAUSE_MS", "50"))
+POSITION_PRUNE_INTERVAL_S = int(os.environ.get("POSITION_PRUNE_INTERVAL_S", "3600"))
+
+# Columnar position exports (`manage.py export_positions`), partitioned by
+# day and by a hash of the MMSI into POSITION_EXPORT_BUCKETS buckets.
+# Exports (and the stream endpoint) leave out positions newer than
+# POSITION_EXPORT_LAG_S, they may still have lower ids in flight
+POSITION_EXPORT_DIR = os.environ.get("POSITION_EXPORT_DIR", str(BASE_DIR / "exports"))
+POSITION_EXPORT_BUCKETS = int(os.environ.get("POSITION_EXPORT_BUCKETS", "16"))
+POSITION_EXPORT_CHUNK_SIZE = int(os.environ.get("POSITION_EXPORT_CHUNK_SIZE", "50000"))
+POSITION_EXPORT_LAG_S = int(os.environ.get("POSITION_EXPORT_LAG_S", "60"))
+
+# Most positions /vessels/{id}/history/ reads for one time window before
+# simplifying (the newest ones win)
+TRACK_MAX_ROWS = int(os.environ.get("TRACK_MAX_ROWS", "200000"))
+
+# How long rendered port/zone responses stay in Redis without being asked for
+HTTP_CACHE_TTL_S = int(os.environ.get("HTTP_CACHE_TTL_S", "86400"))
+
+# ingest_helcom merges sites of the same port code closer than this (km)
+PORT_CLUSTER_KM = float(os.environ.get("PORT_CLUSTER_KM", "10"))
+
+# In-memory grid behind /ports/{id}/nearby_vessels/ and /vessels/{id}/nearest_port/:
+# cell size in degrees, how often it picks up new vessel positions (from the
+# broadcast delta log), how often it reloads the whole fleet from the snapshot
+# (which also drops deleted vessels), and how far nearest_port searches the
+# grid before falling back to scanning every port
+PROXIMITY_CELL_DEG = float(os.environ.get("PROXIMITY_CELL_DEG", "0.1"))
+PROXIMITY_REFRESH_S = float(os.environ.get("PROXIMITY_REFRESH_S", "1"))
+PROXIMITY_RELOAD_S = float(os.environ.get("PROXIMITY_RELOAD_S", "60"))
+PROXIMITY_NEAREST_RING_KM = float(os.environ.get("PROXIMITY_NEAREST_RING_KM", "250"))
+PROXIMITY_DEFAULT_RADIUS_KM = float(os.environ.get("PROXIMITY_DEFAULT_RADIUS_KM", "25"))
 
 # Arctic & sub-Arctic bounding box (global, lat >= 55)
 ARCTIC_BOUNDS = {
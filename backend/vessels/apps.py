@@ -5,3 +5,5 @@ class VesselsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'vessels'
 
+    def ready(self):
+        from . import signals  # noqa: F401
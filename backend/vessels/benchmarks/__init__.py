@@ -0,0 +1,99 @@
+"""
+Benchmark suites, run with `python manage.py benchmark <suite>`
+Each suite module has a run(options) that returns a dict of results
+"""
+import time
+from contextlib import contextmanager
+from importlib import import_module
+from urllib.parse import urlsplit, urlunsplit
+
+import redis
+from django.conf import settings
+from django.test import override_settings
+
+
+SUITES = {
+    "zones": "vessels.benchmarks.zones",
+    "fleet": "vessels.benchmarks.fleet",
+    "viewports": "vessels.benchmarks.viewports",
+    "codec": "vessels.benchmarks.codec",
+    "fanout": "vessels.benchmarks.fanout",
+    "export": "vessels.benchmarks.export",
+    "endpoints": "vessels.benchmarks.endpoints",
+    "proximity": "vessels.benchmarks.proximity",
+    "ingest": "vessels.benchmarks.ingest",
+    "sharding": "vessels.benchmarks.sharding",
+}
+
+# What `manage.py benchmark` runs without arguments. export seeds a large
+# history, ingest runs for minutes and sharding wants Postgres, so those
+# only run when named
+DEFAULT_SUITES = ["zones", "fleet", "viewports", "codec", "fanout", "endpoints", "proximity"]
+
+
+def load_suite(name):
+    return import_module(SUITES[name])
+
+
+def timed(fn, *args, repeat=1, **kwargs):
+    # Best wall time of `repeat` runs, and the last result
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark_redis_url():
+    # BENCHMARK_REDIS_URL, or REDIS_URL on BENCHMARK_REDIS_DB
+    if settings.BENCHMARK_REDIS_URL:
+        return settings.BENCHMARK_REDIS_URL
+    parts = urlsplit(settings.REDIS_URL)
+    return urlunsplit(parts._replace(path=f"/{settings.BENCHMARK_REDIS_DB}"))
+
+
+def _redis_target(url):
+    parts = urlsplit(url)
+    return parts.hostname, parts.port or 6379, parts.path.strip("/") or "0"
+
+
+def _flush(client):
+    # Suites that don't touch Redis still run without a server
+    try:
+        client.flushdb()
+    except redis.RedisError:
+        pass
+
+
+@contextmanager
+def isolated_redis():
+    # Suites that drive the real pipeline INCR the broadcast seq, write the
+    # delta log, snapshot and zone membership, and group_send. For the run
+    # all of that goes to a scratch Redis database (flushed before and
+    # after) and channel layer prefix, so live browsers and the live ingest
+    # never see it
+    from vessels.services import broadcast, redis_client, zone_membership
+
+    url = benchmark_redis_url()
+    if _redis_target(url) == _redis_target(settings.REDIS_URL):
+        raise RuntimeError("BENCHMARK_REDIS_URL is the live Redis database, pick another")
+    layers = {name: dict(layer) for name, layer in settings.CHANNEL_LAYERS.items()}
+    config = layers["default"].get("CONFIG", {})
+    if "hosts" in config:
+        layers["default"]["CONFIG"] = {**config, "hosts": [url], "prefix": "benchmark"}
+
+    def reset():
+        redis_client._client = None
+        broadcast._scripts.clear()
+        zone_membership._store = None
+
+    with override_settings(REDIS_URL=url, CHANNEL_LAYERS=layers):
+        reset()
+        _flush(redis_client.get_redis())
+        try:
+            yield url
+        finally:
+            _flush(redis_client.get_redis())
+            reset()
@@ -0,0 +1,73 @@
+"""
+Bytes on the wire and encode time for vessel frames, JSON against the
+packed binary subprotocol, plus the worst quantization error it adds
+"""
+import json
+
+import numpy as np
+
+from vessels.benchmarks import timed
+from vessels.services.binary_codec import decode_frame, encode_frame
+
+
+NEEDS_DB = False
+
+DEFAULTS = {"vessels": 3000, "batch": 300}
+
+
+def make_fleet(rng, count, bounds):
+    ship_types = ["cargo", "tanker", "passenger", "tug", "fishing", "pleasure", "other"]
+    return [
+        {
+            "id": i + 1,
+            "mmsi": str(230000000 + i),
+            "name": f"VESSEL {i}",
+            "ship_type": ship_types[i % len(ship_types)],
+            "weight_tonnage": float(rng.integers(0, 80000)),
+            "flag": "FI",
+            "length": float(rng.integers(10, 300)),
+            "width": float(rng.integers(3, 40)),
+            "destination": "HELSINKI",
+            "latitude": float(rng.uniform(bounds["min_lat"], bounds["max_lat"])),
+            "longitude": float(rng.uniform(bounds["min_lng"], bounds["max_lng"])),
+            "speed": float(rng.uniform(0, 25)),
+            "heading": float(rng.uniform(0, 360)),
+            "course": float(rng.uniform(0, 360)),
+        }
+        for i in range(count)
+    ]
+
+
+def compare(message_type, vessels):
+    json_s, text = timed(json.dumps, {"type": message_type, "seq": 1, "vessels": vessels}, repeat=5)
+    binary_s, frame = timed(encode_frame, message_type, 1, vessels, repeat=5)
+
+    decoded = decode_frame(frame)["vessels"]
+    position_error = max(
+        max(abs(a["latitude"] - b["latitude"]), abs(a["longitude"] - b["longitude"]))
+        for a, b in zip(vessels, decoded)
+    )
+    json_bytes = len(text.encode())
+    return {
+        "vessels": len(vessels),
+        "json_bytes": json_bytes,
+        "binary_bytes": len(frame),
+        "size_ratio": len(frame) / json_bytes,
+        "json_encode_ms": json_s * 1000,
+        "binary_encode_ms": binary_s * 1000,
+        "max_position_error_deg": position_error,
+    }
+
+
+def run(options):
+    from django.conf import settings
+
+    n_vessels = options.get("vessels") or DEFAULTS["vessels"]
+    fleet = make_fleet(np.random.default_rng(3), n_vessels, settings.BALTIC_BOUNDS)
+    update_keys = ["id", "mmsi", "name", "ship_type", "weight_tonnage",
+                   "latitude", "longitude", "speed", "heading", "course"]
+    update = [{k: v[k] for k in update_keys} for v in fleet[:DEFAULTS["batch"]]]
+    return {
+        "vessel_update": compare("vessel_update", update),
+        "initial_data": compare("initial_data", fleet),
+    }
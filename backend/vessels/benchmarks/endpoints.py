@@ -0,0 +1,98 @@
+"""
+List endpoints through the DRF serializers (as they were) against the
+.values_list() row encoders, full 500 row pages, checking the rendered
+JSON is byte for byte the same
+"""
+import json
+import random
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import mixins
+from rest_framework.test import APIRequestFactory
+
+from vessels import views
+from vessels.benchmarks import timed
+from vessels.benchmarks.fleet import seed as seed_fleet
+from vessels.models import DroneSimulation, Port, Vessel, Zone, ZoneAlert
+
+
+NEEDS_DB = True
+
+DEFAULTS = {"vessels": 3000, "positions": 2, "alerts": 3000, "ports": 600, "zones": 50, "repeat": 5}
+
+
+def legacy(viewset, queryset):
+    # The viewset with DRF's own list() and its old queryset
+    return type(f"Legacy{viewset.__name__}", (viewset,), {
+        "list": mixins.ListModelMixin.list,
+        "queryset": queryset,
+    })
+
+
+ENDPOINTS = {
+    "vessels": (views.VesselViewSet, Vessel.objects.select_related("latest")),
+    "zones": (views.ZoneViewSet, Zone.objects.all()),
+    "alerts": (views.ZoneAlertViewSet, ZoneAlert.objects.all()),
+    "drone": (views.DroneViewSet, DroneSimulation.objects.all()),
+    "ports": (views.PortViewSet, Port.objects.all()),
+}
+
+
+def seed(options):
+    rng = random.Random(11)
+    seed_fleet(options["vessels"], options["positions"])
+    vessel_ids = list(Vessel.objects.values_list("id", flat=True))
+
+    square = [[20, 60], [21, 60], [21, 61], [20, 61], [20, 60]]
+    Zone.objects.bulk_create([
+        Zone(name=f"Zone {i}", polygon_json=json.dumps({"type": "Polygon", "coordinates": [square]}))
+        for i in range(options["zones"])
+    ])
+    zone_ids = list(Zone.objects.values_list("id", flat=True))
+    ZoneAlert.objects.bulk_create([
+        ZoneAlert(zone_id=rng.choice(zone_ids), vessel_id=rng.choice(vessel_ids),
+                  alert_type=rng.choice(["enter", "exit"]))
+        for _ in range(options["alerts"])
+    ], batch_size=1000)
+    Port.objects.bulk_create([
+        Port(name=f"Port {i}", country="Finland", latitude=rng.uniform(54, 65),
+             longitude=rng.uniform(13, 30), locode=f"FI{i:03d}", helcom_id=f"H{i}")
+        for i in range(options["ports"])
+    ])
+    DroneSimulation.objects.bulk_create([
+        DroneSimulation(vessel_id=rng.choice(vessel_ids), start_latitude=60, start_longitude=20,
+                        current_latitude=60, current_longitude=20, target_latitude=61,
+                        target_longitude=21, status="in_transit")
+        for _ in range(100)
+    ])
+
+
+def render(view, path):
+    response = view(APIRequestFactory().get(path))
+    return response.render().content
+
+
+def measure(view, path, repeat):
+    with CaptureQueriesContext(connection) as queries:
+        render(view, path)
+    seconds, body = timed(render, view, path, repeat=repeat)
+    return {"ms": seconds * 1000, "queries": len(queries), "bytes": len(body)}, body
+
+
+def run(options):
+    options = {k: options.get(k) or v for k, v in DEFAULTS.items()}
+    seed(options)
+
+    results = {}
+    for name, (viewset, old_queryset) in ENDPOINTS.items():
+        path = f"/api/{name}/"
+        before, old_body = measure(legacy(viewset, old_queryset).as_view({"get": "list"}), path, options["repeat"])
+        after, new_body = measure(viewset.as_view({"get": "list"}), path, options["repeat"])
+        results[name] = {
+            "before": before,
+            "after": after,
+            "speedup": before["ms"] / after["ms"] if after["ms"] else None,
+            "identical": old_body == new_body,
+        }
+    return results
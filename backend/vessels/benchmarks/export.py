@@ -0,0 +1,94 @@
+"""
+Columnar export throughput: rows/sec for the partitioned Parquet export
+and the Arrow stream endpoint over a synthetic position history (1M rows
+by default, --rows 50000000 for the full sized run), plus peak memory
+"""
+import resource
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from django.db import connection, transaction
+
+from vessels.models import Vessel, VesselPosition
+from vessels.services.export import export_positions, export_queryset, stream_arrow
+
+
+NEEDS_DB = True
+
+DEFAULTS = {"rows": 1_000_000, "vessels": 5000, "days": 30, "insert_batch": 100_000}
+
+
+def seed(n_rows, n_vessels, days):
+    # Raw executemany, going through the ORM would take longer than the export
+    Vessel.objects.bulk_create([
+        Vessel(mmsi=str(200000000 + i), name=f"VESSEL {i}", ship_type="cargo")
+        for i in range(n_vessels)
+    ], batch_size=1000)
+    vessel_ids = np.array(Vessel.objects.order_by("id").values_list("id", flat=True))
+
+    table = connection.ops.quote_name(VesselPosition._meta.db_table)
+    columns = ["vessel_id", "latitude", "longitude", "speed", "heading", "course", "timestamp"]
+    sql = (f"INSERT INTO {table} ({', '.join(connection.ops.quote_name(c) for c in columns)}) "
+           f"VALUES ({', '.join(['%s'] * len(columns))})")
+
+    rng = np.random.default_rng(7)
+    start = datetime.now(timezone.utc) - timedelta(days=days)
+    step = days * 86400 / n_rows
+    batch = DEFAULTS["insert_batch"]
+    for offset in range(0, n_rows, batch):
+        n = min(batch, n_rows - offset)
+        seconds = (np.arange(offset, offset + n) * step).tolist()
+        rows = zip(
+            rng.choice(vessel_ids, n).tolist(),
+            rng.uniform(54, 65, n).tolist(),
+            rng.uniform(13, 30, n).tolist(),
+            rng.uniform(0, 20, n).tolist(),
+            rng.uniform(0, 360, n).tolist(),
+            rng.uniform(0, 360, n).tolist(),
+            (start + timedelta(seconds=s) for s in seconds),
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, list(rows))
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(options):
+    n_rows = options.get("rows") or DEFAULTS["rows"]
+    n_vessels = options.get("vessels") or DEFAULTS["vessels"]
+
+    started = time.monotonic()
+    seed(n_rows, n_vessels, DEFAULTS["days"])
+    seed_seconds = time.monotonic() - started
+    rss_before = peak_rss_mb()
+
+    root = tempfile.mkdtemp(prefix="positions-export-")
+    try:
+        # Seeded history runs up to now, don't hold back the newest minute
+        parquet = export_positions(root, lag_seconds=0)
+
+        started = time.monotonic()
+        streamed = sum(len(chunk) for chunk in stream_arrow(export_queryset()))
+        stream_seconds = time.monotonic() - started
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "rows": n_rows,
+        "vessels": n_vessels,
+        "seed_seconds": round(seed_seconds, 1),
+        "parquet": parquet,
+        "arrow_stream": {
+            "bytes": streamed,
+            "seconds": round(stream_seconds, 2),
+            "rows_per_sec": round(n_rows / stream_seconds) if stream_seconds else 0,
+        },
+        "peak_rss_mb_before_export": round(rss_before, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
@@ -0,0 +1,96 @@
+"""
+CPU per broadcast message across N connected consumers, encoding the rows
+in every consumer (the old handler) against encoding once in the producer
+and forwarding the text
+"""
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from vessels.benchmarks.codec import make_fleet
+from vessels.services import fastjson
+
+
+NEEDS_DB = False
+
+DEFAULTS = {"clients": [100, 500, 1000], "vessels": 300, "messages": 20}
+
+UPDATE_KEYS = ["id", "mmsi", "name", "ship_type", "weight_tonnage",
+               "latitude", "longitude", "speed", "heading", "course"]
+
+
+def make_consumers(count, binary=False):
+    from vessels.consumers import VesselConsumer
+
+    async def discard(text_data=None, bytes_data=None, close=False):
+        pass
+
+    consumers = []
+    for _ in range(count):
+        consumer = VesselConsumer()
+        consumer.viewport = None
+        consumer.binary = binary
+        consumer.send = discard
+        consumers.append(consumer)
+    return consumers
+
+
+async def per_consumer_json(consumers, seq, vessels):
+    # What every handler used to do with the raw rows
+    for consumer in consumers:
+        await consumer.send(text_data=json.dumps({
+            "type": "vessel_update",
+            "seq": seq,
+            "vessels": vessels,
+        }))
+
+
+async def encode_once(consumers, seq, vessels):
+    text = fastjson.dumps({"type": "vessel_update", "vessels": vessels, "seq": seq})
+    event = {"type": "vessel_update", "seq": seq, "text": text}
+    for consumer in consumers:
+        await consumer.vessel_update(event)
+
+
+def cpu_per_message(fn, consumers, updates):
+    from vessels.services.fanout import event_memo
+
+    async def go():
+        for seq, vessels in updates:
+            await fn(consumers, seq, vessels)
+
+    event_memo.clear()
+    start = time.process_time()
+    asyncio.run(go())
+    return (time.process_time() - start) / len(updates) * 1000
+
+
+def run(options):
+    from django.conf import settings
+
+    clients = options.get("clients") or DEFAULTS["clients"]
+    if isinstance(clients, int):
+        clients = [clients]
+    n_vessels = options.get("vessels") or DEFAULTS["vessels"]
+    rng = np.random.default_rng(5)
+    updates = [
+        (seq, [{k: v[k] for k in UPDATE_KEYS} for v in make_fleet(rng, n_vessels, settings.BALTIC_BOUNDS)])
+        for seq in range(1, DEFAULTS["messages"] + 1)
+    ]
+
+    results = {"vessels_per_message": n_vessels, "clients": {}}
+    for count in clients:
+        text_consumers = make_consumers(count)
+        binary_consumers = make_consumers(count, binary=True)
+        before = cpu_per_message(per_consumer_json, text_consumers, updates)
+        after = cpu_per_message(encode_once, text_consumers, updates)
+        binary = cpu_per_message(encode_once, binary_consumers, updates)
+        results["clients"][count] = {
+            "per_consumer_json_ms": before,
+            "encode_once_ms": after,
+            "encode_once_binary_ms": binary,
+            "speedup": before / after if after else None,
+        }
+    return results
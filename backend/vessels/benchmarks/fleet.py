@@ -0,0 +1,104 @@
+"""
+Full fleet listing: the old per-vessel positions.first() lookups against
+the denormalized VesselLatestPosition read, for both the REST list
+serializer and the websocket initial snapshot
+"""
+import random
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from vessels.benchmarks import timed
+from vessels.consumers import VesselConsumer
+from vessels.models import Vessel, VesselPosition, VesselLatestPosition
+from vessels.serializers import VesselSerializer, VesselPositionSerializer
+
+
+NEEDS_DB = True
+
+DEFAULTS = {"vessels": 3000, "positions": 5}
+
+
+class LegacyVesselSerializer(VesselSerializer):
+    # VesselSerializer before the latest position was denormalized
+    def get_latest_position(self, obj):
+        pos = obj.positions.first()
+        if pos:
+            return VesselPositionSerializer(pos).data
+        return None
+
+
+def legacy_snapshot():
+    # VesselConsumer.get_all_vessels before the latest position was denormalized
+    vessels = []
+    for v in Vessel.objects.all():
+        pos = v.positions.first()
+        vessel_data = {
+            "id": v.id, "mmsi": v.mmsi, "name": v.name, "ship_type": v.ship_type,
+            "weight_tonnage": v.weight_tonnage, "flag": v.flag, "length": v.length,
+            "width": v.width, "destination": v.destination,
+        }
+        if pos:
+            vessel_data["latitude"] = pos.latitude
+            vessel_data["longitude"] = pos.longitude
+            vessel_data["speed"] = pos.speed
+            vessel_data["heading"] = pos.heading
+            vessel_data["course"] = pos.course
+        vessels.append(vessel_data)
+    return vessels
+
+
+def seed(n_vessels, n_positions):
+    rng = random.Random(42)
+    Vessel.objects.bulk_create([
+        Vessel(mmsi=str(200000000 + i), name=f"VESSEL {i}", ship_type="cargo")
+        for i in range(n_vessels)
+    ], batch_size=1000)
+    for vessel_ids in _chunks(list(Vessel.objects.values_list("id", flat=True)), 500):
+        positions = VesselPosition.objects.bulk_create([
+            VesselPosition(
+                vessel_id=vessel_id,
+                latitude=rng.uniform(54, 65),
+                longitude=rng.uniform(13, 30),
+                speed=rng.uniform(0, 20),
+                heading=rng.uniform(0, 360),
+                course=rng.uniform(0, 360),
+            )
+            for _ in range(n_positions) for vessel_id in vessel_ids
+        ], batch_size=1000)
+        VesselLatestPosition.upsert(positions)
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def measure(fn):
+    with CaptureQueriesContext(connection) as queries:
+        seconds, result = timed(fn)
+    return {"ms": seconds * 1000, "queries": len(queries)}, result
+
+
+def run(options):
+    n_vessels = options.get("vessels") or DEFAULTS["vessels"]
+    n_positions = options.get("positions") or DEFAULTS["positions"]
+    seed(n_vessels, n_positions)
+
+    consumer = VesselConsumer()
+    before_api, old_rows = measure(lambda: LegacyVesselSerializer(Vessel.objects.all(), many=True).data)
+    after_api, new_rows = measure(lambda: VesselSerializer(Vessel.objects.select_related("latest"), many=True).data)
+    before_ws, old_snapshot = measure(legacy_snapshot)
+    after_ws, new_snapshot = measure(async_to_sync(consumer.get_all_vessels))
+
+    return {
+        "vessels": n_vessels,
+        "positions_per_vessel": n_positions,
+        "api_list_before": before_api,
+        "api_list_after": after_api,
+        "ws_snapshot_before": before_ws,
+        "ws_snapshot_after": after_ws,
+        "api_output_identical": old_rows == new_rows,
+        "ws_output_identical": old_snapshot == new_snapshot,
+    }
@@ -0,0 +1,273 @@
+"""
+The ingest_ais pipeline end to end, minus the socket: simulated aisstream
+messages go through the same queue, flush loop, batch processing and
+broadcast coalescer as the live feed, at a paced rate (or as fast as it
+takes them) for each fleet size and zone count. Measures sustained
+throughput, receive-to-broadcast latency of the reports that got sent,
+queries per message and memory: RSS after each run, and the process's peak
+so far (cumulative, so it's the biggest run up to that point)
+"""
+import asyncio
+import os
+import resource
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from vessels.benchmarks.zones import random_zones
+from vessels.management.commands import ingest_ais
+from vessels.models import Zone
+from vessels.services.ais_sim import FleetSimulator
+from vessels.services.zone_membership import rebuild_store
+
+
+NEEDS_DB = True
+
+# Rate 0 means "as fast as the pipeline will take them"
+DEFAULTS = {"vessels": [1000, 5000, 20000], "zones": [0, 50], "rates": [1000, 5000, 0], "duration": 5}
+
+# Each simulated vessel reports about this often (seconds of simulated
+# time), so tracks move like real ones whatever the send rate
+REPORT_INTERVAL_S = 10
+
+# Messages generated for an unpaced run, more than it can get through
+UNPACED_MESSAGES = 100000
+
+
+class BenchCommand(ingest_ais.Command):
+    # ingest_ais with a query counter around the work done off the loop,
+    # and its per-message logging thrown away
+
+    def __init__(self):
+        self.devnull = open(os.devnull, "w")
+        super().__init__(stdout=self.devnull, stderr=self.devnull)
+        self.batch_size = max(1, settings.AIS_BATCH_SIZE)
+        self.flush_interval = max(1, settings.AIS_BATCH_INTERVAL_MS) / 1000
+        self.queue_size = max(self.batch_size, settings.AIS_QUEUE_SIZE)
+        self.batching = True
+        self.reset()
+
+    def reset(self):
+        self.stats = ingest_ais.BatchStats()
+        self.processed = 0
+        self.errors = 0
+        self.queries = 0
+        self.broadcast_queries = 0
+
+    def _count(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def _count_broadcast(self, execute, sql, params, many, context):
+        self.broadcast_queries += 1
+        return execute(sql, params, many, context)
+
+    def process_batch(self, msgs):
+        # flush_loop logs and carries on after a failed batch, so count it
+        # here or the run would wait for it forever
+        try:
+            with connection.execute_wrapper(self._count):
+                super().process_batch(msgs)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.processed += len(msgs)
+
+    def flush_updates(self):
+        with connection.execute_wrapper(self._count_broadcast):
+            super().flush_updates()
+
+
+class LatencyRecorder:
+    # Wraps the coalescer's send: a row that goes out is matched to the
+    # message it came from by (mmsi, lat, lng). Rows merged into a newer one
+    # or suppressed never go out, they're counted by the coalescer instead
+
+    def __init__(self, send):
+        self.send = send
+        self.arrived = {}
+        self.latencies = []
+
+    def __call__(self, rows):
+        seq = self.send(rows)
+        now = time.monotonic()
+        for row in rows:
+            arrived = self.arrived.pop((row["mmsi"], row["latitude"], row["longitude"]), None)
+            if arrived is not None:
+                self.latencies.append(now - arrived)
+        return seq
+
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux, it's the high water mark for the whole run so far
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def rss_mb():
+    # Resident set right now, Linux only
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return None
+
+
+def generate(fleet, count):
+    # Messages stamped with simulated time, REPORT_INTERVAL_S per fleet lap
+    step = REPORT_INTERVAL_S / len(fleet.fleet)
+    start = time.time()
+    return [msg for i in range(count) for msg in fleet.next_messages(1, now=start + i * step)]
+
+
+def set_zones(count):
+    Zone.objects.all().delete()
+    if count:
+        rng = np.random.default_rng(count)
+        zones = random_zones(rng, count, settings.BALTIC_BOUNDS)
+        for zone in zones:
+            zone.id = None
+        Zone.objects.bulk_create(zones)
+    rebuild_store()
+
+
+async def drive(command, recorder, messages, rate, duration):
+    # Feed `messages` through the ingest queue at `rate` msg/s for up to
+    # `duration` seconds, then wait for everything to be processed and sent
+    queue = asyncio.Queue(maxsize=command.queue_size)
+    tasks = [asyncio.create_task(command.flush_loop(queue))]
+    if ingest_ais.coalescer.tick > 0:
+        tasks.append(asyncio.create_task(command.broadcast_loop()))
+
+    started = time.monotonic()
+    produced = 0
+    for msg in messages:
+        now = time.monotonic()
+        if now - started >= duration:
+            break
+        if rate:
+            ahead = started + produced / rate - now
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+        meta = msg["MetaData"]
+        received = time.monotonic()
+        if msg["MessageType"] == "PositionReport":
+            recorder.arrived[(str(meta["MMSI"]), meta["latitude"], meta["longitude"])] = received
+        await queue.put((received, msg))
+        produced += 1
+    offered_s = time.monotonic() - started
+
+    while command.processed < produced:
+        await asyncio.sleep(0.005)
+    processed_s = time.monotonic() - started
+    # Whatever the coalescer still holds goes out on the next tick
+    await asyncio.to_thread(command.flush_updates)
+
+    for task in tasks:
+        task.cancel()
+    return produced, offered_s, processed_s
+
+
+def percentiles(seconds):
+    if not seconds:
+        return {"samples": 0}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "samples": len(ms),
+        "p50": round(float(np.percentile(ms, 50)), 2),
+        "p95": round(float(np.percentile(ms, 95)), 2),
+        "p99": round(float(np.percentile(ms, 99)), 2),
+        "max": round(float(ms.max()), 2),
+    }
+
+
+def run_step(command, fleet, rate, duration):
+    coalescer = ingest_ais.coalescer
+    recorder = LatencyRecorder(coalescer.send)
+    count = int(rate * duration) if rate else UNPACED_MESSAGES
+    messages = generate(fleet, count)
+
+    command.reset()
+    coalescer.reset_stats()
+    coalescer.send = recorder
+    try:
+        produced, offered_s, processed_s = asyncio.run(drive(command, recorder, messages, rate, duration))
+    finally:
+        coalescer.send = recorder.send
+
+    stats = command.stats
+    rss = rss_mb()
+    offered_rate = produced / offered_s if offered_s else 0
+    return {
+        "target_rate": rate or "max",
+        "messages": produced,
+        "offered_per_s": round(offered_rate),
+        "processed_per_s": round(produced / processed_s) if processed_s else 0,
+        # Kept up: fed at (nearly) the target rate and done within a flush
+        # or two of the feed stopping
+        "sustained": bool(rate) and offered_rate >= rate * 0.95
+                     and processed_s - offered_s <= max(1.0, 2 * command.flush_interval),
+        "drain_s": round(processed_s - offered_s, 3),
+        "latency_ms": percentiles(recorder.latencies),
+        "queue_lag_ms": {
+            "avg": round(stats.total_lag / stats.batches * 1000, 2) if stats.batches else 0,
+            "max": round(stats.max_lag * 1000, 2),
+        },
+        "batches": {
+            "count": stats.batches,
+            "avg": round(stats.messages / stats.batches, 1) if stats.batches else 0,
+            "max": stats.max_batch,
+        },
+        "broadcast": {
+            "offered": coalescer.offered,
+            "sent_rows": coalescer.sent_rows,
+            "messages": coalescer.sent_messages,
+            "suppressed": coalescer.suppressed,
+            "merged": coalescer.merged,
+        },
+        "failed_batches": command.errors,
+        "queries_per_message": round(command.queries / produced, 3) if produced else 0,
+        "broadcast_queries": command.broadcast_queries,
+        "rss_mb": round(rss, 1) if rss is not None else None,
+        "peak_rss_mb_cumulative": round(peak_rss_mb(), 1),
+    }
+
+
+def run(options):
+    fleets = as_list(options.get("vessels") or DEFAULTS["vessels"])
+    zone_counts = as_list(options.get("zones") if options.get("zones") is not None else DEFAULTS["zones"])
+    rates = options.get("rates") or DEFAULTS["rates"]
+    duration = options.get("duration") or DEFAULTS["duration"]
+
+    command = BenchCommand()
+    ingest_ais.vessel_cache.clear()
+    ingest_ais.snapshot_publisher.warm()
+
+    results = {
+        "batch_size": command.batch_size,
+        "flush_ms": command.flush_interval * 1000,
+        "broadcast_tick_ms": ingest_ais.coalescer.tick * 1000,
+        "database": connection.vendor,
+        "runs": [],
+    }
+    for n_vessels in fleets:
+        fleet = FleetSimulator(n_vessels, settings.BALTIC_BOUNDS, seed=n_vessels)
+        # Every vessel reports once first, so runs measure a known fleet
+        # rather than vessel creation
+        warmup = fleet.next_messages(n_vessels)
+        for i in range(0, len(warmup), command.batch_size):
+            command.process_batch(warmup[i:i + command.batch_size])
+        command.flush_updates()
+
+        for n_zones in zone_counts:
+            set_zones(n_zones)
+            for rate in rates:
+                step = run_step(command, fleet, rate, duration)
+                results["runs"].append({"vessels": n_vessels, "zones": n_zones, **step})
+    return results
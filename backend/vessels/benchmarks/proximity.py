@@ -0,0 +1,84 @@
+"""
+Proximity queries on the grid index against a linear scan of the fleet:
+vessels within a radius of random Baltic points, and the nearest of the
+HELCOM sized port set to each vessel
+"""
+import random
+
+from django.conf import settings
+
+from vessels.benchmarks import timed
+from vessels.services.proximity import GridIndex, haversine_km
+
+
+NEEDS_DB = False
+
+DEFAULTS = {"vessels": 20000, "ports": 600, "queries": 500, "radius_km": 25}
+
+
+def scatter(rng, n, bounds):
+    return {
+        i: (rng.uniform(bounds["min_lat"], bounds["max_lat"]), rng.uniform(bounds["min_lng"], bounds["max_lng"]))
+        for i in range(n)
+    }
+
+
+def scan_within(points, lat, lng, radius_km):
+    found = [(haversine_km(lat, lng, *p), key) for key, p in points.items()]
+    return sorted(hit for hit in found if hit[0] <= radius_km)
+
+
+def scan_nearest(points, lat, lng):
+    return min((haversine_km(lat, lng, *p), key) for key, p in points.items())
+
+
+def run(options):
+    options = {k: options.get(k) or v for k, v in DEFAULTS.items()}
+    rng = random.Random(5)
+    bounds = settings.BALTIC_BOUNDS
+    vessels = scatter(rng, options["vessels"], bounds)
+    ports = scatter(rng, options["ports"], bounds)
+    centres = list(scatter(rng, options["queries"], bounds).values())
+    radius = options["radius_km"]
+
+    build_s, grid = timed(lambda: _build(vessels))
+    port_grid = _build(ports)
+
+    def grid_within():
+        return [grid.within(lat, lng, radius) for lat, lng in centres]
+
+    def grid_nearest():
+        return [port_grid.nearest(lat, lng) for lat, lng in centres]
+
+    within_s, within = timed(grid_within, repeat=3)
+    nearest_s, nearest = timed(grid_nearest, repeat=3)
+    # The scans are slow, a slice of the queries is enough to time them
+    sample = centres[:50]
+    scan_within_s, scanned = timed(lambda: [scan_within(vessels, lat, lng, radius) for lat, lng in sample])
+    scan_nearest_s, scanned_nearest = timed(lambda: [scan_nearest(ports, lat, lng) for lat, lng in sample])
+
+    n = len(centres)
+    return {
+        "vessels": len(vessels),
+        "ports": len(ports),
+        "build_ms": build_s * 1000,
+        "within": {
+            "radius_km": radius,
+            "avg_hits": sum(len(hits) for hits in within) / n,
+            "grid_us_per_query": within_s / n * 1e6,
+            "scan_us_per_query": scan_within_s / len(sample) * 1e6,
+            "identical": within[:len(sample)] == scanned,
+        },
+        "nearest_port": {
+            "grid_us_per_query": nearest_s / n * 1e6,
+            "scan_us_per_query": scan_nearest_s / len(sample) * 1e6,
+            "identical": nearest[:len(sample)] == scanned_nearest,
+        },
+    }
+
+
+def _build(points):
+    grid = GridIndex(settings.PROXIMITY_CELL_DEG)
+    for key, (lat, lng) in points.items():
+        grid.put(key, lat, lng)
+    return grid
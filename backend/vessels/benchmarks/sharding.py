@@ -0,0 +1,118 @@
+"""
+ingest_ais --workers N: the same unpaced simulated feed pushed through a
+WorkerPool of 1, 2, 4... workers, measuring processed msgs/s and the speedup
+over one worker. Workers are separate processes on their own connections, so
+this needs a database they can all reach (Postgres), not in-memory SQLite
+"""
+import asyncio
+import os
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from vessels.benchmarks.ingest import UNPACED_MESSAGES, BenchCommand, as_list, generate, set_zones
+from vessels.services import fastjson
+from vessels.services.ais_sim import FleetSimulator
+from vessels.services.ingest_workers import WorkerPool
+
+
+NEEDS_DB = True
+
+DEFAULTS = {"vessels": 5000, "zones": 50, "workers": [1, 2, 4], "duration": 10}
+
+
+async def drive(pool, messages, duration):
+    # Dispatch as fast as the pool takes them for up to `duration` seconds,
+    # then wait for the workers to finish what they were sent
+    flusher = asyncio.create_task(pool.flush_loop())
+    started = time.monotonic()
+    produced = 0
+    for mmsi, raw in messages:
+        if time.monotonic() - started >= duration:
+            break
+        await pool.put(mmsi, time.monotonic(), raw)
+        produced += 1
+    for shard in range(pool.shards):
+        if pool.buffers[shard]:
+            await pool.send(shard)
+    while sum(pool.processed) < produced:
+        if any(not process.is_alive() for process in pool.processes):
+            raise RuntimeError("An ingest worker died mid run")
+        await asyncio.sleep(0.01)
+    flusher.cancel()
+    return produced, time.monotonic() - started
+
+
+def run_step(workers, messages, duration, command):
+    broadcast_rows = 0
+
+    def on_rows(rows, seq=None, shard=None):
+        nonlocal broadcast_rows
+        broadcast_rows += len(rows)
+
+    pool = WorkerPool(
+        workers, command.batch_size, command.flush_interval, command.queue_size, on_rows,
+        options={
+            "db_name": connection.settings_dict["NAME"],
+            "settings": {"REDIS_URL": settings.REDIS_URL, "CHANNEL_LAYERS": settings.CHANNEL_LAYERS},
+            "verbosity": 0,
+        },
+    )
+    pool.start()
+    try:
+        pool.wait_ready()
+        produced, elapsed = asyncio.run(drive(pool, messages, duration))
+    finally:
+        pool.stop()
+    # Messages in batches that failed (lock timeouts, mostly) don't count
+    ok = produced - sum(pool.failed)
+    return {
+        "workers": workers,
+        "messages": produced,
+        "processed_per_s": round(ok / elapsed) if elapsed else 0,
+        "per_worker": list(pool.processed),
+        "failed_messages": sum(pool.failed),
+        "broadcast_rows": broadcast_rows,
+    }
+
+
+def run(options):
+    if connection.vendor == "sqlite" and connection.creation.is_in_memory_db(connection.settings_dict["NAME"]):
+        return {"error": "Needs a database the worker processes can share, set DATABASE_URL to Postgres"}
+
+    n_vessels = options.get("vessels") or DEFAULTS["vessels"]
+    n_zones = options.get("zones") if options.get("zones") is not None else DEFAULTS["zones"]
+    worker_counts = as_list(options.get("workers") or DEFAULTS["workers"])
+    duration = options.get("duration") or DEFAULTS["duration"]
+
+    command = BenchCommand()
+    fleet = FleetSimulator(n_vessels, settings.BALTIC_BOUNDS, seed=n_vessels)
+    # Vessels exist before the timed runs, same as the ingest suite
+    warmup = fleet.next_messages(n_vessels)
+    for i in range(0, len(warmup), command.batch_size):
+        command.process_batch(warmup[i:i + command.batch_size])
+    set_zones(n_zones)
+    # Connections are reopened in the workers, don't hand them a busy database
+    connection.close()
+
+    results = {
+        "vessels": n_vessels,
+        "zones": n_zones,
+        "batch_size": command.batch_size,
+        "cpu_count": os.cpu_count(),
+        "database": connection.vendor,
+        "runs": [],
+    }
+    for workers in worker_counts:
+        # Fresh reports for every run, replayed ones would be skipped as
+        # older than what the last run wrote. Encoded up front, the reader
+        # only forwards raw text
+        messages = [(msg["MetaData"]["MMSI"], fastjson.dumps(msg)) for msg in generate(fleet, UNPACED_MESSAGES)]
+        results["runs"].append(run_step(workers, messages, duration, command))
+
+    # Against the first run, linear scaling from 1 worker means speedup == workers
+    first = results["runs"][0]["processed_per_s"] if results["runs"] else 0
+    for step in results["runs"]:
+        step["speedup"] = round(step["processed_per_s"] / first, 2) if first else 0
+    return results
@@ -0,0 +1,106 @@
+"""
+Websocket fan-out with viewport filtering: simulated clients spread over
+the Baltic at different zoom levels, fed the same vessel_update stream,
+comparing bytes and handler time with and without subscribe_bbox
+"""
+import asyncio
+import math
+import time
+
+import numpy as np
+
+from vessels.consumers import VesselConsumer
+from vessels.services import fastjson
+from vessels.services.broadcast import stamp
+from vessels.services.viewport import Viewport
+
+
+NEEDS_DB = False
+
+DEFAULTS = {"clients": 200, "vessels": 3000, "updates": 50, "batch": 300}
+
+
+def viewport_at(lng, lat, zoom, width_px=1400, height_px=900):
+    # Rough map bounds for a web mercator view centred on (lng, lat)
+    deg_per_px = 360 / (512 * 2 ** zoom)
+    half_w = width_px / 2 * deg_per_px
+    half_h = height_px / 2 * deg_per_px * math.cos(math.radians(lat))
+    return [lng - half_w, lat - half_h, lng + half_w, lat + half_h]
+
+
+def make_clients(rng, n_clients, bounds, subscribed):
+    clients = []
+    for _ in range(n_clients):
+        consumer = VesselConsumer()
+        consumer.sent = 0
+        consumer.viewport = None
+        consumer.binary = False
+
+        async def send(text_data=None, bytes_data=None, consumer=consumer):
+            consumer.sent += len(text_data or bytes_data)
+        consumer.send = send
+
+        if subscribed:
+            zoom = float(rng.choice([4, 6, 7, 8, 9, 10, 11, 12]))
+            lng = rng.uniform(bounds["min_lng"], bounds["max_lng"])
+            lat = rng.uniform(bounds["min_lat"], bounds["max_lat"])
+            consumer.viewport = Viewport.from_message({"bbox": viewport_at(lng, lat, zoom), "zoom": zoom})
+        clients.append(consumer)
+    return clients
+
+
+def make_updates(rng, n_vessels, n_updates, batch, bounds):
+    lats = rng.uniform(bounds["min_lat"], bounds["max_lat"], n_vessels)
+    lngs = rng.uniform(bounds["min_lng"], bounds["max_lng"], n_vessels)
+    updates = []
+    for seq in range(1, n_updates + 1):
+        ids = rng.choice(n_vessels, min(batch, n_vessels), replace=False)
+        # Encoded and stamped once, the way broadcast.send puts it on the group
+        body = fastjson.dumps({
+            "type": "vessel_update",
+            "vessels": [
+                {
+                    "id": int(i) + 1, "mmsi": str(230000000 + int(i)), "name": f"VESSEL {i}",
+                    "ship_type": "cargo", "weight_tonnage": 0.0,
+                    "latitude": float(lats[i]), "longitude": float(lngs[i]),
+                    "speed": 11.2, "heading": 184.0, "course": 183.5,
+                }
+                for i in ids
+            ],
+        })
+        updates.append({"type": "vessel_update", "seq": seq, "text": stamp(seq, body)})
+    return updates
+
+
+async def fan_out(clients, updates):
+    start = time.perf_counter()
+    for event in updates:
+        for consumer in clients:
+            await consumer.vessel_update(event)
+    return time.perf_counter() - start
+
+
+def run(options):
+    from django.conf import settings
+
+    n_clients = options.get("clients") or DEFAULTS["clients"]
+    n_vessels = options.get("vessels") or DEFAULTS["vessels"]
+    bounds = settings.BALTIC_BOUNDS
+    rng = np.random.default_rng(7)
+    n_updates = options.get("updates") or DEFAULTS["updates"]
+    batch = options.get("batch") or DEFAULTS["batch"]
+    updates = make_updates(rng, n_vessels, n_updates, batch, bounds)
+
+    results = {"clients": n_clients, "vessels": n_vessels, "updates": len(updates)}
+    for label, subscribed in (("everything", False), ("viewport", True)):
+        clients = make_clients(np.random.default_rng(11), n_clients, bounds, subscribed)
+        seconds = asyncio.run(fan_out(clients, updates))
+        sent = [c.sent for c in clients]
+        results[label] = {
+            "bytes_total": int(sum(sent)),
+            "bytes_per_client_p50": float(np.percentile(sent, 50)),
+            "bytes_per_client_max": int(max(sent)),
+            "handler_ms_per_update": seconds / len(updates) * 1000,
+        }
+    results["bytes_saved"] = 1 - results["viewport"]["bytes_total"] / results["everything"]["bytes_total"]
+    return results
@@ -0,0 +1,94 @@
+"""
+Zone containment throughput: the old per-point, per-zone shapely loop
+against the STRtree index and the vectorized containment matrix
+"""
+import json
+
+import numpy as np
+from shapely.geometry import Point, shape
+
+from vessels.benchmarks import timed
+from vessels.models import Zone
+from vessels.services.zone_index import ZoneIndex
+
+
+NEEDS_DB = False
+
+DEFAULTS = {"points": 10000, "zones": 200, "scalar_sample": 500}
+
+
+def random_zones(rng, count, bounds):
+    # Irregular polygons (8-16 sided) scattered over the Baltic
+    zones = []
+    for i in range(count):
+        center_lng = rng.uniform(bounds["min_lng"], bounds["max_lng"])
+        center_lat = rng.uniform(bounds["min_lat"], bounds["max_lat"])
+        sides = rng.integers(8, 17)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, sides))
+        radii = rng.uniform(0.2, 1.0, sides)
+        ring = [
+            [center_lng + r * np.cos(a) * 2, center_lat + r * np.sin(a)]
+            for a, r in zip(angles, radii)
+        ]
+        ring.append(ring[0])
+        zones.append(Zone(
+            id=i + 1,
+            name=f"Zone {i + 1}",
+            polygon_json=json.dumps({"type": "Polygon", "coordinates": [ring]}),
+        ))
+    return zones
+
+
+def run(options):
+    from django.conf import settings
+
+    n_points = options.get("points") or DEFAULTS["points"]
+    n_zones = options.get("zones") or DEFAULTS["zones"]
+    sample = min(n_points, DEFAULTS["scalar_sample"])
+    bounds = settings.BALTIC_BOUNDS
+    rng = np.random.default_rng(42)
+
+    zones = random_zones(rng, n_zones, bounds)
+    lngs = rng.uniform(bounds["min_lng"], bounds["max_lng"], n_points)
+    lats = rng.uniform(bounds["min_lat"], bounds["max_lat"], n_points)
+
+    index = ZoneIndex()
+    build_s, _ = timed(index.load, zones)
+
+    # Old path: parse every zone and test it for every point. Run on a
+    # sample because it takes forever, then scale up
+    def scalar():
+        result = []
+        for lng, lat in zip(lngs[:sample], lats[:sample]):
+            point = Point(lng, lat)
+            result.append({
+                z.id for z in zones if shape(json.loads(z.polygon_json)).contains(point)
+            })
+        return result
+    scalar_s, scalar_result = timed(scalar)
+    scalar_s *= n_points / sample
+
+    def per_point():
+        return [index.containing(lng, lat) for lng, lat in zip(lngs, lats)]
+    indexed_s, _ = timed(per_point, repeat=3)
+
+    matrix_s, matrix = timed(index.containment_matrix, lngs, lats, repeat=5)
+
+    # The matrix has to agree with the old loop wherever we ran it
+    matrix_result = [
+        {index.zones[col].id for col in np.flatnonzero(row)} for row in matrix[:sample]
+    ]
+    pairs = n_points * n_zones
+    return {
+        "points": n_points,
+        "zones": n_zones,
+        "index_build_ms": build_s * 1000,
+        "scalar_s_estimated": scalar_s,
+        "indexed_per_point_s": indexed_s,
+        "matrix_s": matrix_s,
+        "matrix_pairs_per_s": pairs / matrix_s,
+        "matrix_points_per_s": n_points / matrix_s,
+        "speedup_vs_scalar": scalar_s / matrix_s,
+        "memberships": int(matrix.sum()),
+        "matches_scalar": matrix_result == scalar_result,
+    }
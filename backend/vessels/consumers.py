@@ -1,8 +1,13 @@
-import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from asgiref.sync import sync_to_async
 
+from .services import fastjson, metrics
+from .services.binary_codec import SUBPROTOCOL, encode_frame
+from .services.fanout import event_memo
+from .services.viewport import Viewport
+
 
 class VesselConsumer(AsyncWebsocketConsumer):
     # websocket consumer that broadcasts vessel position updates
@@ -10,70 +15,142 @@ class VesselConsumer(AsyncWebsocketConsumer):
 
     async def connect(self):
         self.group_name = "vessel_updates"
+        # Only forward vessel updates inside this box, None = everything
+        self.viewport = None
+        # Clients asking for the binary subprotocol get vessel data as
+        # packed frames, everything else stays JSON
+        self.binary = SUBPROTOCOL in self.scope.get("subprotocols", [])
         await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
-        # Send initial vessel data on connect
-        vessels = await self.get_all_vessels()
-        await self.send(text_data=json.dumps({
-            "type": "initial_data",
-            "vessels": vessels,
-        }))
+        await self.accept(subprotocol=SUBPROTOCOL if self.binary else None)
+        self.counted = True
+        metrics.ws_connections.inc()
+
+        # A reconnecting client can pass ?since=<last seq> to skip the snapshot
+        since = parse_qs(self.scope.get("query_string", b"").decode()).get("since")
+        await self.resume(int(since[0]) if since and since[0].isdigit() else None)
 
     async def disconnect(self, close_code):
+        if getattr(self, "counted", False):
+            self.counted = False
+            metrics.ws_connections.dec()
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
+    async def send_counted(self, kind, text_data=None, bytes_data=None):
+        # send() plus the per-type frame and byte counters
+        metrics.ws_sent_messages.inc(type=kind)
+        metrics.ws_sent_bytes.inc(len(text_data if bytes_data is None else bytes_data), type=kind)
+        await self.send(text_data=text_data, bytes_data=bytes_data)
+
     async def receive(self, text_data):
         # Handle front end updates
-        data = json.loads(text_data)
+        data = fastjson.loads(text_data)
         msg_type = data.get("type")
 
         if msg_type == "ping":
-            await self.send(text_data=json.dumps({"type": "pong"}))
+            await self.send_counted("pong", text_data=fastjson.dumps({"type": "pong"}))
+        elif msg_type == "subscribe_bbox":
+            previous = self.viewport
+            try:
+                self.viewport = Viewport.from_message(data)
+            except (KeyError, TypeError, ValueError):
+                self.viewport = None
+            if self.viewport is not None or previous is not None:
+                await self.send_viewport_data()
+        elif msg_type == "unsubscribe_bbox":
+            if self.viewport is not None:
+                self.viewport = None
+                await self.send_viewport_data()
+        elif msg_type == "resume":
+            since = data.get("since")
+            await self.resume(since if isinstance(since, int) else None)
+
+    async def resume(self, since):
+        # Send whatever the client missed since `since`, or the snapshot plus
+        # what it is missing if we can't. Group messages queue up behind this
+        # handler, so clients only need to skip seqs they've already seen
+        deltas = await self.get_deltas(since) if since is not None else None
+        if deltas is None:
+            # Send initial vessel data, the same pre-encoded snapshot goes
+            # to every client
+            if self.binary:
+                data, seq = await self.get_binary_snapshot()
+                await self.send_counted("snapshot", bytes_data=data)
+            else:
+                text, seq = await self.get_snapshot()
+                await self.send_counted("snapshot", text_data=text)
+            deltas = await self.get_deltas(seq) or []
+        for text in deltas:
+            if self.binary:
+                data = fastjson.loads(text)
+                if data["type"] == "vessel_update":
+                    await self.send_counted("vessel_update", bytes_data=event_memo.frame(data["seq"], text))
+                    continue
+            await self.send_counted("resume", text_data=text)
+
+    async def send_viewport_data(self):
+        # Updates only cover vessels that move, the ones already sitting in
+        # a newly visible area come from the snapshot. It's a viewport_data
+        # message (JSON for binary clients too) at the snapshot's seq, which
+        # clients don't count as a broadcast; they keep rows they've had a
+        # newer update for
+        rows, seq = await self.get_snapshot_rows()
+        vessels = rows if self.viewport is None else self.viewport.filter(rows)
+        await self.send_counted("viewport_data", text_data=fastjson.dumps({
+            "type": "viewport_data",
+            "seq": seq,
+            "vessels": vessels,
+        }))
 
     async def vessel_update(self, event):
-        # Update vessels for all clients
-        await self.send(text_data=json.dumps({
+        # Update vessels for all clients, limited to what this one can see.
+        # Events carry the JSON already encoded, so the common case (text
+        # client, whole map) just forwards it
+        seq, text = event["seq"], event["text"]
+        if self.viewport is None:
+            if self.binary:
+                await self.send_counted("vessel_update", bytes_data=event_memo.frame(seq, text))
+            else:
+                await self.send_counted("vessel_update", text_data=text)
+            return
+
+        vessels = self.viewport.filter(event_memo.decoded(seq, text)["vessels"])
+        if not vessels:
+            return
+        if self.binary:
+            await self.send_counted("vessel_update", bytes_data=encode_frame("vessel_update", seq, vessels))
+            return
+        await self.send_counted("vessel_update", text_data=fastjson.dumps({
             "type": "vessel_update",
-            "vessels": event["vessels"],
+            "seq": seq,
+            "vessels": vessels,
         }))
 
-    async def zone_alert(self, event):
-        # Update zone alerts for all clients
-        await self.send(text_data=json.dumps({
-            "type": "zone_alert",
-            "alert": event["alert"],
-        }))
+    async def zone_alerts(self, event):
+        # A batch of zone alerts from one ingest flush, already encoded
+        await self.send_counted("zone_alerts", text_data=event["text"])
 
-    async def drone_update(self, event):
-        # Update drone for all clients
-        await self.send(text_data=json.dumps({
-            "type": "drone_update",
-            "drone": event["drone"],
-        }))
+    @database_sync_to_async
+    def get_snapshot(self):
+        from .services.snapshot import snapshot_cache
+        return snapshot_cache.get()
+
+    @database_sync_to_async
+    def get_snapshot_rows(self):
+        from .services.snapshot import snapshot_cache
+        return snapshot_cache.get_rows()
+
+    @database_sync_to_async
+    def get_binary_snapshot(self):
+        from .services.snapshot import snapshot_cache
+        return snapshot_cache.get_binary()
+
+    @sync_to_async
+    def get_deltas(self, since):
+        from .services.broadcast import deltas_since
+        return deltas_since(since)
 
     @database_sync_to_async
     def get_all_vessels(self):
-        from .models import Vessel
-        vessels = []
-        for v in Vessel.objects.all():
-            pos = v.positions.first()
-            vessel_data = {
-                "id": v.id,
-                "mmsi": v.mmsi,
-                "name": v.name,
-                "ship_type": v.ship_type,
-                "weight_tonnage": v.weight_tonnage,
-                "flag": v.flag,
-                "length": v.length,
-                "width": v.width,
-                "destination": v.destination,
-            }
-            if pos:
-                vessel_data["latitude"] = pos.latitude
-                vessel_data["longitude"] = pos.longitude
-                vessel_data["speed"] = pos.speed
-                vessel_data["heading"] = pos.heading
-                vessel_data["course"] = pos.course
-            vessels.append(vessel_data)
-        return vessels
+        from .services.snapshot import fleet_rows
+        return fleet_rows()
 
@@ -0,0 +1,67 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from vessels.benchmarks import DEFAULT_SUITES, SUITES, isolated_redis, load_suite
+
+
+def int_list(value):
+    # "1,2,4" -> [1, 2, 4]
+    return [int(part) for part in value.split(",")]
+
+
+def rate_list(value):
+    # "1000,5000,max" -> [1000, 5000, 0]
+    return [0 if part.strip() == "max" else int(part) for part in value.split(",")]
+
+
+class Command(BaseCommand):
+    help = "Run performance benchmark suites and print (or save) the results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("suites", nargs="*", help=f"Suites to run: {', '.join(SUITES)} (default: {', '.join(DEFAULT_SUITES)})")
+        parser.add_argument("--output", type=str, help="Write the results to this JSON file")
+        parser.add_argument("--points", type=int, help="Number of positions to test (zones suite)")
+        parser.add_argument("--zones", type=int, help="Number of zones to test against")
+        parser.add_argument("--vessels", type=int, help="Fleet size to seed or simulate")
+        parser.add_argument("--clients", type=int, help="Simulated websocket clients (viewports, fanout suites)")
+        parser.add_argument("--positions", type=int, help="Positions per seeded vessel (fleet suite)")
+        parser.add_argument("--rows", type=int, help="Synthetic position history size (export suite)")
+        parser.add_argument("--rates", type=rate_list,
+                            help="Comma separated feed rates in msg/s, 'max' for unpaced (ingest suite)")
+        parser.add_argument("--duration", type=float, help="Seconds per run (ingest, sharding suites)")
+        parser.add_argument("--workers", type=int_list, help="Comma separated worker counts (sharding suite)")
+
+    def handle(self, *args, **options):
+        names = options["suites"] or DEFAULT_SUITES
+        unknown = [name for name in names if name not in SUITES]
+        if unknown:
+            raise CommandError(f"Unknown suite(s): {', '.join(unknown)}")
+
+        results = {}
+        for name in names:
+            suite = load_suite(name)
+            self.stdout.write(f"Running {name}...")
+            if suite.NEEDS_DB:
+                results[name] = self.run_with_test_db(suite, options)
+            else:
+                results[name] = suite.run(options)
+            self.stdout.write(json.dumps(results[name], indent=2))
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run_with_test_db(self, suite, options):
+        # Suites that need rows get a throwaway database so they never
+        # write synthetic vessels into the real one, and a scratch Redis
+        # so what they broadcast never reaches live clients
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with isolated_redis():
+                return suite.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -4,24 +4,38 @@ You have to run it as a django management command
 
 """
 import json
+import time
 import asyncio
+from datetime import datetime, timezone as dt_timezone
+import redis
 import websockets
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from vessels.models import Vessel, VesselPosition
-from vessels.services.zone_checker import check_vessel_zones
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.db import IntegrityError, connection, transaction
+from vessels.models import Vessel, VesselPosition, VesselLatestPosition
+from vessels.services.zone_checker import check_vessel_zones, check_vessel_zones_batch
+from vessels.services.vessel_cache import VesselCache
+from vessels.services.zone_membership import rebuild_store
+from vessels.services.snapshot import SnapshotPublisher
+from vessels.services.broadcast import current_seq, send_vessel_update
+from vessels.services.coalescer import UpdateCoalescer
+from vessels.services.retention import format_report, prune_positions
+from vessels.services import fastjson, metrics
+from vessels.services.ingest_workers import SnapshotForwarder, WorkerPool
+from vessels.services.ingest_stream import StreamSource, open_static_relay, open_stream_buffer, streams_for
 
 
-AIS_WS_URL = "wss://stream.aisstream.io/v0/stream"
-
 # Baltic Sea bounding box, AIS uses [[lat, lng], [lat, lng]] for some reason
 BALTIC_BBOX = [
     [settings.BALTIC_BOUNDS["min_lat"], settings.BALTIC_BOUNDS["min_lng"]],
     [settings.BALTIC_BOUNDS["max_lat"], settings.BALTIC_BOUNDS["max_lng"]],
 ]
 
+# How far before a replayed batch was queued to look for rows it already
+# wrote, the reader and processors may not share a clock
+REPLAY_SKEW_S = 60
+
 # AIS Ship Type mapping
 SHIP_TYPE_MAP = {
     range(70, 80): "cargo",
@@ -41,9 +55,113 @@ def get_ship_type(ais_type):
     return "other"
 
 
+# MMSI -> vessel identity, shared by every message this process handles
+vessel_cache = VesselCache(max_size=settings.VESSEL_CACHE_SIZE)
+
+# Whole-fleet state behind the snapshot new websocket clients get
+snapshot_publisher = SnapshotPublisher()
+
+# Batches vessel_update rows per tick and drops ones that barely moved
+coalescer = UpdateCoalescer(send_vessel_update)
+
+
+def parse_position(msg, mmsi, metadata):
+    # Pull the fields we care about out of a PositionReport, None if unusable
+    report = msg.get("Message", {}).get("PositionReport", {})
+    if not report:
+        return None
+
+    lat = metadata.get("latitude", report.get("Latitude"))
+    lng = metadata.get("longitude", report.get("Longitude"))
+    if lat is None or lng is None:
+        return None
+
+    raw_heading = report.get("TrueHeading", 511)
+    cog = report.get("Cog", 0)
+    # AIS heading 511 = "not available"
+    heading = cog if raw_heading == 511 else raw_heading
+
+    return {
+        "mmsi": mmsi,
+        "name": metadata.get("ShipName", f"Vessel {mmsi}").strip(),
+        "ship_type": get_ship_type(report.get("Type", 0)),
+        "latitude": lat,
+        "longitude": lng,
+        "speed": report.get("Sog", 0),
+        "heading": heading,
+        "course": cog,
+    }
+
+
+def vessel_payload(vessel, p):
+    # What the frontend gets for one vessel in a vessel_update
+    return {
+        "id": vessel.id,
+        "mmsi": vessel.mmsi,
+        "name": vessel.name,
+        "ship_type": vessel.ship_type,
+        "weight_tonnage": vessel.weight_tonnage,
+        "latitude": p["latitude"],
+        "longitude": p["longitude"],
+        "speed": p["speed"],
+        "heading": p["heading"],
+        "course": p["course"],
+    }
+
+
+class BatchStats:
+    # Batch size and queue lag numbers, reported every REPORT_EVERY seconds
+
+    REPORT_EVERY = 30
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.batches = 0
+        self.messages = 0
+        self.max_batch = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    def record(self, size, lag):
+        self.batches += 1
+        self.messages += size
+        self.max_batch = max(self.max_batch, size)
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def due(self):
+        return time.monotonic() - self.started >= self.REPORT_EVERY
+
+    def report(self, queued, queue_size, cache, coalescer):
+        elapsed = time.monotonic() - self.started
+        avg_batch = self.messages / self.batches if self.batches else 0
+        avg_lag = self.total_lag / self.batches if self.batches else 0
+        line = (
+            f"Ingest: {self.messages} msgs in {self.batches} batches over {elapsed:.0f}s "
+            f"({self.messages / elapsed:.0f} msg/s), batch avg {avg_batch:.0f} max {self.max_batch}, "
+            f"lag avg {avg_lag * 1000:.0f}ms max {self.max_lag * 1000:.0f}ms, "
+            f"queue {queued}/{queue_size}, "
+            f"vessel cache {cache.hit_rate:.1%} hits ({len(cache)} cached), "
+            f"broadcast {coalescer.sent_rows}/{coalescer.offered} rows sent in "
+            f"{coalescer.sent_messages} msgs ({coalescer.suppressed} suppressed, {coalescer.merged} merged)"
+        )
+        coalescer.reset_stats()
+        self.reset()
+        return line
+
+
 class Command(BaseCommand):
     help = "Run the AIS data ingestion service from aisstream.io"
 
+    # Per-message lines ("Updated static data") only at -v 2
+    verbosity = 1
+    # Where broadcast rows and static data go, a SnapshotForwarder in workers
+    # and a StaticRelay in stream processors
+    snapshot = snapshot_publisher
+
     def add_arguments(self, parser):
         parser.add_argument(
             "--api-key",
@@ -51,10 +169,74 @@ class Command(BaseCommand):
             default=settings.AIS_API_KEY,
             help="aisstream.io API key",
         )
+        parser.add_argument(
+            "--url",
+            type=str,
+            default=settings.AIS_SIMULATOR_URL if settings.AIS_USE_SIMULATOR else settings.AIS_WS_URL,
+            help="Feed to read: aisstream.io, or a simulate_ais/replay server (default follows AIS_USE_SIMULATOR)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.AIS_BATCH_SIZE,
+            help="Flush a batch once this many messages are queued",
+        )
+        parser.add_argument(
+            "--flush-ms",
+            type=int,
+            default=settings.AIS_BATCH_INTERVAL_MS,
+            help="Flush a batch after this many milliseconds, even if it isn't full",
+        )
+        parser.add_argument(
+            "--queue-size",
+            type=int,
+            default=settings.AIS_QUEUE_SIZE,
+            help="Max queued messages before the reader stops pulling from the feed",
+        )
+        parser.add_argument(
+            "--no-batch",
+            action="store_true",
+            help="Process every message on its own (the old, slow path)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.AIS_WORKERS,
+            help="Worker processes to shard messages over by MMSI (1 = do it all in this process, "
+                 "with --buffer stream 0 = leave the streams to --consume processes)",
+        )
+        parser.add_argument(
+            "--buffer",
+            choices=["queue", "stream"],
+            default=settings.AIS_BUFFER,
+            help="Hand messages to processing in memory, or through durable Redis Streams",
+        )
+        parser.add_argument(
+            "--consume",
+            action="store_true",
+            help="Don't read the feed, process the Redis Streams a stream mode reader fills",
+        )
+        parser.add_argument(
+            "--shard",
+            type=int,
+            default=0,
+            help="With --consume: which processor this is, 0 to --shards - 1",
+        )
+        parser.add_argument(
+            "--shards",
+            type=int,
+            default=1,
+            help="With --consume: how many processors split the streams between them",
+        )
 
     def handle(self, *args, **options):
         api_key = options["api_key"]
-        if not api_key:
+        self.url = options["url"]
+        self.verbosity = options["verbosity"]
+        if options["consume"]:
+            return self.consume(options)
+        # The offline stand-ins take any key
+        if not api_key and self.url == settings.AIS_WS_URL:
             self.stderr.write(
                 self.style.ERROR(
                     "No AIS API key provided. Set AIS_API_KEY env var or pass --api-key."
@@ -62,33 +244,120 @@ class Command(BaseCommand):
             )
             return
 
-        self.stdout.write(self.style.SUCCESS("Starting AIS ingestion for the Baltic Sea..."))
+        self.stdout.write(self.style.SUCCESS(f"Starting AIS ingestion for the Baltic Sea from {self.url}..."))
         self.stdout.write(f"Baltic box: {BALTIC_BBOX}")
 
+        self.batch_size = max(1, options["batch_size"])
+        self.flush_interval = max(1, options["flush_ms"]) / 1000
+        self.queue_size = max(self.batch_size, options["queue_size"])
+        self.batching = not options["no_batch"]
+        self.stats = BatchStats()
+
+        self.buffer = None
+        self.relay = None
+        if options["buffer"] == "stream":
+            # Processing can all be left to --consume processes then
+            self.workers = max(0, options["workers"])
+            self.buffer = open_stream_buffer()
+            self.relay = open_static_relay()
+            try:
+                self.buffer.setup()
+            except (redis.RedisError, ImproperlyConfigured) as e:
+                self.stderr.write(self.style.ERROR(f"Can't set up the AIS streams: {e}"))
+                return
+        else:
+            self.workers = max(1, options["workers"])
+        metrics.set_role("ingest")
+
+        warmed = vessel_cache.warm()
+        self.stdout.write(f"Vessel cache warmed with {warmed} vessels")
+        inside = rebuild_store()
+        self.stdout.write(f"Zone membership rebuilt, {inside} vessels inside zones")
+        fleet = self.snapshot.warm()
+        self.stdout.write(f"Snapshot published with {fleet} vessels")
+
+        self.pool = None
+        # Streams are always read by worker processes, even just the one
+        if self.workers > 1 or (self.buffer is not None and self.workers > 0):
+            if self.workers > 1 and connection.vendor == "sqlite":
+                self.stderr.write(self.style.WARNING(
+                    "SQLite takes one writer at a time, workers will mostly wait on each other"
+                ))
+            if self.buffer is None:
+                self.snapshot.track_shards(self.workers)
+            self.pool = WorkerPool(
+                self.workers, self.batch_size, self.flush_interval, self.queue_size,
+                on_rows=self.snapshot.update,
+                options={"verbosity": self.verbosity, "stream": self.buffer is not None},
+            )
+            self.pool.start()
+            source = f"{self.buffer.shards} Redis Streams" if self.buffer is not None else "the reader"
+            self.stdout.write(f"Started {self.workers} ingest workers, sharded by MMSI, reading from {source}")
+        elif self.buffer is not None:
+            self.stdout.write(f"Filling {self.buffer.shards} Redis Streams, processing is up to ingest_ais --consume")
+
         try:
             asyncio.run(self.stream_ais(api_key))
         except KeyboardInterrupt:
             self.stdout.write("\nAIS ingestion stopped.")
+        finally:
+            if self.pool is not None:
+                self.pool.stop()
 
     async def stream_ais(self, api_key):
         # Connect to AIS and stream messages babyyyy
         subscribe_msg = json.dumps({
-            "APIKey": api_key,
+            "APIKey": api_key or "offline",
             "BoundingBoxes": [BALTIC_BBOX],
             "FilterMessageTypes": ["PositionReport", "ShipStaticData"],
         })
 
+        # The queue outlives reconnects so nothing already read gets dropped
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        if self.buffer is not None:
+            # This process only reads the feed onto the streams
+            asyncio.create_task(self.append_loop(queue))
+            asyncio.create_task(self.supervise())
+        elif self.pool is not None:
+            # Workers do the flushing and broadcasting, this process just
+            # reads, dispatches and publishes the snapshot
+            asyncio.create_task(self.pool.flush_loop())
+            asyncio.create_task(self.supervise())
+        elif self.batching:
+            asyncio.create_task(self.flush_loop(queue))
+        if self.pool is None and self.buffer is None and coalescer.tick > 0:
+            asyncio.create_task(self.broadcast_loop())
+        if settings.POSITION_PRUNE_INTERVAL_S > 0:
+            asyncio.create_task(self.retention_loop())
+        if settings.METRICS_PUSH_S > 0:
+            asyncio.create_task(self.metrics_loop())
+
         while True:
             try:
-                async with websockets.connect(AIS_WS_URL) as ws:
+                async with websockets.connect(self.url) as ws:
                     await ws.send(subscribe_msg)
-                    self.stdout.write("Connected to aisstream.io")
+                    self.stdout.write(f"Connected to {self.url}")
 
                     async for raw_msg in ws:
                         try:
-                            msg = json.loads(raw_msg)
-                            await asyncio.to_thread(self.process_message, msg)
+                            msg = fastjson.loads(raw_msg)
+                            metrics.messages_received.inc(type=msg.get("MessageType", "unknown"))
+                            if self.buffer is not None or self.pool is not None:
+                                # Workers parse it again, a string is far
+                                # cheaper to pass between processes than a dict
+                                mmsi = msg.get("MetaData", {}).get("MMSI", "")
+                                if self.buffer is not None:
+                                    await queue.put((mmsi, raw_msg))
+                                else:
+                                    await self.pool.put(mmsi, time.monotonic(), raw_msg)
+                            elif self.batching:
+                                # Blocks while the queue is full, so we stop
+                                # reading the socket instead of growing memory
+                                await queue.put((time.monotonic(), msg))
+                            else:
+                                await asyncio.to_thread(self.process_message, msg)
                         except json.JSONDecodeError:
+                            metrics.messages_dropped.inc(type="unknown", reason="bad_json")
                             continue
                         except Exception as e:
                             self.stderr.write(f"Error processing message: {e}")
@@ -100,6 +369,337 @@ class Command(BaseCommand):
                 self.stderr.write(f"Unexpected error: {e}. Reconnecting in 10s...")
                 await asyncio.sleep(10)
 
+    async def flush_loop(self, queue):
+        # Collect messages for up to flush_interval or batch_size, whichever
+        # comes first, then process them together off the event loop
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            lag = time.monotonic() - batch[0][0]
+            metrics.queue_lag.observe(lag)
+            metrics.batch_size.observe(len(batch))
+            metrics.queue_depth.set(queue.qsize())
+            try:
+                await asyncio.to_thread(self.process_batch, [msg for _, msg in batch])
+            except Exception as e:
+                metrics.messages_dropped.inc(len(batch), type="batch", reason="error")
+                self.stderr.write(f"Error processing batch of {len(batch)}: {e}")
+
+            self.stats.record(len(batch), lag)
+            if self.stats.due():
+                self.stdout.write(self.stats.report(queue.qsize(), self.queue_size, vessel_cache, coalescer))
+
+    async def append_loop(self, queue):
+        # Move whatever the reader queued onto the streams, one pipeline per
+        # batch. While Redis is down the batch is retried and the queue
+        # fills up, which stops the reader just like a slow flush would
+        while True:
+            items = [await queue.get()]
+            while len(items) < self.batch_size and not queue.empty():
+                items.append(queue.get_nowait())
+            metrics.queue_depth.set(queue.qsize())
+            while True:
+                try:
+                    await asyncio.to_thread(self.buffer.append, items)
+                    break
+                except redis.RedisError as e:
+                    self.stderr.write(f"Error appending to the AIS streams: {e}. Retrying in 1s...")
+                    await asyncio.sleep(1)
+
+    def consume(self, options):
+        # A stream processor on its own (--consume --shard K --shards N), no
+        # feed and no reader to answer to, so it can be started, stopped
+        # and scaled separately. Stop the old set before starting a set
+        # with a different --shards, or two will read the same streams
+        shard, processors = options["shard"], max(1, options["shards"])
+        if not 0 <= shard < processors:
+            self.stderr.write(self.style.ERROR(f"--shard has to be 0 to {processors - 1}"))
+            return
+        buffer = open_stream_buffer()
+        try:
+            buffer.setup()
+        except (redis.RedisError, ImproperlyConfigured) as e:
+            self.stderr.write(self.style.ERROR(f"Can't set up the AIS streams: {e}"))
+            return
+        streams = streams_for(shard, processors, buffer.shards)
+        if not streams:
+            self.stderr.write(self.style.ERROR(
+                f"Only {buffer.shards} streams to go round, more processors than that would sit idle"
+            ))
+            return
+
+        self.batch_size = max(1, options["batch_size"])
+        self.queue_size = settings.AIS_STREAM_MAXLEN
+        self.stdout.write(self.style.SUCCESS(
+            f"Processing AIS streams {streams} as processor {shard} of {processors}"
+        ))
+        try:
+            self.run_worker(shard, StreamSource(buffer, streams, self.batch_size), snapshot=open_static_relay())
+        except KeyboardInterrupt:
+            self.stdout.write("\nAIS processing stopped.")
+
+    def stream_lag(self):
+        lags = [self.buffer.lag(shard) for shard in range(self.buffer.shards)]
+        for shard, lag in enumerate(lags):
+            metrics.stream_lag.set(lag["lag"], shard=shard)
+            metrics.stream_pending.set(lag["pending"], shard=shard)
+            metrics.stream_age.set(lag["age_s"], shard=shard)
+        return lags
+
+    def follow_streams(self):
+        # Stream processors don't hand rows back, the snapshot catches up on
+        # what they broadcast and the static data they relayed
+        self.snapshot.update(self.relay.drain())
+        self.snapshot.follow()
+
+    async def supervise(self):
+        # Restart workers that died, publish the snapshot the workers feed,
+        # and report how the shards are keeping up
+        reported_at = time.monotonic()
+        while True:
+            await asyncio.sleep(1)
+            if self.pool is not None:
+                for shard, exitcode in self.pool.check():
+                    self.stderr.write(f"Ingest worker {shard} exited ({exitcode}), restarted")
+            try:
+                if self.relay is not None:
+                    await asyncio.to_thread(self.follow_streams)
+                await asyncio.to_thread(self.snapshot.maybe_publish)
+            except Exception as e:
+                self.stderr.write(f"Error publishing snapshot: {e}")
+            lags = None
+            if self.buffer is not None:
+                try:
+                    lags = await asyncio.to_thread(self.stream_lag)
+                except redis.RedisError as e:
+                    self.stderr.write(f"Error reading AIS stream lag: {e}")
+            if time.monotonic() - reported_at >= BatchStats.REPORT_EVERY:
+                reported_at = time.monotonic()
+                if lags is not None:
+                    line = (
+                        f"Streams: lag {[lag['lag'] for lag in lags]}, pending {[lag['pending'] for lag in lags]}, "
+                        f"oldest unread {max(lag['age_s'] for lag in lags):.1f}s"
+                    )
+                    if self.pool is not None:
+                        line += (
+                            f", {sum(self.pool.processed)} processed, {sum(self.pool.failed)} failed, "
+                            f"{self.pool.restarts} restarts"
+                        )
+                    self.stdout.write(line)
+                elif self.buffer is None:
+                    self.stdout.write(
+                        f"Dispatch: {sum(self.pool.dispatched)} msgs to {self.workers} workers, "
+                        f"backlog {self.pool.backlog()}, {sum(self.pool.failed)} failed, {self.pool.restarts} restarts"
+                    )
+
+    def run_worker(self, shard, source, results=None, parent=None, snapshot=None):
+        # One shard's share of the feed in batches, from the reader (an
+        # InboxSource) or its streams (a StreamSource). Same processing as the
+        # single process mode, run synchronously. Stops on a None from the
+        # reader, or when the reader is gone. Without results (--consume)
+        # there's no reader to report to
+        self.snapshot = snapshot or SnapshotForwarder(results, shard)
+        self.stats = BatchStats()
+        metrics.set_role("ingest")
+        vessel_cache.warm()
+        rebuild_store(source.owns)
+        if results is not None:
+            results.put(("ready", shard))
+
+        tick = coalescer.tick
+        # Without a tick updates go out as batches are processed, the seq
+        # floor still has to move when this shard is idle
+        interval = tick if tick > 0 else 1.0
+        next_tick = time.monotonic() + interval
+        next_push = time.monotonic() + settings.METRICS_PUSH_S
+        while parent is None or parent.is_alive():
+            wait = min(max(0.0, next_tick - time.monotonic()), 1.0)
+            batch = source.get(wait)
+            if batch is None:
+                break
+
+            if batch:
+                lag = time.monotonic() - batch[0][0]
+                error = None
+                try:
+                    self.process_batch([fastjson.loads(raw) for _, raw in batch], source.replay_since)
+                except Exception as e:
+                    error = e
+                if not source.done(error is None):
+                    self.stderr.write(f"[worker {shard}] Error processing batch of {len(batch)}: {error}. Retrying...")
+                    continue
+                failed = 0
+                if error is not None:
+                    failed = len(batch)
+                    metrics.messages_dropped.inc(len(batch), type="batch", reason="error")
+                    self.stderr.write(f"[worker {shard}] Error processing batch of {len(batch)}: {error}")
+                metrics.queue_lag.observe(lag)
+                metrics.batch_size.observe(len(batch))
+                if results is not None:
+                    results.put(("processed", shard, len(batch), failed))
+                self.stats.record(len(batch), lag)
+                if self.stats.due():
+                    self.stdout.write(f"[worker {shard}] " + self.stats.report(source.backlog(), self.queue_size, vessel_cache, coalescer))
+
+            now = time.monotonic()
+            if now >= next_tick:
+                try:
+                    if tick > 0:
+                        self.flush_updates()
+                    # Nothing of ours is in flight now, whatever this shard
+                    # sends next is above the counter (SnapshotPublisher.track_shards)
+                    self.snapshot.update([], current_seq())
+                except Exception as e:
+                    self.stderr.write(f"[worker {shard}] Error broadcasting updates: {e}")
+                next_tick = now + interval
+            if settings.METRICS_PUSH_S > 0 and now >= next_push:
+                metrics.push()
+                next_push = now + settings.METRICS_PUSH_S
+        self.flush_updates()
+
+    async def broadcast_loop(self):
+        # Send whatever the coalescer collected, once per tick
+        while True:
+            await asyncio.sleep(coalescer.tick)
+            try:
+                await asyncio.to_thread(self.flush_updates)
+            except Exception as e:
+                self.stderr.write(f"Error broadcasting updates: {e}")
+
+    async def retention_loop(self):
+        # Trim position history in the background, it deletes in small
+        # chunks so the flushes keep going while it runs
+        while True:
+            await asyncio.sleep(settings.POSITION_PRUNE_INTERVAL_S)
+            try:
+                report = await asyncio.to_thread(prune_positions)
+                self.stdout.write(format_report(report))
+            except Exception as e:
+                self.stderr.write(f"Error pruning positions: {e}")
+
+    async def metrics_loop(self):
+        # Hand our counters to whichever web process gets scraped
+        while True:
+            await asyncio.sleep(settings.METRICS_PUSH_S)
+            await asyncio.to_thread(metrics.push)
+
+    def flush_updates(self):
+        self.after_broadcast(coalescer.flush())
+        self.snapshot.maybe_publish()
+
+    def publish_updates(self, rows):
+        self.after_broadcast(coalescer.offer(rows))
+
+    def after_broadcast(self, sent):
+        # The snapshot only takes rows clients actually got, with their seq
+        if sent:
+            rows, seq = sent
+            self.snapshot.update(rows, seq)
+
+    @metrics.stage_seconds.time(stage="process_batch")
+    def process_batch(self, msgs, replay_since=None):
+        # Process a flush worth of AIS messages with a handful of queries.
+        # replay_since (a wall clock time) means the batch may have been
+        # processed before, from about then on
+        positions = []
+        for msg in msgs:
+            msg_type = msg.get("MessageType")
+            metadata = msg.get("MetaData", {})
+            mmsi = str(metadata.get("MMSI", ""))
+            if not mmsi:
+                metrics.messages_dropped.inc(type=msg_type, reason="no_mmsi")
+                continue
+
+            if msg_type == "PositionReport":
+                position = parse_position(msg, mmsi, metadata)
+                if position:
+                    positions.append(position)
+                else:
+                    metrics.messages_dropped.inc(type=msg_type, reason="no_position")
+            elif msg_type == "ShipStaticData":
+                self.handle_static_data(msg, mmsi, metadata)
+            else:
+                metrics.messages_dropped.inc(type=msg_type, reason="unhandled_type")
+
+        if positions:
+            self.handle_position_batch(positions, replay_since)
+        self.snapshot.maybe_publish()
+
+    @metrics.stage_seconds.time(stage="handle_position")
+    def handle_position_batch(self, positions, replay_since=None):
+        # Resolve every vessel in the batch from the cache, the ones it
+        # doesn't know are looked up (or created) in bulk
+        wanted = {p["mmsi"]: (p["name"], p["ship_type"]) for p in positions}
+        vessels = vessel_cache.resolve_many(wanted)
+        new = positions
+        if replay_since is not None:
+            new = self.unsaved_positions(vessels, positions, replay_since)
+        try:
+            self.save_positions(vessels, new)
+        except IntegrityError:
+            # A cached vessel was deleted under us. Forget the ones that are
+            # gone, they get looked up (or created) again, and retry once
+            if not vessel_cache.drop_missing(vessels.values()):
+                raise
+            vessels = vessel_cache.resolve_many(wanted)
+            self.save_positions(vessels, new)
+
+        # Check zone interactions for the whole batch
+        check_vessel_zones_batch(
+            [vessels[p["mmsi"]] for p in positions],
+            [p["latitude"] for p in positions],
+            [p["longitude"] for p in positions],
+        )
+
+        # One broadcast for the whole batch, only the latest report per vessel
+        updates = {}
+        for p in positions:
+            vessel = vessels[p["mmsi"]]
+            updates[vessel.id] = vessel_payload(vessel, p)
+
+        self.publish_updates(list(updates.values()))
+
+    def unsaved_positions(self, vessels, positions, since):
+        # The positions of a replayed batch that aren't stored yet. A stored
+        # row with the same vessel and numbers written since then is taken
+        # to be this report, a vessel sending the exact same report twice
+        # in that window just loses the copy
+        fields = ("latitude", "longitude", "speed", "heading", "course")
+        stored = set(VesselPosition.objects.filter(
+            vessel_id__in={vessel.id for vessel in vessels.values()},
+            timestamp__gte=datetime.fromtimestamp(since - REPLAY_SKEW_S, tz=dt_timezone.utc),
+        ).values_list("vessel_id", *fields))
+        return [p for p in positions if (vessels[p["mmsi"]].id, *(p[f] for f in fields)) not in stored]
+
+    def save_positions(self, vessels, positions):
+        # In a savepoint so a failed insert can be retried inside a transaction
+        if not positions:
+            return []
+        with transaction.atomic():
+            created = VesselPosition.objects.bulk_create([
+                VesselPosition(
+                    vessel_id=vessels[p["mmsi"]].id,
+                    latitude=p["latitude"],
+                    longitude=p["longitude"],
+                    speed=p["speed"],
+                    heading=p["heading"],
+                    course=p["course"],
+                )
+                for p in positions
+            ])
+            VesselLatestPosition.upsert(created)
+        return created
+
     def process_message(self, msg):
         # Process an AIS message and update the database
         msg_type = msg.get("MessageType")
@@ -107,78 +707,51 @@ class Command(BaseCommand):
         mmsi = str(metadata.get("MMSI", ""))
 
         if not mmsi:
+            metrics.messages_dropped.inc(type=msg_type, reason="no_mmsi")
             return
 
         if msg_type == "PositionReport":
             self.handle_position(msg, mmsi, metadata)
         elif msg_type == "ShipStaticData":
             self.handle_static_data(msg, mmsi, metadata)
+        else:
+            metrics.messages_dropped.inc(type=msg_type, reason="unhandled_type")
 
+    @metrics.stage_seconds.time(stage="handle_position")
     def handle_position(self, msg, mmsi, metadata):
         # Handle a position report message
-        report = msg.get("Message", {}).get("PositionReport", {})
-        if not report:
+        p = parse_position(msg, mmsi, metadata)
+        if not p:
+            metrics.messages_dropped.inc(type="PositionReport", reason="no_position")
             return
 
-        lat = metadata.get("latitude", report.get("Latitude"))
-        lng = metadata.get("longitude", report.get("Longitude"))
-        if lat is None or lng is None:
-            return
-
-        vessel, created = Vessel.objects.get_or_create(
-            mmsi=mmsi,
-            defaults={
-                "name": metadata.get("ShipName", f"Vessel {mmsi}").strip(),
-                "ship_type": get_ship_type(report.get("Type", 0)),
-            }
-        )
-
-        raw_heading = report.get("TrueHeading", 511)
-        cog = report.get("Cog", 0)
-        # AIS heading 511 = "not available"
-        heading = cog if raw_heading == 511 else raw_heading
-
-        pos = VesselPosition.objects.create(
-            vessel=vessel,
-            latitude=lat,
-            longitude=lng,
-            speed=report.get("Sog", 0),
-            heading=heading,
-            course=cog,
-        )
+        vessel = vessel_cache.resolve(mmsi, p["name"], p["ship_type"])
+        try:
+            self.save_positions({mmsi: vessel}, [p])
+        except IntegrityError:
+            if not vessel_cache.drop_missing([vessel]):
+                raise
+            vessel = vessel_cache.resolve(mmsi, p["name"], p["ship_type"])
+            self.save_positions({mmsi: vessel}, [p])
 
         # Check zone interactions
-        check_vessel_zones(vessel, lat, lng)
+        check_vessel_zones(vessel, p["latitude"], p["longitude"])
 
         # Broadcast update via WebSocket
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            "vessel_updates",
-            {
-                "type": "vessel_update",
-                "vessels": [{
-                    "id": vessel.id,
-                    "mmsi": vessel.mmsi,
-                    "name": vessel.name,
-                    "ship_type": vessel.ship_type,
-                    "weight_tonnage": vessel.weight_tonnage,
-                    "latitude": lat,
-                    "longitude": lng,
-                    "speed": report.get("Sog", 0),
-                    "heading": heading,
-                    "course": cog,
-                }],
-            }
-        )
+        self.publish_updates([vessel_payload(vessel, p)])
+        self.snapshot.maybe_publish()
 
+    @metrics.stage_seconds.time(stage="handle_static_data")
     def handle_static_data(self, msg, mmsi, metadata):
         # Handle ship data
         static = msg.get("Message", {}).get("ShipStaticData", {})
         if not static:
+            metrics.messages_dropped.inc(type="ShipStaticData", reason="empty")
             return
 
         name = static.get("Name", metadata.get("ShipName", "")).strip()
         if not name:
+            metrics.messages_dropped.inc(type="ShipStaticData", reason="no_name")
             return
 
         dim = static.get("Dimension", {})
@@ -194,9 +767,14 @@ class Command(BaseCommand):
             "flag": metadata.get("country", ""),
         }
 
-        Vessel.objects.update_or_create(
+        vessel, _ = Vessel.objects.update_or_create(
             mmsi=mmsi,
             defaults=defaults,
         )
-        self.stdout.write(f"  Updated static data: {name}")
+        # Keep the cached name/type and the snapshot in step with what we just saved
+        vessel_cache.put(vessel)
+        self.snapshot.update([{"id": vessel.id, **defaults}])
+        coalescer.forget(vessel.id)
+        if self.verbosity > 1:
+            self.stdout.write(f"  Updated static data: {name}")
 
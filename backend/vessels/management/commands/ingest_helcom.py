@@ -1,12 +1,17 @@
-import csv
 import os
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from vessels.models import Port
+from vessels.services.helcom import build_ports, read_sites, sync_ports
+from vessels.services.http_cache import invalidate
 
 class Command(BaseCommand):
     help = "Ingest Baltic Sea Port data from local CSV (HELCOM Open Data)"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--cluster-km", type=float, default=settings.PORT_CLUSTER_KM,
+                            help="Sites of the same port code closer than this become one port")
+
     def handle(self, *args, **options):
         self.stdout.write("Starting HELCOM port ingestion from CSV...")
         
@@ -16,64 +21,23 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f"CSV file not found at {csv_path}"))
             return
 
-        # There are lots of smaller measurements 
-        # So by taking the geographic average of ones close to each other
-        # It just declutters the map and gives one real port from the 
-        # Helcome data
-        bounds = settings.BALTIC_BOUNDS
-        grouped_ports = {}
-
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f, delimiter=';')
-            for row in reader:
-                try:
-                    name = row["Port name"].strip()
-                    country = row["Port country"].strip()
-                    locode = row["Port code"].strip()
-                    
-                    lat = float(row["Latitude"])
-                    lng = float(row["Longitude"])
-                    
-                    if locode not in grouped_ports:
-                        grouped_ports[locode] = {
-                            "name": name,
-                            "country": country,
-                            "lats": [],
-                            "lngs": []
-                        }
-                    
-                    grouped_ports[locode]["lats"].append(lat)
-                    grouped_ports[locode]["lngs"].append(lng)
-                except Exception as e:
-                    self.stdout.write(self.style.WARNING(f"Failed to parse row: {row} - {e}"))
-
-        self.stdout.write(f"Parsed {len(grouped_ports)} unique ports from CSV. Proceeding to filter and save...")
-
-        # Clear existing ports
-        Port.objects.all().delete()
-        
-        ports_added = 0
-        
-        for locode, data in grouped_ports.items():
-            avg_lat = sum(data["lats"]) / len(data["lats"])
-            avg_lng = sum(data["lngs"]) / len(data["lngs"])
-            
-            # Filter out ports outside the Baltics
-            if not (bounds["min_lat"] <= avg_lat <= bounds["max_lat"] and bounds["min_lng"] <= avg_lng <= bounds["max_lng"]):
-                continue
-
-            helcom_id = f"HELCOM-{locode.replace(' ', '_')}"
-
-            Port.objects.create(
-                helcom_id=helcom_id,
-                name=data["name"],
-                country=data["country"],
-                latitude=avg_lat,
-                longitude=avg_lng,
-                locode=locode,
-            )
-            ports_added += 1
-
-        self.stdout.write(self.style.SUCCESS(f"Successfully ingrained {ports_added} localized Baltic ports into the database."))
+        # There are lots of smaller measurements per port, so sites of the
+        # same port that are close to each other are averaged into one. It
+        # declutters the map and gives one real port from the Helcom data
+        def bad_row(row, e):
+            self.stdout.write(self.style.WARNING(f"Failed to parse row: {row} - {e}"))
+
+        sites = read_sites(csv_path, on_error=bad_row)
+        ports = build_ports(sites, options["cluster_km"], settings.BALTIC_BOUNDS)
+        self.stdout.write(f"Clustered {len(ports)} Baltic ports from CSV. Syncing...")
+
+        result = sync_ports(ports)
+        if result["created"] or result["updated"] or result["deleted"]:
+            # Cached /api/ports/ responses are stale now
+            invalidate("ports")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Ports: {result['created']} created, {result['updated']} updated, "
+            f"{result['unchanged']} unchanged, {result['deleted']} removed."
+        ))
         self.stdout.write(self.style.SUCCESS(f"Total ports tracked: {Port.objects.count()}"))
-
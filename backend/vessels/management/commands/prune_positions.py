@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from vessels.services.retention import RetentionPolicy, format_report, prune_positions
+
+
+class Command(BaseCommand):
+    help = "Downsample and expire old vessel position history (see POSITION_* settings)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+        parser.add_argument("--full-scan", action="store_true",
+                            help="Re-check partitions that were already downsampled")
+        parser.add_argument("--full-res-hours", type=float, help="Override POSITION_FULL_RES_HOURS")
+        parser.add_argument("--downsample-seconds", type=int, help="Override POSITION_DOWNSAMPLE_SECONDS")
+        parser.add_argument("--retention-days", type=float, help="Override POSITION_RETENTION_DAYS")
+        parser.add_argument("--archive-dir", help="Override POSITION_ARCHIVE_DIR")
+        parser.add_argument("--loop", type=int, metavar="SECONDS",
+                            help="Keep running, once every SECONDS")
+
+    def handle(self, *args, **options):
+        policy = RetentionPolicy.from_settings(
+            full_res_hours=options["full_res_hours"],
+            downsample_seconds=options["downsample_seconds"],
+            retention_days=options["retention_days"],
+            archive_dir=options["archive_dir"],
+        )
+
+        while True:
+            report = prune_positions(policy, dry_run=options["dry_run"], full_scan=options["full_scan"])
+            self.stdout.write(self.style.SUCCESS(format_report(report)))
+            if not options["loop"]:
+                break
+            time.sleep(options["loop"])
+
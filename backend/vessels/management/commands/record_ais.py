@@ -0,0 +1,60 @@
+"""
+Records an AIS feed to a gzipped NDJSON file simulate_ais --replay can play
+back, one {"t": seconds since start, "msg": ...} line per message
+"""
+import asyncio
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from vessels.services.ais_sim import record
+
+
+class Command(BaseCommand):
+    help = "Record the aisstream.io feed (or any compatible one) for offline replay"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", nargs="?", help="File to write (default: a timestamped file in AIS_RECORDING_DIR)")
+        parser.add_argument("--url", default=settings.AIS_WS_URL)
+        parser.add_argument("--api-key", default=settings.AIS_API_KEY)
+        parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+        parser.add_argument("--limit", type=int, help="Stop after this many messages")
+
+    def handle(self, *args, **options):
+        if not options["api_key"] and options["url"] == settings.AIS_WS_URL:
+            raise CommandError("No AIS API key provided. Set AIS_API_KEY env var or pass --api-key.")
+
+        path = options["output"]
+        if not path:
+            os.makedirs(settings.AIS_RECORDING_DIR, exist_ok=True)
+            path = os.path.join(settings.AIS_RECORDING_DIR, time.strftime("ais-%Y%m%d-%H%M%S.ndjson.gz"))
+
+        bounds = settings.BALTIC_BOUNDS
+        subscribe = {
+            "APIKey": options["api_key"] or "offline",
+            "BoundingBoxes": [[[bounds["min_lat"], bounds["min_lng"]], [bounds["max_lat"], bounds["max_lng"]]]],
+            "FilterMessageTypes": ["PositionReport", "ShipStaticData"],
+        }
+        self.stdout.write(self.style.SUCCESS(f"Recording {options['url']} to {path}"))
+
+        started = time.monotonic()
+        try:
+            saved = asyncio.run(record(
+                options["url"], subscribe, path,
+                duration=options["duration"], limit=options["limit"], on_progress=self.progress,
+            ))
+        except KeyboardInterrupt:
+            self.stdout.write("\nRecording stopped.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved {saved} messages in {time.monotonic() - started:.0f}s, "
+            f"{os.path.getsize(path) / 1e6:.1f} MB"
+        ))
+
+    def progress(self, saved, seconds, error=None):
+        if error is not None:
+            self.stderr.write(f"Connection lost: {error}. Reconnecting in 5s...")
+        elif saved % 10000 == 0:
+            self.stdout.write(f"  {saved} messages in {seconds:.0f}s")
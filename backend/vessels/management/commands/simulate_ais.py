@@ -0,0 +1,70 @@
+"""
+Offline AIS feed for ingest_ais: a synthetic Baltic fleet, or a recording
+from record_ais played back at up to 100x. Point ingest_ais at it with
+--url (or AIS_USE_SIMULATOR=true)
+"""
+import asyncio
+import os
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from vessels.services.ais_sim import serve_fleet, serve_recording
+
+
+class Command(BaseCommand):
+    help = "Serve a simulated (or recorded) aisstream.io feed over a local websocket"
+
+    def add_arguments(self, parser):
+        default = urlparse(settings.AIS_SIMULATOR_URL)
+        parser.add_argument("--host", default=default.hostname or "localhost")
+        parser.add_argument("--port", type=int, default=default.port or 8765)
+        parser.add_argument("--vessels", type=int, default=settings.AIS_SIM_VESSELS,
+                            help="Synthetic fleet size")
+        parser.add_argument("--rate", type=float, default=settings.AIS_SIM_RATE,
+                            help="Messages per second to each client")
+        parser.add_argument("--static-every", type=int, default=settings.AIS_SIM_STATIC_EVERY,
+                            help="Every Nth message is ShipStaticData (0 for none)")
+        parser.add_argument("--seed", type=int, default=None, help="Seed for a repeatable fleet")
+        parser.add_argument("--replay", type=str, help="Play this record_ais file instead of the synthetic fleet")
+        parser.add_argument("--speed", type=float, default=1.0, help="Replay speed, 1 to 100 times real time")
+        parser.add_argument("--loop", action="store_true", help="Start the recording over when it ends")
+
+    def handle(self, *args, **options):
+        host, port = options["host"], options["port"]
+
+        if options["replay"]:
+            path = options["replay"]
+            if not os.path.exists(path):
+                raise CommandError(f"No recording at {path}")
+            if not 1 <= options["speed"] <= 100:
+                raise CommandError("--speed must be between 1 and 100")
+            self.stdout.write(self.style.SUCCESS(
+                f"Replaying {path} at {options['speed']:g}x on ws://{host}:{port}"
+            ))
+            server = serve_recording(
+                host, port, path, speed=options["speed"], loop=options["loop"],
+                on_connect=self.connected, on_done=self.replayed,
+            )
+        else:
+            if options["vessels"] < 1 or options["rate"] <= 0:
+                raise CommandError("--vessels and --rate must be positive")
+            self.stdout.write(self.style.SUCCESS(
+                f"Simulating {options['vessels']} vessels at {options['rate']:g} msg/s on ws://{host}:{port}"
+            ))
+            server = serve_fleet(
+                host, port, options["vessels"], options["rate"], settings.BALTIC_BOUNDS,
+                static_every=options["static_every"], seed=options["seed"], on_connect=self.connected,
+            )
+
+        try:
+            asyncio.run(server)
+        except KeyboardInterrupt:
+            self.stdout.write("\nSimulator stopped.")
+
+    def connected(self, address):
+        self.stdout.write(f"Client subscribed from {address[0]}:{address[1]}")
+
+    def replayed(self, address, sent, seconds):
+        self.stdout.write(f"Replayed {sent} messages to {address[0]}:{address[1]} in {seconds:.1f}s")
@@ -0,0 +1,51 @@
+# Generated by Django 6.0.2 on 2026-10-17 09:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_latest_positions(apps, schema_editor):
+    VesselPosition = apps.get_model('vessels', 'VesselPosition')
+    VesselLatestPosition = apps.get_model('vessels', 'VesselLatestPosition')
+
+    latest = {}
+    for pos in VesselPosition.objects.order_by('vessel_id', 'timestamp', 'id').iterator(chunk_size=5000):
+        latest[pos.vessel_id] = pos
+
+    VesselLatestPosition.objects.bulk_create([
+        VesselLatestPosition(
+            vessel_id=pos.vessel_id,
+            position_id=pos.id,
+            latitude=pos.latitude,
+            longitude=pos.longitude,
+            speed=pos.speed,
+            heading=pos.heading,
+            course=pos.course,
+            timestamp=pos.timestamp,
+        )
+        for pos in latest.values()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vessels', '0003_zone_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VesselLatestPosition',
+            fields=[
+                ('vessel', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest', serialize=False, to='vessels.vessel')),
+                ('position_id', models.BigIntegerField(help_text='VesselPosition this was copied from')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('speed', models.FloatField(default=0, help_text='Speed in knots')),
+                ('heading', models.FloatField(default=0, help_text='Heading in degrees')),
+                ('course', models.FloatField(default=0, help_text='Course over ground in degrees')),
+                ('timestamp', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_latest_positions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vessels', '0005_port_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='port',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', help_text='Hash of the loaded fields, set by ingest_helcom', max_length=40),
+        ),
+    ]
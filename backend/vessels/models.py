@@ -54,6 +54,49 @@ class VesselPosition(models.Model):
         return f"{self.vessel.name} @ ({self.latitude:.4f}, {self.longitude:.4f})"
 
 
+class VesselLatestPosition(models.Model):
+    # Each vessel's newest position, upserted by ingestion so listings can
+    # read the whole fleet in one query instead of one per vessel
+
+    vessel = models.OneToOneField(Vessel, on_delete=models.CASCADE, primary_key=True, related_name="latest")
+    position_id = models.BigIntegerField(help_text="VesselPosition this was copied from")
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    speed = models.FloatField(default=0, help_text="Speed in knots")
+    heading = models.FloatField(default=0, help_text="Heading in degrees")
+    course = models.FloatField(default=0, help_text="Course over ground in degrees")
+    timestamp = models.DateTimeField(db_index=True)
+
+    UPDATE_FIELDS = ["position_id", "latitude", "longitude", "speed", "heading", "course", "timestamp"]
+
+    @classmethod
+    def from_position(cls, pos):
+        return cls(
+            vessel_id=pos.vessel_id,
+            position_id=pos.id,
+            latitude=pos.latitude,
+            longitude=pos.longitude,
+            speed=pos.speed,
+            heading=pos.heading,
+            course=pos.course,
+            timestamp=pos.timestamp,
+        )
+
+    @classmethod
+    def upsert(cls, positions):
+        # Store the last of the given positions for each vessel
+        latest = {pos.vessel_id: pos for pos in positions}
+        return cls.objects.bulk_create(
+            [cls.from_position(pos) for pos in latest.values()],
+            update_conflicts=True,
+            unique_fields=["vessel"],
+            update_fields=cls.UPDATE_FIELDS,
+        )
+
+    def __str__(self):
+        return f"{self.vessel_id} @ ({self.latitude:.4f}, {self.longitude:.4f})"
+
+
 class Zone(models.Model):
     # A polygon on the map model
 
@@ -61,6 +104,7 @@ class Zone(models.Model):
     polygon_json = models.TextField(help_text="GeoJSON polygon coordinates")
     color = models.CharField(max_length=7, default="#ff9500")
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def get_polygon(self):
         return json.loads(self.polygon_json)
@@ -122,7 +166,9 @@ class Port(models.Model):
     longitude = models.FloatField()
     locode = models.CharField(max_length=20, blank=True, default="", help_text="UN/LOCODE")
     helcom_id = models.CharField(max_length=50, unique=True, help_text="Unique HELCOM identifier")
+    content_hash = models.CharField(max_length=40, blank=True, default="", help_text="Hash of the loaded fields, set by ingest_helcom")
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["name"]
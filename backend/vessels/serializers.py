@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Vessel, VesselPosition, Zone, ZoneAlert, DroneSimulation, Port
+from .models import Vessel, VesselPosition, VesselLatestPosition, Zone, ZoneAlert, DroneSimulation, Port
 
 
 class VesselPositionSerializer(serializers.ModelSerializer):
@@ -8,6 +8,15 @@ class VesselPositionSerializer(serializers.ModelSerializer):
         fields = ["id", "latitude", "longitude", "speed", "heading", "course", "timestamp"]
 
 
+class LatestPositionSerializer(serializers.ModelSerializer):
+    # Same output as VesselPositionSerializer, id is the source position's
+    id = serializers.IntegerField(source="position_id")
+
+    class Meta:
+        model = VesselLatestPosition
+        fields = ["id", "latitude", "longitude", "speed", "heading", "course", "timestamp"]
+
+
 class VesselSerializer(serializers.ModelSerializer):
     latest_position = serializers.SerializerMethodField()
 
@@ -20,10 +29,11 @@ class VesselSerializer(serializers.ModelSerializer):
         ]
 
     def get_latest_position(self, obj):
-        pos = obj.positions.first()
-        if pos:
-            return VesselPositionSerializer(pos).data
-        return None
+        # Needs select_related("latest") on the queryset to avoid a query per vessel
+        try:
+            return LatestPositionSerializer(obj.latest).data
+        except VesselLatestPosition.DoesNotExist:
+            return None
 
 
 class VesselDetailSerializer(VesselSerializer):
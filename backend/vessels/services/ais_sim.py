@@ -0,0 +1,316 @@
+"""
+Offline stand-ins for aisstream.io
+A synthetic fleet that sails around a bounding box and speaks aisstream's
+PositionReport/ShipStaticData JSON, a recorder that saves a live feed to
+gzipped NDJSON, and a replayer that plays a recording back faster than real
+time. Both stand-ins are websocket servers that take the same subscribe
+message as aisstream, so ingest_ais only needs a different --url
+"""
+import asyncio
+import gzip
+import json
+import math
+import random
+import time
+from datetime import datetime, timezone
+
+import websockets
+
+from vessels.services import fastjson
+
+
+# Baltic flag states (MMSI MID prefix -> country) the fleet is drawn from
+FLAGS = {
+    230: "Finland", 265: "Sweden", 266: "Sweden", 276: "Estonia", 275: "Latvia",
+    277: "Lithuania", 261: "Poland", 211: "Germany", 219: "Denmark", 273: "Russia",
+}
+
+# AIS type code, speed range (knots), share of the fleet
+SHIP_CLASSES = [
+    (70, (10, 16), 0.40),  # cargo
+    (80, (10, 14), 0.20),  # tanker
+    (60, (14, 22), 0.08),  # passenger
+    (31, (4, 9), 0.07),    # tug
+    (30, (3, 8), 0.10),    # fishing
+    (37, (4, 8), 0.10),    # pleasure
+    (35, (8, 18), 0.05),   # military
+]
+
+DESTINATIONS = ["HELSINKI", "TALLINN", "STOCKHOLM", "RIGA", "GDANSK", "KIEL", "ST PETERSBURG", "TURKU", "KLAIPEDA"]
+
+KNOT_KM_PER_S = 1.852 / 3600
+KM_PER_DEG = 111.195
+
+
+def utc_stamp(epoch):
+    # aisstream's time_utc: "2026-10-17 12:00:00.123456 +0000 UTC"
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f +0000 UTC")
+
+
+class SimVessel:
+    __slots__ = ("mmsi", "name", "ship_type", "flag", "lat", "lng", "sog", "cog",
+                 "length", "width", "destination", "moved_at")
+
+    def __init__(self, rng, mmsi, bounds, now):
+        ship_type, (low, high), _ = rng.choices(SHIP_CLASSES, weights=[c[2] for c in SHIP_CLASSES])[0]
+        self.mmsi = mmsi
+        self.name = f"SIM {mmsi % 100000:05d}"
+        self.ship_type = ship_type
+        self.flag = FLAGS[mmsi // 1000000]
+        self.lat = rng.uniform(bounds["min_lat"], bounds["max_lat"])
+        self.lng = rng.uniform(bounds["min_lng"], bounds["max_lng"])
+        self.sog = round(rng.uniform(low, high), 1)
+        self.cog = rng.uniform(0, 360)
+        self.length = rng.randint(12, 300) if ship_type in (70, 80, 60) else rng.randint(8, 60)
+        self.width = max(4, self.length // 7)
+        self.destination = rng.choice(DESTINATIONS)
+        self.moved_at = now
+
+
+class FleetSimulator:
+    # A fleet that moves by dead reckoning between reports, drifting its
+    # course a little each time and turning back at the edge of `bounds`.
+    # Land isn't modelled, it's for load, not for pretty tracks
+
+    def __init__(self, vessels, bounds, static_every=20, seed=None):
+        self.rng = random.Random(seed)
+        self.bounds = bounds
+        self.static_every = static_every
+        now = time.time()
+        mmsis = set()
+        while len(mmsis) < vessels:
+            mmsis.add(self.rng.choice(list(FLAGS)) * 1000000 + self.rng.randrange(1000000))
+        self.fleet = [SimVessel(self.rng, mmsi, bounds, now) for mmsi in sorted(mmsis)]
+        self.cursor = 0
+        self.sent = 0
+
+    def move(self, vessel, now):
+        dt = now - vessel.moved_at
+        vessel.moved_at = now
+        km = vessel.sog * KNOT_KM_PER_S * dt
+        heading = math.radians(vessel.cog)
+        lat = vessel.lat + km * math.cos(heading) / KM_PER_DEG
+        lng = vessel.lng + km * math.sin(heading) / (KM_PER_DEG * max(math.cos(math.radians(vessel.lat)), 0.01))
+
+        b = self.bounds
+        if not b["min_lat"] <= lat <= b["max_lat"]:
+            vessel.cog = (180 - vessel.cog) % 360
+            lat = min(max(lat, b["min_lat"]), b["max_lat"])
+        if not b["min_lng"] <= lng <= b["max_lng"]:
+            vessel.cog = (360 - vessel.cog) % 360
+            lng = min(max(lng, b["min_lng"]), b["max_lng"])
+        vessel.lat, vessel.lng = lat, lng
+        vessel.cog = (vessel.cog + self.rng.gauss(0, 2)) % 360
+
+    def next_messages(self, count, now=None):
+        # The next `count` messages, vessels taking turns so each reports
+        # every len(fleet) / rate seconds
+        now = time.time() if now is None else now
+        messages = []
+        for _ in range(count):
+            vessel = self.fleet[self.cursor]
+            self.cursor = (self.cursor + 1) % len(self.fleet)
+            self.sent += 1
+            if self.static_every and self.sent % self.static_every == 0:
+                messages.append(static_message(vessel, now))
+            else:
+                self.move(vessel, now)
+                messages.append(position_message(vessel, now))
+        return messages
+
+
+def _metadata(vessel, now):
+    return {
+        "MMSI": vessel.mmsi,
+        "MMSI_String": vessel.mmsi,
+        "ShipName": f"{vessel.name:<20}",
+        "latitude": round(vessel.lat, 6),
+        "longitude": round(vessel.lng, 6),
+        "time_utc": utc_stamp(now),
+        "country": vessel.flag,
+    }
+
+
+def position_message(vessel, now):
+    return {
+        "MessageType": "PositionReport",
+        "MetaData": _metadata(vessel, now),
+        "Message": {"PositionReport": {
+            "MessageID": 1,
+            "RepeatIndicator": 0,
+            "UserID": vessel.mmsi,
+            "Valid": True,
+            "NavigationalStatus": 0,
+            "RateOfTurn": 0,
+            "Sog": vessel.sog,
+            "PositionAccuracy": True,
+            "Longitude": round(vessel.lng, 6),
+            "Latitude": round(vessel.lat, 6),
+            "Cog": round(vessel.cog, 1),
+            "TrueHeading": round(vessel.cog) % 360,
+            "Timestamp": int(now) % 60,
+            "Raim": False,
+        }},
+    }
+
+
+def static_message(vessel, now):
+    return {
+        "MessageType": "ShipStaticData",
+        "MetaData": _metadata(vessel, now),
+        "Message": {"ShipStaticData": {
+            "MessageID": 5,
+            "RepeatIndicator": 0,
+            "UserID": vessel.mmsi,
+            "Valid": True,
+            "AisVersion": 2,
+            "ImoNumber": 0,
+            "CallSign": f"S{vessel.mmsi % 100000:05d}",
+            "Name": f"{vessel.name:<20}",
+            "Type": vessel.ship_type,
+            "Dimension": {"A": vessel.length * 2 // 3, "B": vessel.length - vessel.length * 2 // 3,
+                          "C": vessel.width // 2, "D": vessel.width - vessel.width // 2},
+            "FixType": 1,
+            "MaximumStaticDraught": 6.5,
+            "Destination": vessel.destination,
+            "Dte": False,
+        }},
+    }
+
+
+class Subscription:
+    # What a client asked for in its subscribe message: message types and
+    # [[lat, lng], [lat, lng]] boxes, like aisstream. Empty means everything
+
+    def __init__(self, message):
+        self.types = set(message.get("FilterMessageTypes") or [])
+        self.boxes = [
+            (min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1]))
+            for a, b in message.get("BoundingBoxes") or []
+        ]
+
+    def wants(self, msg):
+        if self.types and msg.get("MessageType") not in self.types:
+            return False
+        if not self.boxes:
+            return True
+        meta = msg.get("MetaData", {})
+        lat, lng = meta.get("latitude"), meta.get("longitude")
+        if lat is None or lng is None:
+            return True
+        return any(s <= lat <= n and w <= lng <= e for s, w, n, e in self.boxes)
+
+
+async def read_subscription(ws, timeout=10):
+    # aisstream closes the socket if the subscribe message doesn't come in time
+    try:
+        return Subscription(json.loads(await asyncio.wait_for(ws.recv(), timeout)))
+    except (asyncio.TimeoutError, json.JSONDecodeError, TypeError, AttributeError):
+        await ws.close(code=1008, reason="Expected a subscribe message")
+        return None
+
+
+async def serve_fleet(host, port, vessels, rate, bounds, static_every=20, seed=None, on_connect=None):
+    # Serve a synthetic fleet at `rate` messages/s per client. Every client
+    # gets its own copy of the fleet (same seed, same ships)
+    async def handler(ws):
+        subscription = await read_subscription(ws)
+        if subscription is None:
+            return
+        if on_connect:
+            on_connect(ws.remote_address)
+        fleet = FleetSimulator(vessels, bounds, static_every=static_every, seed=seed)
+        started = time.monotonic()
+        sent = 0
+        try:
+            while True:
+                # Catch up to where `rate` says we should be, in 50ms steps
+                due = int((time.monotonic() - started) * rate) - sent
+                if due > 0:
+                    for msg in fleet.next_messages(due):
+                        if subscription.wants(msg):
+                            await ws.send(fastjson.dumps(msg))
+                    sent += due
+                await asyncio.sleep(0.05)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async with websockets.serve(handler, host, port, max_queue=None):
+        await asyncio.Future()
+
+
+def read_recording(path):
+    # (seconds since the recording started, message) per line
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = fastjson.loads(line)
+            yield entry["t"], entry["msg"]
+
+
+async def serve_recording(host, port, path, speed=1.0, loop=False, on_connect=None, on_done=None):
+    # Play a recording back to each client at `speed` times real time
+    async def handler(ws):
+        subscription = await read_subscription(ws)
+        if subscription is None:
+            return
+        if on_connect:
+            on_connect(ws.remote_address)
+        try:
+            while True:
+                started = time.monotonic()
+                sent = 0
+                for offset, msg in read_recording(path):
+                    wait = started + offset / speed - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    if subscription.wants(msg):
+                        await ws.send(fastjson.dumps(msg))
+                        sent += 1
+                if on_done:
+                    on_done(ws.remote_address, sent, time.monotonic() - started)
+                if not loop:
+                    break
+            await ws.close()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async with websockets.serve(handler, host, port, max_queue=None):
+        await asyncio.Future()
+
+
+async def record(url, subscribe, path, duration=None, limit=None, on_progress=None):
+    # Save a feed to gzipped NDJSON, one {"t": seconds, "msg": ...} per
+    # message, reconnecting like ingest_ais does. Returns how many were saved
+    started = time.monotonic()
+    saved = 0
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as out:
+        while True:
+            try:
+                async with websockets.connect(url, max_queue=None) as ws:
+                    await ws.send(json.dumps(subscribe))
+                    while True:
+                        remaining = None if duration is None else duration - (time.monotonic() - started)
+                        if remaining is not None and remaining <= 0:
+                            return saved
+                        try:
+                            raw = await asyncio.wait_for(ws.recv(), remaining)
+                        except asyncio.TimeoutError:
+                            return saved
+                        try:
+                            msg = json.loads(raw)
+                        except json.JSONDecodeError:
+                            continue
+                        out.write(json.dumps({"t": round(time.monotonic() - started, 3), "msg": msg},
+                                             separators=(",", ":")))
+                        out.write("\n")
+                        saved += 1
+                        if on_progress and saved % 1000 == 0:
+                            on_progress(saved, time.monotonic() - started)
+                        if limit is not None and saved >= limit:
+                            return saved
+            except (websockets.exceptions.ConnectionClosed, ConnectionError) as e:
+                if on_progress:
+                    on_progress(saved, time.monotonic() - started, error=e)
+                await asyncio.sleep(5)
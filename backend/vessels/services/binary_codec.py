@@ -0,0 +1,145 @@
+"""
+Compact binary frames for vessel_update and initial_data
+Clients opt in by asking for the "vessels.bin.v1" websocket subprotocol.
+Everything is little-endian and laid out column by column:
+
+  header    u8 version, u8 kind (1 = vessel_update, 2 = initial_data),
+            u32 seq, u32 count
+  columns   u32 id, i32 lat * 1e6, i32 lng * 1e6 (INT32_MIN = no position),
+            u16 speed * 10, u16 heading * 10, u16 course * 10,
+            u8 ship type (index into SHIP_TYPES), u32 tonnage
+  strings   per vessel: u8 len + mmsi, u16 len + name
+  extras    initial_data only, per vessel: u16 length * 10, u16 width * 10,
+            u8 len + flag, u16 len + destination
+
+The reference decoder is decodeVesselFrame in frontend/src/hooks/useWebSocket.js
+"""
+import struct
+
+import numpy as np
+
+from vessels.models import Vessel
+
+
+SUBPROTOCOL = "vessels.bin.v1"
+VERSION = 1
+KIND_VESSEL_UPDATE = 1
+KIND_INITIAL_DATA = 2
+KINDS = {"vessel_update": KIND_VESSEL_UPDATE, "initial_data": KIND_INITIAL_DATA}
+
+SHIP_TYPES = [code for code, _ in Vessel.SHIP_TYPES]
+SHIP_TYPE_INDEX = {code: i for i, code in enumerate(SHIP_TYPES)}
+
+NO_POSITION = -2 ** 31
+HEADER = struct.Struct("<BBII")
+
+
+def _column(values, dtype, scale=1, lo=None, hi=None):
+    column = np.asarray(values, dtype=float) * scale
+    if lo is not None:
+        column = np.clip(column, lo, hi)
+    return np.rint(column).astype(dtype).tobytes()
+
+
+def _angle_column(values):
+    # Tenths of a degree, 359.96 wraps to 0 rather than 360
+    tenths = np.rint(np.array([v or 0 for v in values], dtype=float) * 10)
+    return (tenths % 3600).astype("<u2").tobytes()
+
+
+def _string(value, length_format):
+    data = (value or "").encode()[:255 if length_format == "B" else 65535]
+    return struct.pack("<" + length_format, len(data)) + data
+
+
+def encode_frame(message_type, seq, vessels):
+    kind = KINDS[message_type]
+    has_position = [v.get("latitude") is not None for v in vessels]
+
+    parts = [HEADER.pack(VERSION, kind, seq or 0, len(vessels))]
+    parts.append(_column([v["id"] for v in vessels], "<u4"))
+    lat = np.rint(np.array([v.get("latitude") or 0 for v in vessels], dtype=float) * 1e6).astype("<i4")
+    lng = np.rint(np.array([v.get("longitude") or 0 for v in vessels], dtype=float) * 1e6).astype("<i4")
+    missing = ~np.array(has_position, dtype=bool)
+    lat[missing] = NO_POSITION
+    lng[missing] = NO_POSITION
+    parts.append(lat.tobytes())
+    parts.append(lng.tobytes())
+    parts.append(_column([v.get("speed") or 0 for v in vessels], "<u2", 10, 0, 65535))
+    parts.append(_angle_column([v.get("heading") for v in vessels]))
+    parts.append(_angle_column([v.get("course") for v in vessels]))
+    parts.append(bytes(SHIP_TYPE_INDEX.get(v.get("ship_type"), SHIP_TYPE_INDEX["other"]) for v in vessels))
+    parts.append(_column([v.get("weight_tonnage") or 0 for v in vessels], "<u4", 1, 0, 2 ** 32 - 1))
+
+    for v in vessels:
+        parts.append(_string(v.get("mmsi"), "B"))
+        parts.append(_string(v.get("name"), "H"))
+
+    if kind == KIND_INITIAL_DATA:
+        for v in vessels:
+            parts.append(struct.pack(
+                "<HH",
+                min(max(round((v.get("length") or 0) * 10), 0), 65535),
+                min(max(round((v.get("width") or 0) * 10), 0), 65535),
+            ))
+            parts.append(_string(v.get("flag"), "B"))
+            parts.append(_string(v.get("destination"), "H"))
+
+    return b"".join(parts)
+
+
+def decode_frame(data):
+    # Python twin of the JS decoder, used to check round trips
+    version, kind, seq, count = HEADER.unpack_from(data, 0)
+    offset = HEADER.size
+
+    def column(dtype):
+        nonlocal offset
+        values = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += values.nbytes
+        return values
+
+    def string(length_format):
+        nonlocal offset
+        (length,) = struct.unpack_from("<" + length_format, data, offset)
+        offset += struct.calcsize(length_format)
+        value = data[offset:offset + length].decode()
+        offset += length
+        return value
+
+    ids, lats, lngs = column("<u4"), column("<i4"), column("<i4")
+    speeds, headings, courses = column("<u2"), column("<u2"), column("<u2")
+    types, tonnage = column("u1"), column("<u4")
+
+    vessels = []
+    for i in range(count):
+        vessel = {
+            "id": int(ids[i]),
+            "mmsi": string("B"),
+            "name": string("H"),
+            "ship_type": SHIP_TYPES[types[i]],
+            "weight_tonnage": float(tonnage[i]),
+        }
+        if lats[i] != NO_POSITION:
+            vessel.update({
+                "latitude": int(lats[i]) / 1e6,
+                "longitude": int(lngs[i]) / 1e6,
+                "speed": int(speeds[i]) / 10,
+                "heading": int(headings[i]) / 10,
+                "course": int(courses[i]) / 10,
+            })
+        vessels.append(vessel)
+
+    if kind == KIND_INITIAL_DATA:
+        for vessel in vessels:
+            length, width = struct.unpack_from("<HH", data, offset)
+            offset += 4
+            vessel.update({
+                "length": length / 10,
+                "width": width / 10,
+                "flag": string("B"),
+                "destination": string("H"),
+            })
+
+    message_type = "vessel_update" if kind == KIND_VESSEL_UPDATE else "initial_data"
+    return {"type": message_type, "seq": seq, "vessels": vessels}
@@ -0,0 +1,104 @@
+"""
+Everything ingestion sends to the vessel_updates group goes through here
+Each broadcast gets the next number from a Redis counter and is also kept
+in a capped Redis list, so a reconnecting client can ask for just the
+messages it missed instead of the whole fleet
+The event is encoded to JSON once, here, and the group message carries that
+text so consumers can forward it as-is instead of each re-encoding the rows
+Several threads and worker processes send at once, so group messages can
+reach clients slightly out of seq order; clients skip seqs they've already
+seen rather than everything below the highest one
+"""
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from vessels.services import fastjson, metrics
+from vessels.services.redis_client import get_redis
+
+
+GROUP = "vessel_updates"
+SEQ_KEY = "vessels:seq"
+# Encoded events, oldest first, always the DELTA_BUFFER_SIZE seqs up to SEQ_KEY
+DELTAS_KEY = "vessels:delta_log"
+
+# Numbering and storing happen in one script, so the list is in seq order
+# with no gaps and a seq's position in it can be worked out from the counter
+STAMP = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('RPUSH', KEYS[2], '{"seq":' .. seq .. ',' .. string.sub(ARGV[1], 2))
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[2]), -1)
+return seq
+"""
+
+# Everything after `since`, or nil if the list doesn't reach back that far
+SINCE = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local since = tonumber(ARGV[1])
+if since > current then
+    return false
+end
+local first = current - redis.call('LLEN', KEYS[2]) + 1
+if since + 1 < first then
+    return false
+end
+return redis.call('LRANGE', KEYS[2], since + 1 - first, -1)
+"""
+
+_scripts = {}
+
+
+def _script(source):
+    # Registered once per process, redis-py falls back to EVAL if the
+    # server hasn't seen it
+    if source not in _scripts:
+        _scripts[source] = get_redis().register_script(source)
+    return _scripts[source]
+
+
+def current_seq():
+    return int(get_redis().get(SEQ_KEY) or 0)
+
+
+def stamp(seq, body):
+    # body is the event encoded without its seq, same splice as STAMP
+    return f'{{"seq":{seq},{body[1:]}'
+
+
+def send(event):
+    # Stamp, remember and broadcast one event, returns its seq
+    body = fastjson.dumps(event)
+    seq = _script(STAMP)(keys=[SEQ_KEY, DELTAS_KEY], args=[body, settings.DELTA_BUFFER_SIZE])
+    text = stamp(seq, body)
+
+    # Only the encoded text goes over the channel layer, consumers that
+    # need the rows (viewport filter, binary frames) decode it once per process
+    with metrics.stage_seconds.time(stage="group_send"):
+        async_to_sync(get_channel_layer().group_send)(GROUP, {
+            "type": event["type"],
+            "seq": seq,
+            "text": text,
+        })
+    metrics.broadcast_messages.inc(type=event["type"])
+    metrics.broadcast_bytes.inc(len(text), type=event["type"])
+    return seq
+
+
+def send_vessel_update(vessels):
+    return send({"type": "vessel_update", "vessels": vessels})
+
+
+def send_zone_alerts(alerts):
+    return send({"type": "zone_alerts", "alerts": alerts})
+
+
+def deltas_since(since):
+    # Client messages with seq > since, oldest first. None if the buffer
+    # doesn't reach back that far (or the counter was reset), in which
+    # case the client needs a fresh snapshot. Only the tail after `since`
+    # is read, not the whole buffer
+    texts = _script(SINCE)(keys=[SEQ_KEY, DELTAS_KEY], args=[since])
+    if texts is None:
+        return None
+    return [text.decode() for text in texts]
@@ -0,0 +1,92 @@
+"""
+Sits between ingestion and the channel layer
+Keeps only the newest row per vessel until the next tick, drops rows that
+barely differ from what clients already have, then sends everything left
+as one vessel_update. Set the tick to 0 to send every offer straight away
+"""
+import math
+import threading
+
+from django.conf import settings
+
+
+# Rough metres per degree, good enough for a "did it move" check
+M_PER_DEG_LAT = 110540
+M_PER_DEG_LNG = 111320
+
+
+class UpdateCoalescer:
+
+    def __init__(self, send, tick_ms=None, min_distance_m=None, min_heading_deg=None, min_speed_kn=None):
+        self.send = send
+        self.tick = (settings.BROADCAST_TICK_MS if tick_ms is None else tick_ms) / 1000
+        self.min_distance_m = settings.BROADCAST_MIN_DISTANCE_M if min_distance_m is None else min_distance_m
+        self.min_heading_deg = settings.BROADCAST_MIN_HEADING_DEG if min_heading_deg is None else min_heading_deg
+        self.min_speed_kn = settings.BROADCAST_MIN_SPEED_KN if min_speed_kn is None else min_speed_kn
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_sent = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.offered = 0
+        self.suppressed = 0
+        self.merged = 0
+        self.sent_rows = 0
+        self.sent_messages = 0
+
+    def offer(self, rows):
+        # Queue rows for the next tick. Returns flush() when not ticking
+        with self._lock:
+            for row in rows:
+                self.offered += 1
+                if not self._changed(row):
+                    self.suppressed += 1
+                    self._pending.pop(row["id"], None)
+                    continue
+                if row["id"] in self._pending:
+                    self.merged += 1
+                self._pending[row["id"]] = row
+        if self.tick <= 0:
+            return self.flush()
+        return None
+
+    def flush(self):
+        # Send what's pending as one vessel_update, returns (rows, seq) or None
+        with self._lock:
+            if not self._pending:
+                return None
+            rows = list(self._pending.values())
+            self._pending = {}
+            for row in rows:
+                self._last_sent[row["id"]] = row
+            self.sent_rows += len(rows)
+            self.sent_messages += 1
+        return rows, self.send(rows)
+
+    def forget(self, vessel_id):
+        # Next row for this vessel always goes out (e.g. after a rename)
+        with self._lock:
+            self._last_sent.pop(vessel_id, None)
+
+    def stats(self):
+        return {
+            "offered": self.offered,
+            "suppressed": self.suppressed,
+            "merged": self.merged,
+            "sent_rows": self.sent_rows,
+            "sent_messages": self.sent_messages,
+        }
+
+    def _changed(self, row):
+        last = self._last_sent.get(row["id"])
+        if last is None:
+            return True
+        dlat = (row["latitude"] - last["latitude"]) * M_PER_DEG_LAT
+        dlng = (row["longitude"] - last["longitude"]) * M_PER_DEG_LNG * math.cos(math.radians(row["latitude"]))
+        if math.hypot(dlat, dlng) >= self.min_distance_m:
+            return True
+        dheading = abs((row["heading"] or 0) - (last["heading"] or 0)) % 360
+        if min(dheading, 360 - dheading) >= self.min_heading_deg:
+            return True
+        return abs((row["speed"] or 0) - (last["speed"] or 0)) >= self.min_speed_kn
@@ -0,0 +1,285 @@
+"""
+Columnar export of position history (Arrow / Parquet)
+Rows are read in id order through iterator(chunk_size=...) (a server side
+cursor on Postgres), turned into Arrow record batches and either written
+out partitioned by day and MMSI hash, or streamed as an Arrow IPC stream.
+Memory stays flat no matter how much history there is.
+Ids are handed out before the rows commit, so with several writers a lower
+id can show up after a higher one. Exports stop at the newest id that is
+at least lag_seconds old (safe_until_id), anything below it has committed
+by then, so a since_id / watermark past it never skips a row.
+pyarrow is only imported when an export actually runs
+"""
+import io
+import json
+import os
+import time
+import zlib
+from datetime import date, timedelta
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from vessels.models import VesselPosition
+
+
+EXPORT_FIELDS = ["id", "vessel_id", "vessel__mmsi", "latitude", "longitude",
+                 "speed", "heading", "course", "timestamp"]
+
+WATERMARK_FILE = "_watermark.json"
+
+EPOCH = date(1970, 1, 1)
+MICROS_PER_DAY = 86_400_000_000
+
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Position export needs pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+def schema():
+    pa = require_pyarrow()
+    return pa.schema([
+        ("position_id", pa.int64()),
+        ("vessel_id", pa.int64()),
+        ("mmsi", pa.string()),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("speed", pa.float64()),
+        ("heading", pa.float64()),
+        ("course", pa.float64()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+    ])
+
+
+def mmsi_bucket(mmsi, buckets):
+    # Stable across processes, unlike hash()
+    return zlib.crc32(mmsi.encode()) % buckets
+
+
+def export_queryset(since_id=0, until_id=None, start=None, end=None):
+    qs = VesselPosition.objects.filter(id__gt=since_id)
+    if until_id is not None:
+        qs = qs.filter(id__lte=until_id)
+    if start is not None:
+        qs = qs.filter(timestamp__gte=start)
+    if end is not None:
+        qs = qs.filter(timestamp__lt=end)
+    # Clear the model's -timestamp ordering, id order is what the
+    # watermark (and the index) want
+    return qs.order_by("id").values_list(*EXPORT_FIELDS)
+
+
+def safe_until_id(lag_seconds):
+    # Newest id whose row is at least lag_seconds old. Timestamps are set
+    # on insert, so any row with a lower id still uncommitted would've been
+    # in its transaction for longer than the lag
+    cutoff = timezone.now() - timedelta(seconds=lag_seconds)
+    return (
+        VesselPosition.objects.filter(timestamp__lt=cutoff)
+        .order_by("-id").values_list("id", flat=True).first()
+    ) or 0
+
+
+def iter_batches(queryset, chunk_size=50000):
+    # Record batches of up to chunk_size rows
+    pa = require_pyarrow()
+    batch_schema = schema()
+    chunk = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield _to_batch(pa, batch_schema, chunk)
+            chunk = []
+    if chunk:
+        yield _to_batch(pa, batch_schema, chunk)
+
+
+def _to_batch(pa, batch_schema, rows):
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(col, type=field.type) for col, field in zip(columns, batch_schema)],
+        schema=batch_schema,
+    )
+
+
+def stream_arrow(queryset, chunk_size=50000):
+    # Arrow IPC stream as an iterator of bytes, for StreamingHttpResponse
+    pa = require_pyarrow()
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema()) as writer:
+        for batch in iter_batches(queryset, chunk_size):
+            writer.write_batch(batch)
+            yield _drain(sink)
+    yield _drain(sink)
+
+
+async def astream_arrow(queryset, chunk_size=50000):
+    # stream_arrow for ASGI. Handed a sync iterator, Django would run it to
+    # the end in one go before sending anything, so pull it a chunk at a
+    # time on the sync thread instead (same thread, same cursor)
+    chunks = stream_arrow(queryset, chunk_size)
+    next_chunk = sync_to_async(next)
+    try:
+        while (data := await next_chunk(chunks, None)) is not None:
+            yield data
+    finally:
+        await sync_to_async(chunks.close)()
+
+
+def _drain(sink):
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+class PartitionedWriter:
+    # Writes batches under <root>/day=YYYY-MM-DD/mmsi_bucket=NN/, one file
+    # per partition per run. Rows come in id order, which is (nearly) time
+    # order, so partitions for days we've moved past get closed as we go
+
+    def __init__(self, root, fmt="parquet", buckets=16, row_group_size=131072, run_id="0"):
+        self.pa = require_pyarrow()
+        self.root = root
+        self.fmt = fmt
+        self.buckets = buckets
+        self.row_group_size = row_group_size
+        self.run_id = run_id
+        self._buffers = {}
+        self._writers = {}
+        self._paths = {}
+        self._opened = {}
+        self._bucket_of = {}
+        self.files = []
+        self.bytes = 0
+
+    def write(self, batch):
+        # Group rows by (day, bucket) with numpy rather than row by row
+        micros = batch.column("timestamp").cast(self.pa.int64()).to_numpy()
+        days = micros // MICROS_PER_DAY
+        vessel_ids, first, inverse = np.unique(
+            batch.column("vessel_id").to_numpy(), return_index=True, return_inverse=True,
+        )
+        mmsis = batch.column("mmsi").take(self.pa.array(first)).to_pylist()
+        buckets = np.array([self._bucket(v, m) for v, m in zip(vessel_ids.tolist(), mmsis)])[inverse]
+
+        keys = days * self.buckets + buckets
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        splits = np.flatnonzero(np.diff(sorted_keys)) + 1
+        for rows in np.split(order, splits):
+            day, bucket = divmod(int(keys[rows[0]]), self.buckets)
+            self._buffer((EPOCH + timedelta(days=day), bucket), batch.take(self.pa.array(rows)))
+
+        # Anything from before this batch's first day is finished
+        oldest = EPOCH + timedelta(days=int(days.min()))
+        for key in [key for key in self._buffers if key[0] < oldest]:
+            self._close(key)
+
+    def close(self):
+        for key in list(self._buffers):
+            self._close(key)
+
+    def _bucket(self, vessel_id, mmsi):
+        bucket = self._bucket_of.get(vessel_id)
+        if bucket is None:
+            bucket = self._bucket_of[vessel_id] = mmsi_bucket(mmsi, self.buckets)
+        return bucket
+
+    def _buffer(self, key, batch):
+        pending = self._buffers.setdefault(key, [])
+        pending.append(batch)
+        if sum(b.num_rows for b in pending) >= self.row_group_size:
+            self._flush(key)
+
+    def _flush(self, key):
+        pending = self._buffers.get(key)
+        if not pending:
+            return
+        table = self.pa.Table.from_batches(pending)
+        self._buffers[key] = []
+        writer = self._writers.get(key)
+        if writer is None:
+            writer = self._writers[key] = self._open(key, table.schema)
+        writer.write_table(table)
+
+    def _close(self, key):
+        self._flush(key)
+        self._buffers.pop(key, None)
+        writer = self._writers.pop(key, None)
+        if writer is not None:
+            writer.close()
+            self.bytes += os.path.getsize(self._paths.pop(key))
+
+    def _open(self, key, table_schema):
+        day, bucket = key
+        directory = os.path.join(self.root, f"day={day.isoformat()}", f"mmsi_bucket={bucket:02d}")
+        os.makedirs(directory, exist_ok=True)
+        ext = "parquet" if self.fmt == "parquet" else "arrow"
+        # A straggler row for a day we already closed gets its own file
+        n = self._opened[key] = self._opened.get(key, 0) + 1
+        suffix = f"-{n}" if n > 1 else ""
+        path = os.path.join(directory, f"part-{self.run_id}{suffix}.{ext}")
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+            writer = pq.ParquetWriter(path, table_schema, compression="zstd")
+        else:
+            writer = self.pa.ipc.new_file(path, table_schema)
+        self._paths[key] = path
+        self.files.append(path)
+        return writer
+
+
+def read_watermark(root):
+    path = os.path.join(root, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {"last_id": 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_watermark(root, last_id, rows):
+    # Written last, so a crashed export is simply redone from the old one
+    path = os.path.join(root, WATERMARK_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"last_id": last_id, "rows": rows, "exported_at": timezone.now().isoformat()}, f)
+    os.replace(path + ".tmp", path)
+
+
+def export_positions(root, fmt="parquet", buckets=16, chunk_size=50000, full=False, lag_seconds=60):
+    # Export everything since the watermark in root, returns a report
+    os.makedirs(root, exist_ok=True)
+    since_id = 0 if full else read_watermark(root)["last_id"]
+    # Fix the upper end now so rows ingested mid export wait for the next
+    # run, and keep clear of ids that may still be in flight
+    until_id = max(safe_until_id(lag_seconds), since_id)
+
+    started = time.monotonic()
+    writer = PartitionedWriter(root, fmt=fmt, buckets=buckets, run_id=f"{since_id + 1:012d}")
+    rows = 0
+    try:
+        for batch in iter_batches(export_queryset(since_id, until_id), chunk_size):
+            writer.write(batch)
+            rows += batch.num_rows
+    finally:
+        writer.close()
+    if until_id > since_id:
+        write_watermark(root, until_id, rows)
+
+    seconds = time.monotonic() - started
+    return {
+        "since_id": since_id,
+        "last_id": max(until_id, since_id),
+        "rows": rows,
+        "files": len(writer.files),
+        "bytes": writer.bytes,
+        "seconds": round(seconds, 2),
+        "rows_per_sec": round(rows / seconds) if seconds else 0,
+    }
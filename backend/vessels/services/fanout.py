@@ -0,0 +1,45 @@
+"""
+Per-process memo for broadcast events
+Every consumer in a process gets the same event, so anything derived from
+it (decoded rows, the binary frame) is worked out by the first consumer and
+reused by the rest, keyed by seq (and checked against the text, in case
+the counter was reset under us)
+"""
+from collections import OrderedDict
+
+from vessels.services import fastjson
+from vessels.services.binary_codec import encode_frame
+
+
+class EventMemo:
+    # Small LRU, only the last few events are ever in flight at once
+
+    def __init__(self, max_size=64):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def decoded(self, seq, text):
+        # The event as a dict
+        return self._get(("decoded", seq), text, lambda: fastjson.loads(text))
+
+    def frame(self, seq, text):
+        # Binary vessel_update frame for the whole event
+        return self._get(
+            ("frame", seq),
+            text,
+            lambda: encode_frame("vessel_update", seq, self.decoded(seq, text)["vessels"]),
+        )
+
+    def clear(self):
+        self._entries.clear()
+
+    def _get(self, key, text, build):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != text:
+            entry = self._entries[key] = (text, build())
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry[1]
+
+
+event_memo = EventMemo()
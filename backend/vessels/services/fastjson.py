@@ -0,0 +1,19 @@
+"""
+JSON encoding for the broadcast hot path
+Uses orjson when it's installed (several times faster than the json
+module), otherwise falls back to the standard library
+"""
+try:
+    import orjson
+
+    def dumps(obj):
+        # numpy scalars are floats as far as json.dumps is concerned, orjson
+        # needs telling
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+    loads = orjson.loads
+except ImportError:  # pragma: no cover
+    import json
+
+    dumps = json.dumps
+    loads = json.loads
@@ -0,0 +1,162 @@
+"""
+HELCOM port loading
+The CSV has one row per port site. Sites sharing a port code are clustered
+by distance (so a code spread over two places becomes two ports and close
+by sites become one), then synced into Port in one transaction keyed on
+helcom_id. Rows whose content hash hasn't changed aren't touched, so
+re-running it is cheap and port ids stay put.
+A code with one cluster gets HELCOM-<code>. When it has several, each one is
+told apart by where it is (cluster_key) rather than by its size or file
+order, so adding a site to one cluster doesn't move the others' ids
+"""
+import csv
+import hashlib
+import math
+
+from django.db import transaction
+from django.utils import timezone
+
+from vessels.models import Port
+
+
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LNG = 111.320
+
+SYNCED_FIELDS = ["name", "country", "latitude", "longitude", "locode", "content_hash"]
+
+
+def read_sites(path, on_error=None):
+    # Stream (locode, name, country, lat, lng) out of the CSV, rows that
+    # don't parse go to on_error(row, exception)
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f, delimiter=";"):
+            try:
+                yield (
+                    row["Port code"].strip(),
+                    row["Port name"].strip(),
+                    row["Port country"].strip(),
+                    float(row["Latitude"]),
+                    float(row["Longitude"]),
+                )
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                if on_error is not None:
+                    on_error(row, e)
+
+
+def cluster(points, radius_km):
+    # Single linkage clusters of (lat, lng) points: anything within
+    # radius_km of a cluster member joins it. A grid of radius sized cells
+    # means only the 3x3 cells around a point need checking
+    parent = list(range(len(points)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    projected = [
+        (lng * KM_PER_DEG_LNG * math.cos(math.radians(lat)), lat * KM_PER_DEG_LAT)
+        for lat, lng in points
+    ]
+    grid = {}
+    for i, (x, y) in enumerate(projected):
+        cx, cy = int(x // radius_km), int(y // radius_km)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in grid.get((cx + dx, cy + dy), ()):
+                    if math.dist(projected[i], projected[j]) <= radius_km:
+                        parent[find(i)] = find(j)
+        grid.setdefault((cx, cy), []).append(i)
+
+    groups = {}
+    for i in range(len(points)):
+        groups.setdefault(find(i), []).append(i)
+    # Biggest first (then file order), so the name comes from the main site
+    return sorted(groups.values(), key=lambda members: (-len(members), members[0]))
+
+
+def cluster_key(points):
+    # Southwest-most site of the cluster to two decimals (about 1 km). It
+    # only changes when that site goes or one further southwest joins
+    lat, lng = min((round(lat, 2), round(lng, 2)) for lat, lng in points)
+    return f"{lat:.2f}_{lng:.2f}"
+
+
+def build_ports(sites, radius_km, bounds):
+    # Port field dicts keyed by helcom_id
+    by_locode = {}
+    for locode, name, country, lat, lng in sites:
+        by_locode.setdefault(locode, []).append((name, country, lat, lng))
+
+    ports = {}
+    for locode, members in by_locode.items():
+        base_id = f"HELCOM-{locode.replace(' ', '_')}"
+        points = [(lat, lng) for _, _, lat, lng in members]
+        groups = cluster(points, radius_km)
+        for group in groups:
+            avg_lat = sum(members[i][2] for i in group) / len(group)
+            avg_lng = sum(members[i][3] for i in group) / len(group)
+
+            # Filter out ports outside the Baltics
+            if not (bounds["min_lat"] <= avg_lat <= bounds["max_lat"] and bounds["min_lng"] <= avg_lng <= bounds["max_lng"]):
+                continue
+
+            name, country = members[group[0]][:2]
+            fields = {
+                "name": name,
+                "country": country,
+                "latitude": avg_lat,
+                "longitude": avg_lng,
+                "locode": locode,
+            }
+            fields["content_hash"] = content_hash(fields)
+            helcom_id = base_id if len(groups) == 1 else f"{base_id}-{cluster_key([points[i] for i in group])}"
+            # Clusters sit further apart than the rounding unless radius_km
+            # is tiny, don't let one overwrite another if they do collide
+            unique_id, n = helcom_id, 1
+            while unique_id in ports:
+                n += 1
+                unique_id = f"{helcom_id}-{n}"
+            ports[unique_id] = fields
+    return ports
+
+
+def content_hash(fields):
+    text = "|".join([
+        fields["name"], fields["country"], fields["locode"],
+        f"{fields['latitude']:.7f}", f"{fields['longitude']:.7f}",
+    ])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def sync_ports(ports):
+    # Make Port match `ports` (helcom_id -> fields): one bulk insert, one
+    # bulk update for changed hashes, one delete for what's gone
+    with transaction.atomic():
+        existing = {
+            helcom_id: (pk, digest)
+            for pk, helcom_id, digest in Port.objects.values_list("id", "helcom_id", "content_hash")
+        }
+
+        to_create, to_update = [], []
+        now = timezone.now()
+        for helcom_id, fields in ports.items():
+            current = existing.get(helcom_id)
+            if current is None:
+                to_create.append(Port(helcom_id=helcom_id, **fields))
+            elif current[1] != fields["content_hash"]:
+                # bulk_update skips auto_now, the table version needs it
+                to_update.append(Port(id=current[0], helcom_id=helcom_id, updated_at=now, **fields))
+
+        stale = [pk for helcom_id, (pk, _) in existing.items() if helcom_id not in ports]
+        Port.objects.bulk_create(to_create, batch_size=500)
+        Port.objects.bulk_update(to_update, SYNCED_FIELDS + ["updated_at"], batch_size=500)
+        deleted = Port.objects.filter(id__in=stale).delete()[0] if stale else 0
+
+    return {
+        "created": len(to_create),
+        "updated": len(to_update),
+        "unchanged": len(ports) - len(to_create) - len(to_update),
+        "deleted": deleted,
+    }
@@ -0,0 +1,79 @@
+"""
+Conditional GET and a rendered response cache for tables that rarely change
+(ports, zones). The ETag comes from the table version (row count + newest
+updated_at), so it's right even when another process changed the rows.
+Rendered JSON is kept in one Redis hash per resource, keyed by that ETag,
+and dropped whenever the resource is invalidated
+"""
+import hashlib
+import time
+
+import redis
+from django.conf import settings
+
+from vessels.services.redis_client import get_redis
+from vessels.services.versions import table_stats
+
+
+def _keys(resource):
+    return f"http:{resource}:responses", f"http:{resource}:changed_at"
+
+
+def resource_state(resource, model):
+    # Version string and last modified (unix time) for a resource
+    count, updated = table_stats(model)
+    updated = updated.timestamp() if updated else 0.0
+    changed_at = 0.0
+    try:
+        changed_at = float(get_redis().get(_keys(resource)[1]) or 0)
+    except redis.RedisError:
+        pass
+    # Deletes don't move updated_at, the invalidation time covers them
+    return f"{count}-{updated:.6f}", max(updated, changed_at)
+
+
+def make_etag(resource, version, variant):
+    digest = hashlib.sha1(f"{resource}:{version}:{variant}".encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def etag_matches(header, etag):
+    # If-None-Match can be a list, "*", or weak validators
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def get_rendered(resource, etag):
+    try:
+        return get_redis().hget(_keys(resource)[0], etag)
+    except redis.RedisError:
+        return None
+
+
+def store_rendered(resource, etag, content):
+    # Bodies for old versions just sit there until the next invalidation
+    # (or expiry), there are only ever a handful
+    responses = _keys(resource)[0]
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hset(responses, etag, content)
+        pipe.expire(responses, settings.HTTP_CACHE_TTL_S)
+        pipe.execute()
+    except redis.RedisError:
+        pass
+
+
+def invalidate(resource):
+    # Called on every write to the resource's table
+    responses, changed_at = _keys(resource)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.delete(responses)
+        pipe.set(changed_at, time.time())
+        pipe.execute()
+    except redis.RedisError:
+        pass
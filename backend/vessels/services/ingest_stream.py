@@ -0,0 +1,312 @@
+"""
+Durable buffer between the AIS reader and processing (AIS_BUFFER=stream)
+The reader only appends raw messages to a fixed number of Redis Streams,
+ais:stream:{shard} with shard = crc32(mmsi) % AIS_STREAM_SHARDS, so one
+vessel's reports stay in one stream, in order. The count is recorded in
+Redis and checked by everything that opens the streams, another count would
+look for a vessel's reports in the wrong stream. Processors, the reader's
+--workers or separate ingest_ais --consume --shard K --shards N processes,
+take the streams with shard % N == K and read them through a consumer group,
+acking a batch once it's processed. A burst piles up in Redis instead of
+backing up the websocket, and processors can be restarted or rescaled
+without the reader: whoever takes a stream over picks up what was read from
+it and never acked. Run one set of processors at a time, two reading the
+same stream would process a vessel's reports out of order.
+Delivery is at least once. A batch that failed, or was in flight when its
+processor died, is processed again; positions already stored are skipped
+then (Command.process_batch), zone alerts and broadcasts may go out twice.
+Streams are trimmed to about maxlen entries, processors further behind than
+that lose the oldest ones. MemoryStreamBuffer does the same in one process,
+for tests
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import count
+
+import redis
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from vessels.services import fastjson
+from vessels.services.ingest_workers import shard_for
+from vessels.services.redis_client import get_redis
+
+
+# Times a batch is retried before it's acked and dropped, so one bad message
+# can't hold its streams up forever
+MAX_ATTEMPTS = 3
+
+# Every processor reads under the same consumer name, so the entries one
+# left pending go to whichever processor owns that stream next
+CONSUMER = "processor"
+
+
+def streams_for(processor, processors, shards):
+    # The streams processor K of N reads
+    return [shard for shard in range(shards) if shard % processors == processor]
+
+
+class RedisStreamBuffer:
+
+    def __init__(self, client, shards, prefix="ais:stream", group="ingest", maxlen=100000):
+        self.client = client
+        self.shards = shards
+        self.prefix = prefix
+        self.group = group
+        self.maxlen = maxlen
+
+    def key(self, shard):
+        return f"{self.prefix}:{shard}"
+
+    def setup(self):
+        # The first one up records the stream count, anyone set up for a
+        # different count is turned away rather than reading the wrong streams
+        count_key = f"{self.prefix}:shards"
+        self.client.set(count_key, self.shards, nx=True)
+        recorded = int(self.client.get(count_key))
+        if recorded != self.shards:
+            raise ImproperlyConfigured(
+                f"{self.prefix} has {recorded} streams, not {self.shards}. Set AIS_STREAM_SHARDS={recorded}, "
+                f"or let processors drain the streams and delete {count_key} first"
+            )
+        # Consumer groups start at the beginning of the stream, so whatever
+        # was appended before the first processor came up still gets read
+        for shard in range(self.shards):
+            try:
+                self.client.xgroup_create(self.key(shard), self.group, id="0", mkstream=True)
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    def append(self, items):
+        # [(mmsi, raw)], one round trip for the lot
+        appended_at = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        for mmsi, raw in items:
+            pipe.xadd(
+                self.key(shard_for(mmsi, self.shards)), {"m": raw, "t": appended_at},
+                maxlen=self.maxlen, approximate=True,
+            )
+        pipe.execute()
+        return len(items)
+
+    def read(self, shards, consumer, count, block_ms=None, pending=False):
+        # [(shard, id, raw, appended_at)], up to count new entries per
+        # stream, or with pending=True the ones read before but never acked
+        keys = {self.key(shard): shard for shard in shards}
+        response = self.client.xreadgroup(
+            self.group, consumer, {key: "0" if pending else ">" for key in keys}, count=count,
+            block=None if pending else block_ms,
+        )
+        result = []
+        for key, entries in response or []:
+            shard = keys[key.decode() if isinstance(key, bytes) else key]
+            # Pending entries that were trimmed away come back without fields
+            gone = [entry_id for entry_id, fields in entries if not fields]
+            if gone:
+                self.ack(shard, gone)
+            result.extend(
+                (shard, entry_id, fields[b"m"], float(fields[b"t"])) for entry_id, fields in entries if fields
+            )
+        return result
+
+    def ack(self, shard, ids):
+        if ids:
+            self.client.xack(self.key(shard), self.group, *ids)
+
+    def lag(self, shard):
+        # Entries not read yet, read but not acked, and how long the oldest
+        # unread one has been waiting
+        key = self.key(shard)
+        group = next((g for g in self.client.xinfo_groups(key) if g["name"].decode() == self.group), None)
+        if group is None:
+            return {"lag": self.client.xlen(key), "pending": 0, "age_s": 0.0}
+        # Redis can't tell the lag once unread entries were trimmed, the
+        # whole stream is the upper bound
+        lag = group.get("lag")
+        if lag is None:
+            lag = self.client.xlen(key)
+        age = 0.0
+        if lag:
+            oldest = self.client.xrange(key, min=f"({group['last-delivered-id'].decode()}", count=1)
+            if oldest:
+                age = max(0.0, time.time() - float(oldest[0][1][b"t"]))
+        return {"lag": lag, "pending": group["pending"], "age_s": round(age, 3)}
+
+
+class MemoryStreamBuffer:
+    # Same interface, in this process
+
+    def __init__(self, shards, maxlen=100000):
+        self.shards = shards
+        self.streams = [deque(maxlen=maxlen) for _ in range(shards)]
+        self.delivered = [0] * shards
+        self.pending = [OrderedDict() for _ in range(shards)]
+        self.ids = count(1)
+        self.changed = threading.Condition()
+
+    def setup(self):
+        pass
+
+    def append(self, items):
+        appended_at = time.time()
+        with self.changed:
+            for mmsi, raw in items:
+                self.streams[shard_for(mmsi, self.shards)].append((next(self.ids), raw, appended_at))
+            self.changed.notify_all()
+        return len(items)
+
+    def _unread(self, shard):
+        return [entry for entry in self.streams[shard] if entry[0] > self.delivered[shard]]
+
+    def read(self, shards, consumer, count, block_ms=None, pending=False):
+        with self.changed:
+            if pending:
+                return [
+                    (shard, entry_id, *entry)
+                    for shard in shards
+                    for entry_id, entry in list(self.pending[shard].items())[:count]
+                ]
+            if block_ms and not any(self._unread(shard) for shard in shards):
+                self.changed.wait(block_ms / 1000)
+            result = []
+            for shard in shards:
+                entries = self._unread(shard)[:count]
+                for entry_id, raw, appended_at in entries:
+                    self.pending[shard][entry_id] = (raw, appended_at)
+                    result.append((shard, entry_id, raw, appended_at))
+                if entries:
+                    self.delivered[shard] = entries[-1][0]
+            return result
+
+    def ack(self, shard, ids):
+        with self.changed:
+            for entry_id in ids:
+                self.pending[shard].pop(entry_id, None)
+
+    def lag(self, shard):
+        with self.changed:
+            unread = self._unread(shard)
+            age = time.time() - unread[0][2] if unread else 0.0
+            return {"lag": len(unread), "pending": len(self.pending[shard]), "age_s": round(age, 3)}
+
+
+class StreamSource:
+    # Batches for one processor, from the streams it owns. It starts with
+    # whatever was read from them before and never acked, then reads new
+    # entries. A batch that fails is handed over again, up to MAX_ATTEMPTS
+    # times. replay_since is set when a batch may have been processed before
+
+    def __init__(self, buffer, shards, batch_size, block_ms=1000, control=None):
+        self.buffer = buffer
+        self.shards = list(shards)
+        # Per stream, so a batch is still about batch_size messages
+        self.count = max(1, -(-batch_size // len(self.shards)))
+        self.block_ms = block_ms
+        # The reader's stop signal (a None) comes over this queue
+        self.control = control
+        self.recovering = True
+        self.ids = []
+        self.batch = []
+        self.attempts = 0
+        self.oldest = None
+        self.replay_since = None
+
+    def owns(self, mmsi):
+        return shard_for(mmsi, self.buffer.shards) in self.shards
+
+    def get(self, timeout):
+        if self.control is not None and not self.control.empty() and self.control.get_nowait() is None:
+            return None
+        if self.ids:
+            # Give whatever made the last attempt fail a moment to clear
+            time.sleep(min(timeout, 1.0))
+            self.replay_since = self.oldest
+            return self.batch
+        block_ms = max(1, int(min(timeout * 1000, self.block_ms)))
+        entries = []
+        if self.recovering:
+            entries = self.buffer.read(self.shards, CONSUMER, self.count, pending=True)
+            self.recovering = bool(entries)
+        recovered = bool(entries)
+        if not entries:
+            entries = self.buffer.read(self.shards, CONSUMER, self.count, block_ms=block_ms)
+        # Lag is measured on this process's monotonic clock like the other
+        # sources, from the wall clock time the reader appended at
+        now, wall = time.monotonic(), time.time()
+        self.ids = [(shard, entry_id) for shard, entry_id, _, _ in entries]
+        self.batch = [(now - max(0.0, wall - appended_at), raw) for _, _, raw, appended_at in entries]
+        self.oldest = min((appended_at for _, _, _, appended_at in entries), default=None)
+        self.replay_since = self.oldest if recovered else None
+        self.attempts = 0
+        return self.batch
+
+    def done(self, ok):
+        # True once the batch is finished with (acked), False if it'll be retried
+        self.attempts += 1
+        if not ok and self.attempts < MAX_ATTEMPTS:
+            return False
+        by_shard = {}
+        for shard, entry_id in self.ids:
+            by_shard.setdefault(shard, []).append(entry_id)
+        for shard, ids in by_shard.items():
+            self.buffer.ack(shard, ids)
+        self.ids, self.batch = [], []
+        return True
+
+    def backlog(self):
+        try:
+            return sum(self.buffer.lag(shard)["lag"] for shard in self.shards)
+        except redis.RedisError:
+            return "?"
+
+
+class StaticRelay:
+    # Stands in for the SnapshotPublisher in a stream processor. The reader
+    # keeps the snapshot up with the delta log (SnapshotPublisher.follow),
+    # which has every broadcast row but not static data, so that comes back
+    # through a capped Redis list the reader drains
+
+    def __init__(self, client, key, maxlen=10000):
+        self.client = client
+        self.key = key
+        self.maxlen = maxlen
+        self.rows = []
+
+    def update(self, rows, seq=None):
+        if seq is None:
+            self.rows.extend(rows)
+
+    def maybe_publish(self):
+        if self.rows:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.rpush(self.key, *[fastjson.dumps(row) for row in self.rows])
+            pipe.ltrim(self.key, -self.maxlen, -1)
+            pipe.execute()
+            self.rows = []
+
+    def warm(self):
+        return 0
+
+    def drain(self, count=1000):
+        # The reader's side, everything pushed so far, oldest first
+        rows = []
+        while True:
+            texts = self.client.lpop(self.key, count)
+            rows.extend(fastjson.loads(text) for text in texts or [])
+            if not texts or len(texts) < count:
+                return rows
+
+
+def open_stream_buffer():
+    return RedisStreamBuffer(
+        get_redis(), settings.AIS_STREAM_SHARDS,
+        prefix=settings.AIS_STREAM_PREFIX,
+        group=settings.AIS_STREAM_GROUP,
+        maxlen=settings.AIS_STREAM_MAXLEN,
+    )
+
+
+def open_static_relay():
+    return StaticRelay(get_redis(), f"{settings.AIS_STREAM_PREFIX}:static")
@@ -0,0 +1,227 @@
+"""
+Sharded ingestion: one reader process, N worker processes
+The reader (ingest_ais --workers N) owns the feed and hands every message to
+worker crc32(mmsi) % N, so a vessel is always handled by the same process,
+in arrival order, and its cache entry and zone membership live in one place.
+Workers parse, write, zone check and broadcast through the channel layer in
+parallel. The rows they broadcast come back to the reader, which keeps
+publishing the one fleet snapshot. With AIS_BUFFER=stream the reader puts
+messages on Redis Streams instead (see ingest_stream), workers each read
+their share of those and the reader follows the snapshot from the delta log
+"""
+import asyncio
+import multiprocessing
+import queue
+import threading
+import time
+import zlib
+
+
+def shard_for(mmsi, shards):
+    # Stable across processes, unlike hash()
+    return zlib.crc32(str(mmsi).encode()) % shards
+
+
+class SnapshotForwarder:
+    # Stands in for the SnapshotPublisher inside a worker, rows go back to
+    # the reader instead of into a snapshot of just this shard
+
+    def __init__(self, results, shard=None):
+        self.results = results
+        self.shard = shard
+
+    def update(self, rows, seq=None):
+        self.results.put(("rows", rows, seq, self.shard))
+
+    def maybe_publish(self):
+        pass
+
+    def warm(self):
+        return 0
+
+
+class InboxSource:
+    # Batches the reader dispatched straight to this worker, a None stops it
+
+    # Nothing is handed over twice
+    replay_since = None
+
+    def __init__(self, inbox, shard, shards):
+        self.inbox = inbox
+        self.shard = shard
+        self.shards = shards
+
+    def owns(self, mmsi):
+        return shard_for(mmsi, self.shards) == self.shard
+
+    def get(self, timeout):
+        try:
+            return self.inbox.get(timeout=timeout)
+        except queue.Empty:
+            return []
+
+    def done(self, ok):
+        # Nothing to retry, a failed batch is dropped
+        return True
+
+    def backlog(self):
+        return self.inbox.qsize()
+
+
+def worker_main(shard, shards, inbox, results, options):
+    # Worker process entry point. Workers are spawned rather than forked, so
+    # Django (and its DB and Redis connections) start fresh in each
+    import django
+    from django.conf import settings
+
+    if options.get("db_name"):
+        settings.DATABASES["default"]["NAME"] = options["db_name"]
+    # Settings the parent overrode at runtime (the benchmark's scratch Redis)
+    for name, value in options.get("settings", {}).items():
+        setattr(settings, name, value)
+    django.setup()
+
+    from vessels.management.commands.ingest_ais import Command
+    from vessels.services.ingest_stream import (
+        StreamSource, open_static_relay, open_stream_buffer, streams_for,
+    )
+
+    command = Command()
+    command.verbosity = options.get("verbosity", 1)
+    snapshot = None
+    if options.get("stream"):
+        # The inbox only carries the stop signal then
+        buffer = open_stream_buffer()
+        source = StreamSource(
+            buffer, streams_for(shard, shards, buffer.shards), options["batch_size"], control=inbox,
+        )
+        snapshot = open_static_relay()
+        command.queue_size = settings.AIS_STREAM_MAXLEN
+    else:
+        source = InboxSource(inbox, shard, shards)
+        # Counted in batches here
+        command.queue_size = options["inbox_batches"]
+    try:
+        command.run_worker(
+            shard, source, results, parent=multiprocessing.parent_process(), snapshot=snapshot,
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerPool:
+    # The reader's side: per worker buffers that go out as one batch per
+    # batch_size messages or flush_interval, bounded inboxes for
+    # backpressure, and a thread folding worker results back in
+
+    def __init__(self, shards, batch_size, flush_interval, queue_size, on_rows, options=None):
+        self.shards = shards
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_rows = on_rows
+        self.context = multiprocessing.get_context("spawn")
+        # Inboxes hold batches, sized so all of them together hold about queue_size messages
+        inbox_batches = max(2, queue_size // (batch_size * shards))
+        self.options = {**(options or {}), "inbox_batches": inbox_batches, "batch_size": batch_size}
+        self.inboxes = [self.context.Queue(maxsize=inbox_batches) for _ in range(shards)]
+        self.results = self.context.Queue()
+        self.processes = [None] * shards
+        self.buffers = [[] for _ in range(shards)]
+        self.buffered_at = [0.0] * shards
+        self.ready = set()
+        self.dispatched = [0] * shards
+        self.processed = [0] * shards
+        self.failed = [0] * shards
+        self.restarts = 0
+
+    def start(self):
+        for shard in range(self.shards):
+            self._spawn(shard)
+        threading.Thread(target=self._drain, daemon=True).start()
+
+    def _spawn(self, shard):
+        process = self.context.Process(
+            target=worker_main,
+            args=(shard, self.shards, self.inboxes[shard], self.results, self.options),
+            name=f"ingest-worker-{shard}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[shard] = process
+
+    def wait_ready(self, timeout=120):
+        deadline = time.monotonic() + timeout
+        while len(self.ready) < self.shards:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{self.shards - len(self.ready)} workers didn't start")
+            time.sleep(0.05)
+
+    def _drain(self):
+        while True:
+            kind, *payload = self.results.get()
+            if kind == "rows":
+                self.on_rows(*payload)
+            elif kind == "processed":
+                shard, count, failed = payload
+                self.processed[shard] += count
+                self.failed[shard] += failed
+            elif kind == "ready":
+                self.ready.add(payload[0])
+
+    async def put(self, mmsi, received, raw):
+        shard = shard_for(mmsi, self.shards)
+        buffer = self.buffers[shard]
+        if not buffer:
+            self.buffered_at[shard] = received
+        buffer.append((received, raw))
+        if len(buffer) >= self.batch_size:
+            await self.send(shard)
+
+    async def send(self, shard):
+        batch, self.buffers[shard] = self.buffers[shard], []
+        # A full inbox means that worker is behind, waiting here stops the
+        # reader pulling from the socket, same as the single process queue
+        while True:
+            try:
+                self.inboxes[shard].put_nowait(batch)
+                break
+            except queue.Full:
+                await asyncio.sleep(0.005)
+        self.dispatched[shard] += len(batch)
+
+    async def flush_loop(self):
+        # Send buffers that have waited flush_interval without filling up
+        while True:
+            await asyncio.sleep(self.flush_interval / 2)
+            now = time.monotonic()
+            for shard, buffer in enumerate(self.buffers):
+                if buffer and now - self.buffered_at[shard] >= self.flush_interval:
+                    await self.send(shard)
+
+    def check(self):
+        # Restart workers that died, their inbox (and anything in it) is kept
+        restarted = []
+        for shard, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                self.ready.discard(shard)
+                self._spawn(shard)
+                self.restarts += 1
+                restarted.append((shard, process.exitcode))
+        return restarted
+
+    def backlog(self):
+        # Messages sent to each worker it hasn't finished yet
+        return [d - p for d, p in zip(self.dispatched, self.processed)]
+
+    def stop(self, timeout=10):
+        for inbox in self.inboxes:
+            try:
+                inbox.put(None, timeout=1)
+            except queue.Full:
+                pass
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            if process is not None:
+                process.join(max(0, deadline - time.monotonic()))
+                if process.is_alive():
+                    process.terminate()
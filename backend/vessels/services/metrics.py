@@ -0,0 +1,261 @@
+"""
+Runtime metrics, rendered in the Prometheus text format
+Each process (web, ingest) counts into its own registry, which costs a dict
+update under a lock. The ingest processes push a snapshot to Redis every
+METRICS_PUSH_S, and /api/metrics/ renders its own registry plus the latest
+snapshot of every other live process, labelled with role and worker.
+Web processes don't push: their counters (websocket frames, connections,
+queries) come only from whichever web process answered the scrape, so with
+several web workers each one needs scraping on its own
+"""
+import json
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import redis
+from django.conf import settings
+
+from vessels.services.redis_client import get_redis
+
+
+PROCESSES_KEY = "metrics:processes"
+
+# Seconds, from half a millisecond up to a stalled flush
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {"kind": self.kind, "help": self.help, "labels": list(self.labels), "values": values}
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        # Per bucket counts (not cumulative until rendered), then the sum
+        key = self._key(labels)
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[slot] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(key), list(counts)] for key, counts in self._values.items()]
+        return {"kind": self.kind, "help": self.help, "labels": list(self.labels),
+                "buckets": list(self.buckets), "values": values}
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        self.role = "web"
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    @property
+    def worker(self):
+        # pid is read each time so a forked child doesn't report as its parent
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+registry = Registry()
+
+
+def counter(name, help, labels=()):
+    return registry.register(Counter(name, help, labels))
+
+
+def gauge(name, help, labels=()):
+    return registry.register(Gauge(name, help, labels))
+
+
+def histogram(name, help, labels=(), buckets=TIME_BUCKETS):
+    return registry.register(Histogram(name, help, labels, buckets))
+
+
+# Ingestion
+messages_received = counter("ais_messages_received_total", "AIS messages read from the feed", ["type"])
+messages_dropped = counter("ais_messages_dropped_total", "AIS messages thrown away, and why", ["type", "reason"])
+queue_depth = gauge("ais_queue_depth", "Messages waiting for the next ingest flush")
+queue_lag = histogram("ais_queue_lag_seconds", "Time the oldest message in a flush spent queued")
+batch_size = histogram("ais_batch_size", "Messages per ingest flush", buckets=SIZE_BUCKETS)
+stage_seconds = histogram("ingest_stage_seconds", "Time spent per ingest stage", ["stage"])
+stream_lag = gauge("ais_stream_lag", "Stream entries not read by a processor yet (AIS_BUFFER=stream)", ["shard"])
+stream_pending = gauge("ais_stream_pending", "Stream entries read but not acked yet", ["shard"])
+stream_age = gauge("ais_stream_age_seconds", "How long the oldest unread stream entry has waited", ["shard"])
+
+# Broadcast and fan-out
+broadcast_messages = counter("broadcast_messages_total", "Events sent to the channel layer", ["type"])
+broadcast_bytes = counter("broadcast_bytes_total", "Encoded size of events sent to the channel layer", ["type"])
+ws_connections = gauge("websocket_connections", "Connected VesselConsumer clients")
+ws_connections.set(0)
+ws_sent_messages = counter("websocket_sent_messages_total", "Frames sent to websocket clients", ["type"])
+# Characters for text frames, which is bytes for everything but the odd
+# non-ASCII ship name
+ws_sent_bytes = counter("websocket_sent_bytes_total", "Size of frames sent to websocket clients", ["type"])
+
+# Database
+db_query_seconds = histogram("db_query_seconds", "Database query time, _count is the query count", ["alias"])
+
+
+def timed_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        db_query_seconds.observe(time.perf_counter() - start, alias=context["connection"].alias)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    # connection_created receiver, every query on the connection is timed.
+    # It fires again on every reconnect (CONN_MAX_AGE) of the same wrapper,
+    # which already has it
+    if timed_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timed_query)
+
+
+def set_role(role):
+    registry.role = role
+
+
+def push():
+    # Publish this process's snapshot for whichever process gets scraped
+    entry = json.dumps({"at": time.time(), "role": registry.role, "metrics": registry.snapshot()})
+    try:
+        get_redis().hset(PROCESSES_KEY, registry.worker, entry)
+    except redis.RedisError:
+        pass
+
+
+def collect():
+    # {(role, worker): snapshot} for this process and every other one that
+    # pushed recently. Ones that stopped pushing are dropped
+    own = (registry.role, registry.worker)
+    processes = {own: registry.snapshot()}
+    stale_after = time.time() - max(60, 3 * settings.METRICS_PUSH_S)
+    try:
+        client = get_redis()
+        stale = []
+        for worker, raw in client.hgetall(PROCESSES_KEY).items():
+            worker = worker.decode()
+            entry = json.loads(raw)
+            if entry["at"] < stale_after:
+                stale.append(worker)
+            elif worker != own[1]:
+                processes[(entry["role"], worker)] = entry["metrics"]
+        if stale:
+            client.hdel(PROCESSES_KEY, *stale)
+    except redis.RedisError:
+        pass
+    return processes
+
+
+def _labels(names, values):
+    escaped = (
+        str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for v in values
+    )
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(processes):
+    # Prometheus text exposition (version 0.0.4)
+    names = {}
+    for snapshot in processes.values():
+        for name, metric in snapshot.items():
+            names.setdefault(name, metric)
+
+    lines = []
+    for name, first in names.items():
+        lines.append(f"# HELP {name} {first['help']}")
+        lines.append(f"# TYPE {name} {first['kind']}")
+        for (role, worker), snapshot in processes.items():
+            metric = snapshot.get(name)
+            if metric is None:
+                continue
+            label_names = ["role", "worker", *metric["labels"]]
+            for key, value in metric["values"]:
+                label_values = [role, worker, *key]
+                if metric["kind"] != "histogram":
+                    lines.append(f"{name}{_labels(label_names, label_values)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip([*metric["buckets"], "+Inf"], value[:-1]):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else _number(float(bound))
+                    lines.append(f"{name}_bucket{_labels([*label_names, 'le'], [*label_values, le])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(label_names, label_values)} {_number(float(value[-1]))}")
+                lines.append(f"{name}_count{_labels(label_names, label_values)} {cumulative}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,195 @@
+"""
+In-memory spatial index over ports and current vessel positions
+Points live in fixed lat/lng grid cells, so a radius or nearest query only
+looks at the cells around it instead of the whole fleet. Ports are rebuilt
+when their table version changes. Vessels follow what ingestion already
+publishes: the fleet snapshot, then the vessel_update deltas after its seq,
+so keeping up costs a Redis read of the new deltas rather than a query.
+Positions are as fresh as what clients see (moves under the coalescer's
+thresholds included), and a reload from the snapshot now and then drops
+deleted vessels
+"""
+import math
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+from vessels.models import Port
+from vessels.services import fastjson
+from vessels.services.broadcast import deltas_since
+from vessels.services.fanout import event_memo
+from vessels.services.snapshot import snapshot_cache
+from vessels.services.versions import table_version
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG = 111.195
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    # key -> (lat, lng) bucketed into cell_deg sized cells
+
+    def __init__(self, cell_deg=0.1):
+        self.cell_deg = cell_deg
+        self.points = {}
+        self.cells = {}
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def put(self, key, lat, lng):
+        old = self.points.get(key)
+        cell = self._cell(lat, lng)
+        if old is not None:
+            old_cell = self._cell(*old)
+            if old_cell != cell:
+                self._discard(old_cell, key)
+        self.points[key] = (lat, lng)
+        self.cells.setdefault(cell, set()).add(key)
+
+    def clear(self):
+        self.points.clear()
+        self.cells.clear()
+
+    def _discard(self, cell, key):
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self.cells[cell]
+
+    def _ring(self, lat, lng, lat_cells, lng_cells):
+        # Keys in the block of cells around (lat, lng)
+        row, col = self._cell(lat, lng)
+        for r in range(row - lat_cells, row + lat_cells + 1):
+            for c in range(col - lng_cells, col + lng_cells + 1):
+                yield from self.cells.get((r, c), ())
+
+    def _lng_cells(self, lat, km):
+        # Cells of longitude covering km at this latitude (and a bit either side)
+        cos_lat = math.cos(math.radians(min(89.0, abs(lat) + km / KM_PER_DEG)))
+        return int(math.ceil(km / (KM_PER_DEG * max(cos_lat, 1e-6) * self.cell_deg)))
+
+    def within(self, lat, lng, radius_km):
+        # [(distance_km, key)] inside radius_km, nearest first
+        lat_cells = int(math.ceil(radius_km / (KM_PER_DEG * self.cell_deg)))
+        found = []
+        for key in self._ring(lat, lng, lat_cells, self._lng_cells(lat, radius_km)):
+            distance = haversine_km(lat, lng, *self.points[key])
+            if distance <= radius_km:
+                found.append((distance, key))
+        found.sort()
+        return found
+
+    def nearest(self, lat, lng, ring_km=250.0):
+        # (distance_km, key) of the closest point, or None. Searches outwards
+        # one doubling radius at a time up to ring_km, past that the rings
+        # cover more cells than there are points so it's a plain scan
+        radius = KM_PER_DEG * self.cell_deg
+        while True:
+            radius = min(radius, ring_km)
+            hits = self.within(lat, lng, radius)
+            if hits:
+                return hits[0]
+            if radius >= ring_km:
+                break
+            radius *= 2
+        if not self.points:
+            return None
+        return min((haversine_km(lat, lng, *point), key) for key, point in self.points.items())
+
+
+class ProximityIndex:
+    # Ports and vessels for the proximity endpoints, refreshed lazily
+
+    def __init__(self, cell_deg=0.1, refresh_every=1.0, reload_every=60.0, nearest_ring_km=250.0):
+        self.ports = GridIndex(cell_deg)
+        self.vessels = GridIndex(cell_deg)
+        self.refresh_every = refresh_every
+        self.reload_every = reload_every
+        self.nearest_ring_km = nearest_ring_km
+        self._ports_version = None
+        # Last broadcast applied, None = load a snapshot next
+        self._seq = None
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        if not force and time.monotonic() - self._checked_at < self.refresh_every:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._checked_at = now
+            if force or now - self._loaded_at >= self.reload_every:
+                self._seq = None
+                self._snapshot = None
+            version = table_version(Port)
+            if version != self._ports_version:
+                self.ports.clear()
+                for pk, lat, lng in Port.objects.values_list("id", "latitude", "longitude"):
+                    self.ports.put(pk, lat, lng)
+                self._ports_version = version
+            self._refresh_vessels()
+
+    def _refresh_vessels(self):
+        deltas = None
+        if self._seq is not None:
+            try:
+                deltas = deltas_since(self._seq)
+            except redis.RedisError:
+                deltas = None
+        if deltas is None:
+            # Behind the delta buffer, counter reset, or first time round.
+            # Without Redis the snapshot comes from the DB, the same one
+            # isn't applied twice
+            text, seq = snapshot_cache.get()
+            if text is not self._snapshot:
+                self.vessels.clear()
+                self._put_rows(fastjson.loads(text)["vessels"])
+                self._snapshot = text
+                self._loaded_at = time.monotonic()
+            self._seq = seq
+            return
+        for text in deltas:
+            # Every delta starts {"seq":N, (broadcast.stamp), and is usually
+            # already decoded by this process's consumers
+            seq = int(text[7:text.index(",")])
+            event = event_memo.decoded(seq, text)
+            if event["type"] == "vessel_update":
+                self._put_rows(event["vessels"])
+            self._seq = seq
+
+    def _put_rows(self, rows):
+        for row in rows:
+            if row.get("latitude") is not None:
+                self.vessels.put(row["id"], row["latitude"], row["longitude"])
+
+    def vessels_near(self, lat, lng, radius_km):
+        self.refresh()
+        return self.vessels.within(lat, lng, radius_km)
+
+    def nearest_port(self, lat, lng):
+        self.refresh()
+        return self.ports.nearest(lat, lng, self.nearest_ring_km)
+
+
+proximity_index = ProximityIndex(
+    cell_deg=settings.PROXIMITY_CELL_DEG,
+    refresh_every=settings.PROXIMITY_REFRESH_S,
+    reload_every=settings.PROXIMITY_RELOAD_S,
+    nearest_ring_km=settings.PROXIMITY_NEAREST_RING_KM,
+)
@@ -0,0 +1,16 @@
+"""
+Shared Redis connection, same server as the channel layer
+"""
+import redis
+from django.conf import settings
+
+
+_client = None
+
+
+def get_redis():
+    # Connections are opened lazily by redis-py, so this is cheap to call
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+    return _client
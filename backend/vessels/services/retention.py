@@ -0,0 +1,219 @@
+"""
+Position history retention
+VesselPosition gets one row per AIS report, so without this it grows forever.
+History is handled in hour partitions by timestamp: the recent window keeps
+every report, older partitions are thinned to one point per vessel per
+bucket, and anything past the horizon is archived (optionally) and deleted.
+Deletes go in small id batches with a pause in between so the ingest
+process can keep writing while this runs
+"""
+import gzip
+import os
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from vessels.models import VesselLatestPosition, VesselPosition
+from vessels.services import fastjson
+from vessels.services.redis_client import get_redis
+
+
+# Everything older than this has already been downsampled
+WATERMARK_KEY = "vessels:retention:downsampled_until"
+
+PARTITION = timedelta(hours=1)
+
+ARCHIVE_FIELDS = ["id", "vessel_id", "latitude", "longitude", "speed", "heading", "course", "timestamp"]
+
+
+class RetentionPolicy:
+    # How long history is kept at each resolution
+
+    def __init__(self, full_res_hours, downsample_seconds, retention_days,
+                 archive_dir="", batch_size=5000, pause_ms=0):
+        self.full_res = timedelta(hours=full_res_hours)
+        # 0 turns either step off
+        self.bucket = downsample_seconds
+        self.horizon = timedelta(days=retention_days) if retention_days else None
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.pause = pause_ms / 1000
+
+    @classmethod
+    def from_settings(cls, **overrides):
+        # Policy from the POSITION_* settings, None overrides are ignored
+        options = {
+            "full_res_hours": settings.POSITION_FULL_RES_HOURS,
+            "downsample_seconds": settings.POSITION_DOWNSAMPLE_SECONDS,
+            "retention_days": settings.POSITION_RETENTION_DAYS,
+            "archive_dir": settings.POSITION_ARCHIVE_DIR,
+            "batch_size": settings.POSITION_PRUNE_BATCH,
+            "pause_ms": settings.POSITION_PRUNE_PAUSE_MS,
+        }
+        options.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(**options)
+
+
+def prune_positions(policy=None, now=None, dry_run=False, full_scan=False):
+    # Run the whole policy once, returns a report of what was reclaimed
+    policy = policy or RetentionPolicy.from_settings()
+    now = now or timezone.now()
+    started = time.monotonic()
+    report = {
+        "expired": 0,
+        "archived": 0,
+        "downsampled": 0,
+        "partitions": 0,
+        "dry_run": dry_run,
+    }
+
+    cutoff = now - policy.horizon if policy.horizon else None
+    if cutoff is not None:
+        report["expired"], report["archived"] = expire_positions(policy, cutoff, dry_run)
+
+    if policy.bucket:
+        report["downsampled"], report["partitions"] = downsample_positions(
+            policy, now - policy.full_res, cutoff, dry_run, full_scan,
+        )
+
+    report["remaining"] = VesselPosition.objects.count()
+    report["seconds"] = round(time.monotonic() - started, 2)
+    return report
+
+
+def format_report(report):
+    # One line summary for logs
+    verb = "Would reclaim" if report["dry_run"] else "Reclaimed"
+    return (
+        f"{verb} {report['expired'] + report['downsampled']} positions "
+        f"({report['expired']} expired, {report['archived']} archived, "
+        f"{report['downsampled']} downsampled over {report['partitions']} partitions), "
+        f"{report['remaining']} left, took {report['seconds']}s"
+    )
+
+
+def expire_positions(policy, cutoff, dry_run=False):
+    # Delete (and archive) everything older than cutoff, oldest first
+    expired = VesselPosition.objects.filter(timestamp__lt=cutoff)
+    if dry_run:
+        return expired.count(), 0
+
+    deleted = archived = 0
+    while True:
+        rows = list(expired.order_by("timestamp").values(*ARCHIVE_FIELDS)[:policy.batch_size])
+        if not rows:
+            break
+        if policy.archive_dir:
+            archived += archive_rows(policy.archive_dir, rows)
+        deleted += delete_ids(policy, [row["id"] for row in rows])
+    return deleted, archived
+
+
+def downsample_positions(policy, until, cutoff=None, dry_run=False, full_scan=False):
+    # Thin every hour partition older than `until` to one point per vessel
+    # per bucket. Partitions before the stored watermark are already done
+    start = None if full_scan else _watermark()
+    if cutoff is not None:
+        start = max(start, cutoff) if start else cutoff
+    if start is None:
+        first = VesselPosition.objects.order_by("timestamp").values_list("timestamp", flat=True).first()
+        if first is None:
+            return 0, 0
+        start = first
+    start = _floor_partition(start)
+
+    removed = partitions = 0
+    while start + PARTITION <= until:
+        end = start + PARTITION
+        # The first partition can straddle the horizon, expired rows aren't ours
+        for drop in _thin_partition(max(start, cutoff) if cutoff else start, end, policy.bucket, policy.batch_size):
+            removed += len(drop) if dry_run else delete_ids(policy, drop)
+        partitions += 1
+        if not dry_run:
+            get_redis().set(WATERMARK_KEY, end.timestamp())
+        start = end
+    return removed, partitions
+
+
+def _thin_partition(start, end, bucket, chunk_size):
+    # Ids to drop from one partition, keeping each vessel's first report in
+    # every bucket. Read in keyset pages and yielded a page at a time so a
+    # busy hour never sits in memory whole, and the caller can delete each
+    # chunk before the next page is read (it's all behind the key)
+    rows = (
+        VesselPosition.objects
+        .filter(timestamp__gte=start, timestamp__lt=end)
+        .order_by("vessel_id", "timestamp", "id")
+        .values_list("id", "vessel_id", "timestamp")
+    )
+    after = None
+    last = None
+    while True:
+        page = rows
+        if after is not None:
+            vessel_id, ts, pos_id = after
+            page = rows.filter(
+                Q(vessel_id__gt=vessel_id)
+                | Q(vessel_id=vessel_id, timestamp__gt=ts)
+                | Q(vessel_id=vessel_id, timestamp=ts, id__gt=pos_id)
+            )
+        page = list(page[:chunk_size])
+        if not page:
+            return
+        drop = []
+        for pos_id, vessel_id, ts in page:
+            key = (vessel_id, int(ts.timestamp()) // bucket)
+            if key == last:
+                drop.append(pos_id)
+            last = key
+        if drop:
+            # A vessel that went quiet has its newest report in here, and
+            # VesselLatestPosition still points at it
+            latest = set(VesselLatestPosition.objects.filter(position_id__in=drop).values_list("position_id", flat=True))
+            drop = [pos_id for pos_id in drop if pos_id not in latest]
+        if drop:
+            yield drop
+        pos_id, vessel_id, ts = page[-1]
+        after = (vessel_id, ts, pos_id)
+
+
+def delete_ids(policy, ids):
+    # Chunked delete, each chunk its own short transaction
+    deleted = 0
+    for i in range(0, len(ids), policy.batch_size):
+        chunk = ids[i:i + policy.batch_size]
+        deleted += VesselPosition.objects.filter(id__in=chunk).delete()[0]
+        if policy.pause:
+            time.sleep(policy.pause)
+    return deleted
+
+
+def archive_rows(archive_dir, rows):
+    # Append rows as gzipped NDJSON, one file per day
+    os.makedirs(archive_dir, exist_ok=True)
+    by_day = {}
+    for row in rows:
+        row["timestamp"] = row["timestamp"].astimezone(dt_timezone.utc)
+        by_day.setdefault(row["timestamp"].date(), []).append(row)
+    for day, day_rows in by_day.items():
+        path = os.path.join(archive_dir, f"positions-{day.isoformat()}.ndjson.gz")
+        # gzip members concatenate, so appending keeps the file readable
+        with gzip.open(path, "at") as f:
+            for row in day_rows:
+                f.write(fastjson.dumps({**row, "timestamp": row["timestamp"].isoformat()}) + "\n")
+    return len(rows)
+
+
+def _watermark():
+    value = get_redis().get(WATERMARK_KEY)
+    if value is None:
+        return None
+    return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+
+
+def _floor_partition(ts):
+    ts = ts.astimezone(dt_timezone.utc)
+    return ts.replace(minute=0, second=0, microsecond=0)
@@ -0,0 +1,144 @@
+"""
+Fast read path for list endpoints
+DRF serializers run every field of every row through its own to_representation,
+which adds up on 500 row pages. Each encoder here names the columns to pull
+with .values_list() (joins included, so no query per row) and turns one row
+into the exact dict its serializer in vessels/serializers.py would, so the
+rendered JSON is byte for byte the same
+"""
+import json
+
+from django.utils import timezone
+
+
+def drf_datetime(value):
+    # What DRF's DateTimeField renders: current timezone, ISO 8601, UTC as Z
+    if value is None:
+        return None
+    text = timezone.localtime(value).isoformat()
+    if text.endswith("+00:00"):
+        text = text[:-6] + "Z"
+    return text
+
+
+class RowEncoder:
+    # columns for values_list(), encode(row) -> serializer-shaped dict
+    columns = []
+
+    def encode(self, row):
+        raise NotImplementedError
+
+    def encode_all(self, rows):
+        encode = self.encode
+        return [encode(row) for row in rows]
+
+
+class VesselRows(RowEncoder):
+    # VesselSerializer, latest_position from the VesselLatestPosition join
+    columns = [
+        "id", "mmsi", "name", "ship_type", "weight_tonnage",
+        "flag", "length", "width", "destination", "created_at",
+        "latest__position_id", "latest__latitude", "latest__longitude",
+        "latest__speed", "latest__heading", "latest__course", "latest__timestamp",
+    ]
+
+    def encode(self, row):
+        (pk, mmsi, name, ship_type, weight_tonnage, flag, length, width,
+         destination, created_at, pos_id, lat, lng, speed, heading, course, ts) = row
+        return {
+            "id": pk,
+            "mmsi": mmsi,
+            "name": name,
+            "ship_type": ship_type,
+            "weight_tonnage": weight_tonnage,
+            "flag": flag,
+            "length": length,
+            "width": width,
+            "destination": destination,
+            "created_at": drf_datetime(created_at),
+            "latest_position": None if pos_id is None else {
+                "id": pos_id,
+                "latitude": lat,
+                "longitude": lng,
+                "speed": speed,
+                "heading": heading,
+                "course": course,
+                "timestamp": drf_datetime(ts),
+            },
+        }
+
+
+class ZoneRows(RowEncoder):
+    # ZoneSerializer
+    columns = ["id", "name", "polygon_json", "color", "created_at"]
+
+    def encode(self, row):
+        pk, name, polygon_json, color, created_at = row
+        return {
+            "id": pk,
+            "name": name,
+            "polygon": json.loads(polygon_json),
+            "color": color,
+            "created_at": drf_datetime(created_at),
+        }
+
+
+class AlertRows(RowEncoder):
+    # ZoneAlertSerializer
+    columns = ["id", "zone_id", "zone__name", "vessel_id", "vessel__name", "alert_type", "timestamp"]
+
+    def encode(self, row):
+        pk, zone_id, zone_name, vessel_id, vessel_name, alert_type, ts = row
+        return {
+            "id": pk,
+            "zone": zone_id,
+            "zone_name": zone_name,
+            "vessel": vessel_id,
+            "vessel_name": vessel_name,
+            "alert_type": alert_type,
+            "timestamp": drf_datetime(ts),
+        }
+
+
+class DroneRows(RowEncoder):
+    # DroneSimulationSerializer
+    columns = [
+        "id", "vessel_id", "vessel__name", "status",
+        "start_latitude", "start_longitude", "current_latitude", "current_longitude",
+        "target_latitude", "target_longitude", "created_at",
+    ]
+
+    def encode(self, row):
+        (pk, vessel_id, vessel_name, drone_status, start_lat, start_lng,
+         current_lat, current_lng, target_lat, target_lng, created_at) = row
+        return {
+            "id": pk,
+            "vessel": vessel_id,
+            "vessel_name": vessel_name,
+            "status": drone_status,
+            "start_latitude": start_lat,
+            "start_longitude": start_lng,
+            "current_latitude": current_lat,
+            "current_longitude": current_lng,
+            "target_latitude": target_lat,
+            "target_longitude": target_lng,
+            "created_at": drf_datetime(created_at),
+        }
+
+
+class PortRows(RowEncoder):
+    # PortSerializer
+    columns = ["id", "name", "country", "latitude", "longitude", "locode", "helcom_id", "created_at"]
+
+    def encode(self, row):
+        pk, name, country, lat, lng, locode, helcom_id, created_at = row
+        return {
+            "id": pk,
+            "name": name,
+            "country": country,
+            "latitude": lat,
+            "longitude": lng,
+            "locode": locode,
+            "helcom_id": helcom_id,
+            "created_at": drf_datetime(created_at),
+        }
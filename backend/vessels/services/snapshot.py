@@ -0,0 +1,197 @@
+"""
+Pre-encoded initial_data snapshot for websocket connects
+Ingestion keeps the whole fleet in memory, folds every flush into it and
+re-encodes it into Redis at most every SNAPSHOT_INTERVAL_MS. Consumers just
+send that text, so a reconnect storm costs no DB queries and no json.dumps
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from vessels.models import Vessel, VesselLatestPosition
+from vessels.services import fastjson
+from vessels.services.binary_codec import encode_frame
+from vessels.services.broadcast import current_seq, deltas_since
+from vessels.services.redis_client import get_redis
+
+
+SNAPSHOT_KEY = "vessels:snapshot"
+SNAPSHOT_SEQ_KEY = "vessels:snapshot:seq"
+
+# What a vessel looks like before its static data has arrived
+STATIC_DEFAULTS = {"flag": "", "length": 0, "width": 0, "destination": ""}
+
+
+def fleet_rows():
+    # Every vessel with its latest position, one query
+    vessels = []
+    for v in Vessel.objects.select_related("latest"):
+        try:
+            pos = v.latest
+        except VesselLatestPosition.DoesNotExist:
+            pos = None
+        vessel_data = {
+            "id": v.id,
+            "mmsi": v.mmsi,
+            "name": v.name,
+            "ship_type": v.ship_type,
+            "weight_tonnage": v.weight_tonnage,
+            "flag": v.flag,
+            "length": v.length,
+            "width": v.width,
+            "destination": v.destination,
+        }
+        if pos:
+            vessel_data["latitude"] = pos.latitude
+            vessel_data["longitude"] = pos.longitude
+            vessel_data["speed"] = pos.speed
+            vessel_data["heading"] = pos.heading
+            vessel_data["course"] = pos.course
+        vessels.append(vessel_data)
+    return vessels
+
+
+def encode_snapshot(vessels, seq):
+    return fastjson.dumps({
+        "type": "initial_data",
+        "seq": seq,
+        "vessels": vessels,
+    })
+
+
+class SnapshotPublisher:
+    # Lives in the ingest process
+
+    def __init__(self, interval_ms=None):
+        interval_ms = interval_ms or settings.SNAPSHOT_INTERVAL_MS
+        self.interval = interval_ms / 1000
+        self.vessels = {}
+        self.seq = 0
+        # shard -> seq every update from that shard up to has been merged,
+        # None when updates come from this process in order
+        self.floors = None
+        self.dirty = False
+        self._published_at = 0.0
+        # Updated from the ingest flush and the broadcast tick threads
+        self._lock = threading.Lock()
+
+    def warm(self):
+        # Seq is read first so the snapshot can't claim updates it doesn't have
+        with self._lock:
+            self.seq = current_seq()
+            self.vessels = {row["id"]: row for row in fleet_rows()}
+            self.dirty = True
+        self.publish()
+        return len(self.vessels)
+
+    def track_shards(self, shards):
+        # Sharded ingest: updates from different workers arrive out of seq
+        # order, so the highest seq seen isn't safe to claim, a lower one
+        # from another shard may still be on its way. Each shard's updates
+        # do arrive in order, so the snapshot claims the lowest of the
+        # shards' floors. Workers raise their floor after every tick (see
+        # run_worker), which also carries it past seqs that weren't
+        # vessel updates
+        with self._lock:
+            self.floors = {shard: self.seq for shard in range(shards)}
+
+    def update(self, rows, seq=None, shard=None):
+        # Merge vessel_update rows (or static data) into the fleet
+        with self._lock:
+            for row in rows:
+                existing = self.vessels.get(row["id"])
+                if existing is None:
+                    existing = self.vessels[row["id"]] = dict(STATIC_DEFAULTS)
+                existing.update(row)
+            if seq is not None:
+                if self.floors is not None and shard is not None:
+                    self.floors[shard] = max(self.floors[shard], seq)
+                    self.seq = min(self.floors.values())
+                else:
+                    self.seq = max(self.seq, seq)
+            self.dirty = True
+
+    def follow(self):
+        # For when the rows are broadcast by processes that don't report back
+        # (AIS_BUFFER=stream): merge the delta log after our seq instead. It's
+        # in seq order with no gaps, so the seq claimed is exactly what's in
+        deltas = deltas_since(self.seq)
+        if deltas is None:
+            # Further behind than DELTA_BUFFER_SIZE, start over from the DB
+            self.warm()
+            return
+        for text in deltas:
+            event = fastjson.loads(text)
+            self.update(event["vessels"] if event["type"] == "vessel_update" else [], event["seq"])
+
+    def maybe_publish(self):
+        if self.dirty and time.monotonic() - self._published_at >= self.interval:
+            self.publish()
+
+    def publish(self):
+        with self._lock:
+            text = encode_snapshot(list(self.vessels.values()), self.seq)
+            seq = self.seq
+            self._published_at = time.monotonic()
+            self.dirty = False
+        get_redis().mset({SNAPSHOT_KEY: text, SNAPSHOT_SEQ_KEY: seq})
+
+
+class SnapshotCache:
+    # Lives in the web process, every consumer gets the same string. It's
+    # re-read from Redis at most every SNAPSHOT_INTERVAL_MS, and built from
+    # the DB only if ingestion hasn't published one
+
+    def __init__(self, interval_ms=None):
+        interval_ms = interval_ms or settings.SNAPSHOT_INTERVAL_MS
+        self.interval = interval_ms / 1000
+        self.text = None
+        self.seq = 0
+        self._loaded_at = 0.0
+        self._rows = None
+        self._rows_for = None
+        self._binary = None
+        self._binary_for = None
+
+    def get(self):
+        # (text, seq) of the current snapshot
+        if self.text is not None and time.monotonic() - self._loaded_at < self.interval:
+            return self.text, self.seq
+        try:
+            data, seq = get_redis().mget(SNAPSHOT_KEY, SNAPSHOT_SEQ_KEY)
+        except Exception:
+            data = None
+        if data:
+            self.text, self.seq = data.decode(), int(seq or 0)
+        else:
+            self.seq = self._safe_seq()
+            self.text = encode_snapshot(fleet_rows(), self.seq)
+        self._loaded_at = time.monotonic()
+        return self.text, self.seq
+
+    def get_rows(self):
+        # Same snapshot as rows, decoded once per snapshot
+        text, seq = self.get()
+        if self._rows_for is not text:
+            self._rows = fastjson.loads(text)["vessels"]
+            self._rows_for = text
+        return self._rows, seq
+
+    def get_binary(self):
+        # Same snapshot as a binary frame, encoded once per snapshot
+        rows, seq = self.get_rows()
+        if self._binary_for is not self._rows_for:
+            self._binary = encode_frame("initial_data", seq, rows)
+            self._binary_for = self._rows_for
+        return self._binary, seq
+
+    @staticmethod
+    def _safe_seq():
+        try:
+            return current_seq()
+        except Exception:
+            return 0
+
+
+snapshot_cache = SnapshotCache()
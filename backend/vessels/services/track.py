@@ -0,0 +1,125 @@
+"""
+Track simplification for vessel history
+Douglas-Peucker, worked out one tree level at a time with numpy instead of
+one segment at a time. Every point gets the distance at which DP would
+keep it (capped by its parent's, so the ranking nests), which lets one pass
+answer both "simplify to N metres" and "simplify to at most N points"
+"""
+import math
+
+import numpy as np
+
+
+# Metres per degree, close enough for the distances DP compares
+METRES_PER_DEG_LAT = 110_574.0
+METRES_PER_DEG_LNG = 111_320.0
+
+
+def project(latitudes, longitudes):
+    # Equirectangular projection around the track's mean latitude, in metres
+    lat = np.asarray(latitudes, dtype=float)
+    lng = np.asarray(longitudes, dtype=float)
+    if not lat.size:
+        return lat, lng
+    scale = METRES_PER_DEG_LNG * math.cos(math.radians(float(lat.mean())))
+    return lng * scale, lat * METRES_PER_DEG_LAT
+
+
+def importance(x, y, floor=0.0):
+    # DP significance of every point in metres, endpoints are inf. Segments
+    # whose furthest point is within `floor` aren't split any further, their
+    # points stay at 0 (which also stops a parked vessel going quadratic)
+    n = len(x)
+    result = np.zeros(n)
+    if n == 0:
+        return result
+    result[[0, -1]] = np.inf
+
+    splits = np.array([0, n - 1])
+    pending = np.arange(1, n - 1)
+    while pending.size:
+        seg = np.searchsorted(splits, pending) - 1
+        a, b = splits[seg], splits[seg + 1]
+        dist = segment_distance(x, y, pending, a, b)
+
+        # Points of a segment are contiguous in pending, so reduceat per group
+        starts = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+        sizes = np.diff(np.r_[starts, len(pending)])
+        group_max = np.maximum.reduceat(dist, starts)
+        positions = np.arange(len(pending))
+        first_max = np.minimum.reduceat(
+            np.where(dist == np.repeat(group_max, sizes), positions, len(pending)), starts,
+        )
+
+        split = group_max > floor
+        chosen = pending[first_max[split]]
+        # Nest under the parent, the newer end of the segment
+        parent = np.minimum(result[a[first_max[split]]], result[b[first_max[split]]])
+        result[chosen] = np.minimum(group_max[split], parent)
+
+        # Drop settled segments and the new split points from pending
+        keep = np.repeat(split, sizes)
+        keep[first_max[split]] = False
+        pending = pending[keep]
+        splits = np.sort(np.concatenate([splits, chosen]))
+    return result
+
+
+def segment_distance(x, y, points, a, b):
+    # Distance from each point to its segment a-b (not the infinite line,
+    # tracks double back)
+    px, py = x[points], y[points]
+    ax, ay = x[a], y[a]
+    dx, dy = x[b] - ax, y[b] - ay
+    length_sq = dx * dx + dy * dy
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.where(length_sq > 0, ((px - ax) * dx + (py - ay) * dy) / length_sq, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def simplify(latitudes, longitudes, tolerance=None, max_points=None):
+    # Indices (in input order) of the points to keep
+    x, y = project(latitudes, longitudes)
+    n = len(x)
+    if n <= 2 or (tolerance is None and (max_points is None or max_points >= n)):
+        return np.arange(n)
+
+    # Without a tolerance, points exactly on the line (or a parked vessel
+    # repeating itself) still go
+    threshold = tolerance or 0.0
+    ranks = importance(x, y, floor=threshold)
+    keep = np.flatnonzero(ranks > threshold)
+    if max_points is not None and len(keep) > max_points:
+        # Highest ranked first, stable so ties keep the earlier point
+        order = np.argsort(-ranks[keep], kind="stable")
+        keep = np.sort(keep[order[:max(max_points, 2)]])
+    return keep
+
+
+def encode_polyline(latitudes, longitudes, precision=5):
+    # Google encoded polyline
+    factor = 10 ** precision
+    lat = np.round(np.asarray(latitudes, dtype=float) * factor).astype(np.int64)
+    lng = np.round(np.asarray(longitudes, dtype=float) * factor).astype(np.int64)
+    deltas = np.column_stack([np.diff(lat, prepend=0), np.diff(lng, prepend=0)]).ravel()
+
+    out = []
+    for value in deltas.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            out.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        out.append(chr(value + 63))
+    return "".join(out)
+
+
+def geojson_line(latitudes, longitudes, properties=None):
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "LineString",
+            "coordinates": [[lng, lat] for lat, lng in zip(latitudes, longitudes)],
+        },
+        "properties": properties or {},
+    }
@@ -0,0 +1,18 @@
+"""
+Cheap change detection for small tables
+A table's version is its row count plus its newest updated_at, so any
+create, edit or delete (from any process) gives a new version
+"""
+from django.db.models import Count, Max
+
+
+def table_stats(model):
+    # (row count, newest updated_at or None)
+    stats = model.objects.aggregate(count=Count("id"), updated=Max("updated_at"))
+    return stats["count"], stats["updated"]
+
+
+def table_version(model):
+    count, updated = table_stats(model)
+    updated = updated.timestamp() if updated else 0
+    return f"{count}-{updated:.6f}"
@@ -0,0 +1,127 @@
+"""
+Process-local MMSI -> vessel cache for AIS ingestion
+Almost every position report is for a vessel we've already seen, so this
+keeps the bits a position update needs in memory instead of asking the DB
+"""
+from collections import OrderedDict, namedtuple
+
+from vessels.models import Vessel
+
+
+# Just enough of a Vessel for positions, zone checks and broadcasts
+CachedVessel = namedtuple("CachedVessel", ["id", "mmsi", "name", "ship_type", "weight_tonnage"])
+
+CACHED_FIELDS = list(CachedVessel._fields)
+
+
+class VesselCache:
+    # LRU cache keyed by MMSI with hit/miss counters
+
+    def __init__(self, max_size=20000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def warm(self):
+        # Load the most recently created vessels, up to max_size
+        rows = Vessel.objects.order_by("-id").values_list(*CACHED_FIELDS)[:self.max_size]
+        for row in reversed(rows):
+            self._store(CachedVessel(*row))
+        return len(self._entries)
+
+    def get(self, mmsi):
+        entry = self._entries.get(mmsi)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(mmsi)
+        return entry
+
+    def put(self, vessel):
+        # Refresh the entry from a Vessel (or anything with the same fields)
+        entry = CachedVessel(*(getattr(vessel, f) for f in CACHED_FIELDS))
+        self._store(entry)
+        return entry
+
+    def invalidate(self, mmsi):
+        self._entries.pop(mmsi, None)
+
+    def drop_missing(self, entries):
+        # Forget cached vessels that have been deleted since (clear_vessels,
+        # the admin, another process), returns their MMSIs
+        ids = {entry.id: entry.mmsi for entry in entries}
+        alive = set(Vessel.objects.filter(id__in=ids).values_list("id", flat=True))
+        gone = [mmsi for vessel_id, mmsi in ids.items() if vessel_id not in alive]
+        for mmsi in gone:
+            self.invalidate(mmsi)
+        return gone
+
+    def clear(self):
+        self._entries.clear()
+
+    def resolve(self, mmsi, name, ship_type):
+        # Cached vessel for an MMSI, only touching the DB on a miss
+        entry = self.get(mmsi)
+        if entry is not None:
+            return entry
+        vessel, _ = Vessel.objects.get_or_create(
+            mmsi=mmsi,
+            defaults={"name": name, "ship_type": ship_type},
+        )
+        return self.put(vessel)
+
+    def resolve_many(self, new_vessels):
+        # Batch version of resolve, new_vessels maps mmsi -> (name, ship_type)
+        # Misses are looked up in one query and created with one bulk insert
+        resolved = {}
+        missing = []
+        for mmsi in new_vessels:
+            entry = self.get(mmsi)
+            if entry is None:
+                missing.append(mmsi)
+            else:
+                resolved[mmsi] = entry
+        if not missing:
+            return resolved
+
+        found = {row[1]: row for row in Vessel.objects.filter(mmsi__in=missing).values_list(*CACHED_FIELDS)}
+        to_create = [
+            Vessel(mmsi=mmsi, name=new_vessels[mmsi][0], ship_type=new_vessels[mmsi][1])
+            for mmsi in missing if mmsi not in found
+        ]
+        if to_create:
+            Vessel.objects.bulk_create(to_create, ignore_conflicts=True)
+            created = Vessel.objects.filter(mmsi__in=[v.mmsi for v in to_create]).values_list(*CACHED_FIELDS)
+            found.update({row[1]: row for row in created})
+
+        for mmsi, row in found.items():
+            resolved[mmsi] = self._store(CachedVessel(*row))
+        return resolved
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+    def _store(self, entry):
+        self._entries[entry.mmsi] = entry
+        self._entries.move_to_end(entry.mmsi)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return entry
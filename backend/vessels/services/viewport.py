@@ -0,0 +1,44 @@
+"""
+Per-client viewport filtering for vessel_update broadcasts
+A client zoomed into a harbour only needs updates for vessels it can see
+"""
+from django.conf import settings
+
+
+class Viewport:
+    # Map bounds as sent by mapbox getBounds(): west, south, east, north.
+    # The box is padded so vessels just off screen still move when panning
+
+    PADDING = 0.1
+
+    def __init__(self, west, south, east, north, zoom=None):
+        if not (west < east and south < north):
+            raise ValueError("Empty bounding box")
+        pad_lng = (east - west) * self.PADDING
+        pad_lat = (north - south) * self.PADDING
+        self.west = west - pad_lng
+        self.east = east + pad_lng
+        self.south = south - pad_lat
+        self.north = north + pad_lat
+        self.zoom = zoom
+
+    @classmethod
+    def from_message(cls, data):
+        # {"type": "subscribe_bbox", "bbox": [w, s, e, n], "zoom": z}.
+        # None means "send me everything" (zoomed out far enough to see
+        # the whole region anyway)
+        west, south, east, north = (float(v) for v in data["bbox"])
+        zoom = data.get("zoom")
+        zoom = float(zoom) if zoom is not None else None
+        if zoom is not None and zoom < settings.VIEWPORT_MIN_ZOOM:
+            return None
+        return cls(west, south, east, north, zoom)
+
+    def contains(self, latitude, longitude):
+        return self.south <= latitude <= self.north and self.west <= longitude <= self.east
+
+    def filter(self, vessels):
+        return [
+            v for v in vessels
+            if v.get("latitude") is not None and self.contains(v["latitude"], v["longitude"])
+        ]
@@ -1,91 +1,142 @@
 """
 Sees if a vessel has interacted with any zones
 """
-import json
-from shapely.geometry import Point, shape
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-
-from vessels.models import Zone, ZoneAlert, Vessel
-
-
-# Track which vessels are currently in which zones
-_vessel_zone_state = {}
+import numpy as np
+from vessels.models import ZoneAlert
+from vessels.services import metrics
+from vessels.services.broadcast import send_zone_alerts
+from vessels.services.zone_index import zone_index
+from vessels.services.zone_membership import get_store
 
 
+@metrics.stage_seconds.time(stage="check_vessel_zones")
 def check_vessel_zones(vessel, latitude, longitude):
     # See if a vessel has interacted with any zones
-    point = Point(longitude, latitude)
-    zones = Zone.objects.all()
-
-    if vessel.id not in _vessel_zone_state:
-        _vessel_zone_state[vessel.id] = set()
+    zone_index.refresh()
+    store = get_store()
+    previous_zones = store.get(vessel.id)
 
     current_zones = set()
-    alerts = []
-
-    for zone in zones:
-        try:
-            polygon_data = zone.get_polygon()
-            polygon = shape(polygon_data)
-
-            if polygon.contains(point):
-                current_zones.add(zone.id)
-
-                # Vessel just entered this zone
-                if zone.id not in _vessel_zone_state[vessel.id]:
-                    alert = ZoneAlert.objects.create(
-                        zone=zone,
-                        vessel=vessel,
-                        alert_type="enter",
-                    )
-                    alerts.append({
-                        "id": alert.id,
-                        "zone_id": zone.id,
-                        "zone_name": zone.name,
-                        "vessel_id": vessel.id,
-                        "vessel_name": vessel.name,
-                        "alert_type": "enter",
-                        "timestamp": alert.timestamp.isoformat(),
-                    })
-        except (json.JSONDecodeError, Exception):
-            continue
+    pending = []
+
+    for zone in zone_index.containing(longitude, latitude):
+        current_zones.add(zone.id)
+
+        # Vessel just entered this zone
+        if zone.id not in previous_zones:
+            pending.append((zone, vessel, "enter"))
 
     # Check for vessels that exited zones
-    exited_zones = _vessel_zone_state[vessel.id] - current_zones
-    for zone_id in exited_zones:
-        try:
-            zone = Zone.objects.get(id=zone_id)
-            alert = ZoneAlert.objects.create(
-                zone=zone,
-                vessel=vessel,
-                alert_type="exit",
-            )
-            alerts.append({
-                "id": alert.id,
-                "zone_id": zone.id,
-                "zone_name": zone.name,
-                "vessel_id": vessel.id,
-                "vessel_name": vessel.name,
-                "alert_type": "exit",
-                "timestamp": alert.timestamp.isoformat(),
-            })
-        except Zone.DoesNotExist:
-            pass
-
-    _vessel_zone_state[vessel.id] = current_zones
-
-    # Broadcast alerts via WebSocket
-    if alerts:
-        channel_layer = get_channel_layer()
-        for alert_data in alerts:
-            async_to_sync(channel_layer.group_send)(
-                "vessel_updates",
-                {
-                    "type": "zone_alert",
-                    "alert": alert_data,
-                }
-            )
+    for zone_id in previous_zones - current_zones:
+        # Deleted zones are gone from the index, nothing to exit
+        zone = zone_index.zones_by_id.get(zone_id)
+        if zone is not None:
+            pending.append((zone, vessel, "exit"))
+
+    if current_zones != previous_zones:
+        store.set_many({vessel.id: current_zones})
+
+    alerts = save_alerts(pending)
+    broadcast_alerts(alerts)
+    return alerts
+
+
+@metrics.stage_seconds.time(stage="check_vessel_zones")
+def check_vessel_zones_batch(vessels, latitudes, longitudes):
+    # Same as check_vessel_zones but for a whole ingest flush. Containment
+    # for every (vessel, zone) pair comes from one vectorized query, and
+    # enter/exit transitions from diffing against the previous membership
+    zone_index.refresh()
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+
+    # Alerts for the whole flush are written and sent together
+    pending = []
+    for rows in _rounds(vessels):
+        pending.extend(_evaluate_round(
+            [vessels[i] for i in rows], longitudes[rows], latitudes[rows],
+        ))
 
+    alerts = save_alerts(pending)
+    broadcast_alerts(alerts)
     return alerts
 
+
+def _rounds(vessels):
+    # Split a batch so each vessel shows up at most once per round, a vessel
+    # that reported twice in one flush is then diffed in the order it reported
+    seen = {}
+    rounds = []
+    for i, vessel in enumerate(vessels):
+        n = seen.get(vessel.id, 0)
+        seen[vessel.id] = n + 1
+        if n == len(rounds):
+            rounds.append([])
+        rounds[n].append(i)
+    return rounds
+
+
+def _evaluate_round(vessels, longitudes, latitudes):
+    store = get_store()
+    current = zone_index.containment_matrix(longitudes, latitudes)
+    previous = np.zeros_like(current)
+    had_state = np.zeros(len(vessels), dtype=bool)
+
+    stored = store.get_many([vessel.id for vessel in vessels])
+    for row, vessel in enumerate(vessels):
+        for zone_id in stored[vessel.id]:
+            had_state[row] = True
+            col = zone_index.columns.get(zone_id)
+            if col is not None:
+                previous[row, col] = True
+
+    entered = current & ~previous
+    exited = previous & ~current
+
+    transitions = sorted(
+        [(row, 0, col) for row, col in zip(*np.nonzero(entered))]
+        + [(row, 1, col) for row, col in zip(*np.nonzero(exited))]
+    )
+    pending = [
+        (zone_index.zones[col], vessels[row], "exit" if kind else "enter")
+        for row, kind, col in transitions
+    ]
+
+    changes = {}
+    for row in np.flatnonzero(current.any(axis=1) | had_state):
+        vessel_id = vessels[row].id
+        zone_ids = frozenset(zone_index.zones[col].id for col in np.flatnonzero(current[row]))
+        if zone_ids != stored[vessel_id]:
+            changes[vessel_id] = zone_ids
+    store.set_many(changes)
+
+    return pending
+
+
+def save_alerts(pending):
+    # Write (zone, vessel, alert_type) transitions in one bulk insert and
+    # return them as the dicts the frontend gets
+    if not pending:
+        return []
+    created = ZoneAlert.objects.bulk_create([
+        ZoneAlert(zone_id=zone.id, vessel_id=vessel.id, alert_type=alert_type)
+        for zone, vessel, alert_type in pending
+    ])
+    return [
+        {
+            "id": alert.id,
+            "zone_id": zone.id,
+            "zone_name": zone.name,
+            "vessel_id": vessel.id,
+            "vessel_name": vessel.name,
+            "alert_type": alert_type,
+            "timestamp": alert.timestamp.isoformat(),
+        }
+        for alert, (zone, vessel, alert_type) in zip(created, pending)
+    ]
+
+
+def broadcast_alerts(alerts):
+    # Broadcast alerts via WebSocket, all of them in one zone_alerts event
+    if alerts:
+        send_zone_alerts(alerts)
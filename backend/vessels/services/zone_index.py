@@ -0,0 +1,92 @@
+"""
+Compiled zone geometry for zone checks
+Zones are parsed and prepared once and kept in an STRtree, so a position
+report only bbox-tests against the tree instead of re-reading every zone
+"""
+import json
+import time
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from shapely.strtree import STRtree
+
+from vessels.models import Zone
+from vessels.services.versions import table_version
+
+
+class ZoneIndex:
+    # Zones are rebuilt when the Zone table version changes, which is
+    # checked at most every CHECK_EVERY seconds (or right away after
+    # invalidate(), which the Zone signals call in this process)
+
+    CHECK_EVERY = 2.0
+
+    def __init__(self):
+        self.zones = []
+        self.zones_by_id = {}
+        self.columns = {}
+        self._tree = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        self._checked_at = 0.0
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.CHECK_EVERY:
+            return
+        self._checked_at = now
+        version = table_version(Zone)
+        if version != self._version:
+            self._build()
+            self._version = version
+
+    def _build(self):
+        self.load(Zone.objects.all())
+
+    def load(self, zone_list):
+        # Compile the given zones, skipping any with a broken polygon
+        zones = []
+        geoms = []
+        for zone in zone_list:
+            try:
+                geom = shape(zone.get_polygon())
+            except (json.JSONDecodeError, Exception):
+                continue
+            if geom.is_empty:
+                continue
+            shapely.prepare(geom)
+            zones.append(zone)
+            geoms.append(geom)
+
+        self.zones = zones
+        self.zones_by_id = {zone.id: zone for zone in zones}
+        self.columns = {zone.id: col for col, zone in enumerate(zones)}
+        self._tree = STRtree(geoms) if geoms else None
+
+    def containing(self, longitude, latitude):
+        # Zones whose polygon contains the point
+        if self._tree is None:
+            return []
+        hits = self._tree.query(shapely.points(longitude, latitude), predicate="within")
+        return [self.zones[i] for i in hits]
+
+    def containment_matrix(self, longitudes, latitudes):
+        # points x zones boolean matrix, column order is self.zones
+        matrix = np.zeros((len(longitudes), len(self.zones)), dtype=bool)
+        if self._tree is not None and len(longitudes):
+            point_idx, zone_idx = self._query(longitudes, latitudes)
+            matrix[point_idx, zone_idx] = True
+        return matrix
+
+    def _query(self, longitudes, latitudes):
+        # The tree does the bbox filtering, the predicate runs against the
+        # prepared polygons, both in shapely's C loop
+        points = shapely.points(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float))
+        return self._tree.query(points, predicate="within")
+
+
+# Shared by everything in this process that checks zones
+zone_index = ZoneIndex()
@@ -0,0 +1,135 @@
+"""
+Which vessels are currently inside which zones
+The zone checker diffs against this to decide on enter/exit alerts. It can
+live in this process or in Redis so several ingest workers (and restarts)
+see the same state, and either way it's rebuilt from the latest ZoneAlert
+per (zone, vessel) when ingestion starts
+"""
+from django.conf import settings
+from django.db.models import Max
+
+from vessels.models import Vessel, ZoneAlert
+
+
+class MemoryMembershipStore:
+    # vessel id -> frozenset of zone ids, vessels in no zone aren't stored
+
+    def __init__(self):
+        self._zones = {}
+
+    def get(self, vessel_id):
+        return self._zones.get(vessel_id, frozenset())
+
+    def get_many(self, vessel_ids):
+        return {vessel_id: self._zones.get(vessel_id, frozenset()) for vessel_id in vessel_ids}
+
+    def set_many(self, changes):
+        # changes maps vessel id -> the zone ids it's in now
+        for vessel_id, zone_ids in changes.items():
+            if zone_ids:
+                self._zones[vessel_id] = frozenset(zone_ids)
+            else:
+                self._zones.pop(vessel_id, None)
+
+    def load(self, memberships):
+        self._zones = {}
+        self.set_many(memberships)
+
+    def clear(self):
+        self._zones = {}
+
+
+class RedisMembershipStore:
+    # One Redis hash, field = vessel id, value = comma separated zone ids.
+    # A batch is one HMGET and one pipelined write
+
+    KEY = "vessels:zone_membership"
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, vessel_id):
+        return self._decode(self.client.hget(self.KEY, vessel_id))
+
+    def get_many(self, vessel_ids):
+        vessel_ids = list(vessel_ids)
+        if not vessel_ids:
+            return {}
+        values = self.client.hmget(self.KEY, vessel_ids)
+        return {vessel_id: self._decode(value) for vessel_id, value in zip(vessel_ids, values)}
+
+    def set_many(self, changes):
+        if not changes:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        self._write(pipe, changes)
+        pipe.execute()
+
+    def load(self, memberships):
+        pipe = self.client.pipeline()
+        pipe.delete(self.KEY)
+        self._write(pipe, memberships)
+        pipe.execute()
+
+    def clear(self):
+        self.client.delete(self.KEY)
+
+    def _write(self, pipe, changes):
+        present = {
+            vessel_id: ",".join(str(z) for z in sorted(zone_ids))
+            for vessel_id, zone_ids in changes.items() if zone_ids
+        }
+        absent = [vessel_id for vessel_id, zone_ids in changes.items() if not zone_ids]
+        if present:
+            pipe.hset(self.KEY, mapping=present)
+        if absent:
+            pipe.hdel(self.KEY, *absent)
+
+    @staticmethod
+    def _decode(value):
+        if not value:
+            return frozenset()
+        return frozenset(int(z) for z in value.split(b","))
+
+
+def memberships_from_alerts():
+    # A vessel is in a zone if its latest alert for that zone is an "enter"
+    latest_ids = (
+        ZoneAlert.objects.values("zone_id", "vessel_id")
+        .annotate(last_id=Max("id"))
+        .values("last_id")
+    )
+    memberships = {}
+    rows = ZoneAlert.objects.filter(id__in=latest_ids, alert_type="enter").values_list("vessel_id", "zone_id")
+    for vessel_id, zone_id in rows:
+        memberships.setdefault(vessel_id, set()).add(zone_id)
+    return memberships
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        if settings.ZONE_MEMBERSHIP_BACKEND == "redis":
+            from vessels.services.redis_client import get_redis
+            _store = RedisMembershipStore(get_redis())
+        else:
+            _store = MemoryMembershipStore()
+    return _store
+
+
+def rebuild_store(owns=None):
+    # Called when ingestion starts, so a restart doesn't re-alert every
+    # vessel that was already inside a zone. A sharded worker only rewrites
+    # its own vessels (owns(mmsi)), the others are writing theirs to the
+    # same hash
+    memberships = memberships_from_alerts()
+    if owns is None:
+        get_store().load(memberships)
+        return len(memberships)
+
+    mine = [vessel_id for vessel_id, mmsi in Vessel.objects.values_list("id", "mmsi") if owns(mmsi)]
+    get_store().set_many({vessel_id: memberships.get(vessel_id, ()) for vessel_id in mine})
+    return sum(1 for vessel_id in mine if vessel_id in memberships)
@@ -0,0 +1,29 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Port, Zone
+
+
+@receiver([post_save, post_delete], sender=Zone)
+def zone_changed(sender, **kwargs):
+    # Rebuild the zone index on its next use instead of waiting
+    # for the periodic version check
+    from .services.zone_index import zone_index
+    from .services.http_cache import invalidate
+    zone_index.invalidate()
+    invalidate("zones")
+
+
+@receiver([post_save, post_delete], sender=Port)
+def port_changed(sender, **kwargs):
+    # Drop cached /api/ports/ responses
+    from .services.http_cache import invalidate
+    invalidate("ports")
+
+
+@receiver(connection_created)
+def instrument_queries(sender, connection, **kwargs):
+    # Count and time every query for /api/metrics/
+    from .services.metrics import instrument_connection
+    instrument_connection(sender, connection)
@@ -0,0 +1,18 @@
+from django.test import SimpleTestCase
+
+from vessels.benchmarks import fanout, viewports
+
+
+class BenchmarkSmokeTests(SimpleTestCase):
+    # The suites at a tiny size, so a change to what the consumer handlers
+    # expect can't leave `manage.py benchmark` broken
+
+    def test_viewports(self):
+        results = viewports.run({"clients": 3, "vessels": 40, "updates": 2, "batch": 10})
+        self.assertEqual(results["updates"], 2)
+        self.assertGreater(results["everything"]["bytes_total"], 0)
+        self.assertLessEqual(results["viewport"]["bytes_total"], results["everything"]["bytes_total"])
+
+    def test_fanout(self):
+        results = fanout.run({"clients": 2, "vessels": 5})
+        self.assertTrue(results)
@@ -0,0 +1,57 @@
+from django.test import SimpleTestCase
+
+from vessels.services.binary_codec import decode_frame, encode_frame
+
+
+def vessel(vessel_id, **fields):
+    row = {
+        "id": vessel_id, "mmsi": str(230000000 + vessel_id), "name": f"SHIP {vessel_id}",
+        "ship_type": "cargo", "weight_tonnage": 12000.0,
+        "latitude": 60.123456, "longitude": 24.654321, "speed": 12.3, "heading": 271.4, "course": 270.9,
+    }
+    row.update(fields)
+    return row
+
+
+class BinaryCodecTests(SimpleTestCase):
+
+    def test_vessel_update_round_trip(self):
+        vessels = [
+            vessel(1),
+            vessel(2, latitude=-0.000001, longitude=-179.999999, ship_type="tanker", name="ÅBO ÖRN"),
+            vessel(3, latitude=None, longitude=None),
+        ]
+        decoded = decode_frame(encode_frame("vessel_update", 42, vessels))
+
+        self.assertEqual((decoded["type"], decoded["seq"]), ("vessel_update", 42))
+        self.assertEqual(decoded["vessels"][0], vessels[0])
+        self.assertEqual(decoded["vessels"][1], vessels[1])
+        # No position: the position fields are left out, not zeroed
+        self.assertNotIn("latitude", decoded["vessels"][2])
+        self.assertEqual(decoded["vessels"][2]["mmsi"], "230000003")
+
+    def test_initial_data_carries_extras(self):
+        vessels = [vessel(1, length=199.9, width=32.2, flag="FI", destination="HELSINKI")]
+        decoded = decode_frame(encode_frame("initial_data", None, vessels))
+
+        self.assertEqual((decoded["type"], decoded["seq"]), ("initial_data", 0))
+        self.assertEqual(decoded["vessels"], vessels)
+
+    def test_lossy_fields_are_rounded_and_clamped(self):
+        vessels = [vessel(
+            1, heading=359.96, course=None, speed=9999, ship_type="unknown-type",
+            weight_tonnage=None, name="X" * 70000, mmsi=None,
+        )]
+        decoded = decode_frame(encode_frame("vessel_update", 1, vessels))["vessels"][0]
+
+        self.assertEqual(decoded["heading"], 0.0)
+        self.assertEqual(decoded["course"], 0.0)
+        self.assertEqual(decoded["speed"], 6553.5)
+        self.assertEqual(decoded["ship_type"], "other")
+        self.assertEqual(decoded["weight_tonnage"], 0.0)
+        self.assertEqual(len(decoded["name"]), 65535)
+        self.assertEqual(decoded["mmsi"], "")
+
+    def test_empty_frame(self):
+        decoded = decode_frame(encode_frame("vessel_update", 7, []))
+        self.assertEqual(decoded, {"type": "vessel_update", "seq": 7, "vessels": []})
@@ -0,0 +1,77 @@
+from django.test import SimpleTestCase
+
+from vessels.services.coalescer import UpdateCoalescer
+
+
+def row(vessel_id, lat=60.0, lng=24.0, speed=10.0, heading=90.0):
+    return {"id": vessel_id, "latitude": lat, "longitude": lng, "speed": speed, "heading": heading}
+
+
+class CoalescerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.coalescer = UpdateCoalescer(
+            self.send, tick_ms=500, min_distance_m=10, min_heading_deg=5, min_speed_kn=0.5,
+        )
+
+    def send(self, rows):
+        self.sent.append(rows)
+        return len(self.sent)
+
+    def test_offer_waits_for_flush_and_keeps_newest_row_per_vessel(self):
+        self.assertIsNone(self.coalescer.offer([row(1), row(2)]))
+        self.coalescer.offer([row(1, lat=60.01)])
+        self.assertEqual(self.sent, [])
+
+        rows, seq = self.coalescer.flush()
+        self.assertEqual(seq, 1)
+        self.assertEqual(sorted(r["id"] for r in rows), [1, 2])
+        self.assertEqual(next(r for r in rows if r["id"] == 1)["latitude"], 60.01)
+        self.assertEqual(self.coalescer.merged, 1)
+        self.assertEqual(self.coalescer.sent_rows, 2)
+        self.assertEqual(self.coalescer.sent_messages, 1)
+        # Nothing pending, nothing sent
+        self.assertIsNone(self.coalescer.flush())
+        self.assertEqual(len(self.sent), 1)
+
+    def test_small_changes_are_suppressed(self):
+        self.coalescer.offer([row(1)])
+        self.coalescer.flush()
+
+        # ~5 m, 2 degrees and 0.2 kn: under every threshold
+        self.coalescer.offer([row(1, lat=60.000045, heading=92, speed=10.2)])
+        self.assertIsNone(self.coalescer.flush())
+        self.assertEqual(self.coalescer.suppressed, 1)
+
+        # Any one threshold crossed goes out
+        for changed in (row(1, lat=60.0002), row(1, heading=100), row(1, speed=11)):
+            self.coalescer.offer([changed])
+            self.assertIsNotNone(self.coalescer.flush())
+
+    def test_heading_wraps_around(self):
+        self.coalescer.offer([row(1, heading=358)])
+        self.coalescer.flush()
+        self.coalescer.offer([row(1, heading=2)])
+        self.assertIsNone(self.coalescer.flush())
+
+    def test_suppressed_row_replaces_pending_one(self):
+        # Moved and then moved back before the tick: clients already have it
+        self.coalescer.offer([row(1)])
+        self.coalescer.flush()
+        self.coalescer.offer([row(1, lat=60.01)])
+        self.coalescer.offer([row(1)])
+        self.assertIsNone(self.coalescer.flush())
+
+    def test_forget_lets_the_next_row_through(self):
+        self.coalescer.offer([row(1)])
+        self.coalescer.flush()
+        self.coalescer.forget(1)
+        self.coalescer.offer([row(1)])
+        rows, _ = self.coalescer.flush()
+        self.assertEqual([r["id"] for r in rows], [1])
+
+    def test_zero_tick_sends_on_offer(self):
+        coalescer = UpdateCoalescer(self.send, tick_ms=0)
+        rows, seq = coalescer.offer([row(1)])
+        self.assertEqual(([r["id"] for r in rows], seq), ([1], 1))
@@ -0,0 +1,112 @@
+from unittest import mock
+
+import fakeredis
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+
+from vessels.consumers import VesselConsumer
+from vessels.services import broadcast, fastjson, redis_client
+from vessels.services.snapshot import encode_snapshot, snapshot_cache
+
+
+def vessel(vessel_id, lat, lng):
+    return {"id": vessel_id, "name": f"SHIP {vessel_id}", "latitude": lat, "longitude": lng}
+
+
+def make_consumer():
+    consumer = VesselConsumer()
+    consumer.viewport = None
+    consumer.binary = False
+    consumer.sent = []
+
+    async def send(text_data=None, bytes_data=None):
+        consumer.sent.append(fastjson.loads(text_data))
+    consumer.send = send
+    return consumer
+
+
+class ViewportSubscribeTests(SimpleTestCase):
+
+    def setUp(self):
+        self.consumer = make_consumer()
+        # One vessel off Helsinki, one south of Gotland
+        snapshot = encode_snapshot([vessel(1, 60.1, 24.9), vessel(2, 56.5, 18.5)], 42)
+        patcher = mock.patch.object(snapshot_cache, "get", return_value=(snapshot, 42))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def receive(self, **message):
+        async_to_sync(self.consumer.receive)(text_data=fastjson.dumps(message))
+        sent, self.consumer.sent = self.consumer.sent, []
+        return sent
+
+    def test_zooming_in_sends_the_vessels_already_there(self):
+        sent = self.receive(type="subscribe_bbox", bbox=[24.5, 59.9, 25.3, 60.3], zoom=10)
+        self.assertEqual([(m["type"], m["seq"]) for m in sent], [("viewport_data", 42)])
+        self.assertEqual([v["id"] for v in sent[0]["vessels"]], [1])
+
+    def test_zooming_out_of_a_viewport_sends_everything(self):
+        self.receive(type="subscribe_bbox", bbox=[24.5, 59.9, 25.3, 60.3], zoom=10)
+        sent = self.receive(type="subscribe_bbox", bbox=[10, 53, 30, 66], zoom=3)
+        self.assertIsNone(self.consumer.viewport)
+        self.assertEqual(sorted(v["id"] for v in sent[0]["vessels"]), [1, 2])
+
+        self.receive(type="subscribe_bbox", bbox=[24.5, 59.9, 25.3, 60.3], zoom=10)
+        sent = self.receive(type="unsubscribe_bbox")
+        self.assertEqual(sorted(v["id"] for v in sent[0]["vessels"]), [1, 2])
+
+    def test_no_slice_when_nothing_was_filtered(self):
+        self.assertEqual(self.receive(type="subscribe_bbox", bbox=[10, 53, 30, 66], zoom=3), [])
+        self.assertEqual(self.receive(type="unsubscribe_bbox"), [])
+
+
+@override_settings(DELTA_BUFFER_SIZE=4)
+class ResumeTests(SimpleTestCase):
+    # The real STAMP/SINCE scripts, on fakeredis's Lua
+
+    def setUp(self):
+        for target, name, value in (
+            (redis_client, "_client", fakeredis.FakeRedis()),
+            (broadcast, "_scripts", {}),
+            (broadcast, "get_channel_layer", mock.Mock(return_value=mock.Mock(group_send=mock.AsyncMock()))),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.consumer = make_consumer()
+
+    def broadcast(self, count):
+        return [broadcast.send_vessel_update([vessel(seq, 60.0, 24.0)]) for seq in range(count)]
+
+    def resume(self, since, snapshot_seq=None):
+        snapshot = encode_snapshot([], snapshot_seq if snapshot_seq is not None else broadcast.current_seq())
+        with mock.patch.object(snapshot_cache, "get", return_value=(snapshot, fastjson.loads(snapshot)["seq"])):
+            async_to_sync(self.consumer.resume)(since)
+        return [(m["type"], m["seq"]) for m in self.consumer.sent]
+
+    def test_resume_inside_the_buffer_replays_just_the_missed_deltas(self):
+        self.assertEqual(self.broadcast(5), [1, 2, 3, 4, 5])
+
+        self.assertEqual([fastjson.loads(t)["seq"] for t in broadcast.deltas_since(2)], [3, 4, 5])
+        self.assertEqual(broadcast.deltas_since(5), [])
+        self.assertEqual(self.resume(2), [("vessel_update", 3), ("vessel_update", 4), ("vessel_update", 5)])
+        # The replayed rows are the ones that went out
+        self.assertEqual(self.consumer.sent[0]["vessels"], [vessel(2, 60.0, 24.0)])
+
+    def test_resume_from_before_the_buffer_gets_a_snapshot(self):
+        self.broadcast(7)
+        # 4 kept: 4-7, so since=3 is the oldest that can be replayed
+        self.assertEqual(len(broadcast.deltas_since(3)), 4)
+        self.assertIsNone(broadcast.deltas_since(2))
+
+        # Snapshot at 6, then whatever came after it
+        self.assertEqual(self.resume(2, snapshot_seq=6), [("initial_data", 6), ("vessel_update", 7)])
+
+    def test_counter_reset_gets_a_snapshot(self):
+        self.broadcast(5)
+        # Redis was flushed, the counter starts over below the client's seq
+        redis_client.get_redis().flushdb()
+        self.broadcast(2)
+
+        self.assertIsNone(broadcast.deltas_since(5))
+        self.assertEqual(self.resume(5), [("initial_data", 2)])
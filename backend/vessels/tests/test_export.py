@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+import pyarrow as pa
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from vessels.models import Vessel, VesselPosition
+from vessels.services import export
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        vessel = Vessel.objects.create(mmsi="230000001", name="SHIP 1")
+        positions = VesselPosition.objects.bulk_create([
+            VesselPosition(vessel=vessel, latitude=60, longitude=24 + i / 100) for i in range(10)
+        ])
+        # Eight old rows, then two written just now
+        for i, position in enumerate(positions[:8]):
+            position.timestamp = timezone.now() - timedelta(minutes=10 - i)
+        VesselPosition.objects.bulk_update(positions[:8], ["timestamp"])
+        self.ids = [position.id for position in positions]
+
+    def test_safe_until_id_leaves_recent_rows(self):
+        self.assertEqual(export.safe_until_id(60), self.ids[7])
+        self.assertEqual(export.safe_until_id(0), self.ids[9])
+
+    def test_async_stream_matches_sync_stream(self):
+        queryset = export.export_queryset()
+
+        async def collect():
+            return [chunk async for chunk in export.astream_arrow(queryset, chunk_size=3)]
+
+        chunks = async_to_sync(collect)()
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b"".join(chunks), b"".join(export.stream_arrow(queryset, chunk_size=3)))
+
+    @override_settings(POSITION_EXPORT_LAG_S=60)
+    def test_endpoint_stops_at_the_lag(self):
+        response = self.client.get("/api/positions/export/", {"since_id": self.ids[2]})
+        self.assertEqual(response.status_code, 200)
+        body = async_to_sync(self.read)(response)
+        table = pa.ipc.open_stream(body).read_all()
+        self.assertEqual(table.column("position_id").to_pylist(), self.ids[3:8])
+
+    async def read(self, response):
+        return b"".join([chunk async for chunk in response])
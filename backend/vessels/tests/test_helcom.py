@@ -0,0 +1,29 @@
+from django.test import SimpleTestCase
+
+from vessels.services.helcom import build_ports
+
+
+BOUNDS = {"min_lat": 53, "max_lat": 66, "min_lng": 9, "max_lng": 31}
+
+
+def ids_by_place(ports):
+    return {(round(f["latitude"], 1), round(f["longitude"], 1)): helcom_id for helcom_id, f in ports.items()}
+
+
+class BuildPortsTests(SimpleTestCase):
+
+    def test_single_cluster_keeps_the_plain_id(self):
+        sites = [("FI HEL", "Helsinki", "Finland", 60.16, 24.95), ("FI HEL", "Helsinki", "Finland", 60.161, 24.951)]
+        self.assertEqual(list(build_ports(sites, 5, BOUNDS)), ["HELCOM-FI_HEL"])
+
+    def test_split_code_ids_follow_the_place_not_the_size(self):
+        west = [("SE XYZ", "Port", "Sweden", 58.0, 11.5)]
+        east = [("SE XYZ", "Port", "Sweden", 58.0, 18.0), ("SE XYZ", "Port", "Sweden", 58.001, 18.001)]
+        before = ids_by_place(build_ports(west + east, 5, BOUNDS))
+
+        # The west cluster grows past the east one and the file is reordered
+        more_west = [("SE XYZ", "Port", "Sweden", 58.002, 11.502 + i / 1000) for i in range(3)]
+        after = ids_by_place(build_ports(east + more_west + west, 5, BOUNDS))
+
+        self.assertEqual(after, before)
+        self.assertEqual(before[(58.0, 11.5)], "HELCOM-SE_XYZ-58.00_11.50")
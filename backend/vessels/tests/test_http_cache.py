@@ -0,0 +1,74 @@
+from io import StringIO
+from unittest import mock
+
+import fakeredis
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from vessels.models import Port, Zone
+from vessels.services import http_cache, redis_client
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(redis_client, "_client", fakeredis.FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Port.objects.create(name="Helsinki", latitude=60.16, longitude=24.95, helcom_id="HELCOM-FI_HEL")
+        Zone.objects.create(name="Harbour", polygon_json="{}")
+
+    def get(self, url, **headers):
+        return self.client.get(url, headers=headers)
+
+    def test_matching_etag_is_not_modified(self):
+        first = self.get("/api/ports/")
+        self.assertEqual(first.status_code, 200)
+
+        again = self.get("/api/ports/", **{"If-None-Match": first["ETag"]})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["ETag"], first["ETag"])
+        self.assertEqual(self.get("/api/ports/", **{"If-None-Match": '"other", ' + first["ETag"]}).status_code, 304)
+        self.assertEqual(self.get("/api/ports/", **{"If-None-Match": '"other"'}).status_code, 200)
+
+    def test_if_modified_since(self):
+        first = self.get("/api/zones/")
+        self.assertEqual(self.get("/api/zones/", **{"If-Modified-Since": first["Last-Modified"]}).status_code, 304)
+        self.assertEqual(
+            self.get("/api/zones/", **{"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"}).status_code, 200,
+        )
+
+    def test_writes_give_a_new_etag(self):
+        for url, write in (
+            ("/api/ports/", lambda: Port.objects.create(
+                name="Turku", latitude=60.43, longitude=22.22, helcom_id="HELCOM-FI_TKU",
+            )),
+            ("/api/zones/", lambda: Zone.objects.filter(name="Harbour").delete()),
+        ):
+            etag = self.get(url)["ETag"]
+            write()
+            response = self.get(url, **{"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response["ETag"], etag)
+
+    def test_ingest_helcom_gives_a_new_etag(self):
+        etag = self.get("/api/ports/")["ETag"]
+        call_command("ingest_helcom", stdout=StringIO())
+        response = self.get("/api/ports/", **{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], Port.objects.count())
+        self.assertGreater(Port.objects.count(), 1)
+
+    def test_cached_body_is_reused_until_the_version_changes(self):
+        first = self.get("/api/ports/")
+        self.assertEqual(http_cache.get_rendered("ports", first["ETag"]), first.content)
+        self.assertEqual(self.get("/api/ports/").content, first.content)
+
+        # Written without signals (another process, a bulk update), so
+        # nothing invalidated the stored body, the version still moves on
+        Port.objects.update(name="Helsingfors", updated_at=timezone.now())
+        self.assertIsNotNone(http_cache.get_rendered("ports", first["ETag"]))
+        response = self.get("/api/ports/")
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        self.assertEqual([port["name"] for port in response.json()["results"]], ["Helsingfors"])
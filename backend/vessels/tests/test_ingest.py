@@ -0,0 +1,70 @@
+import queue
+import time
+
+from django.test import TransactionTestCase
+
+from vessels.management.commands import ingest_ais
+from vessels.models import Vessel, VesselLatestPosition, VesselPosition
+from vessels.services.ingest_workers import SnapshotForwarder
+
+
+def position_msg(mmsi, lat, lng, sog=5.0):
+    return {
+        "MessageType": "PositionReport",
+        "MetaData": {"MMSI": mmsi, "latitude": lat, "longitude": lng, "ShipName": f"SHIP {mmsi}"},
+        "Message": {"PositionReport": {"Sog": sog, "Cog": 90, "TrueHeading": 511}},
+    }
+
+
+class IngestCommand(ingest_ais.Command):
+    # Snapshot rows go to a queue instead of Redis
+    def __init__(self):
+        super().__init__()
+        self.snapshot = SnapshotForwarder(queue.Queue())
+
+
+class DeletedVesselTests(TransactionTestCase):
+    # Committed as it goes, SQLite only checks foreign keys at commit
+
+    def setUp(self):
+        ingest_ais.vessel_cache.clear()
+        self.command = IngestCommand()
+
+    def test_batch_recovers_from_deleted_cached_vessel(self):
+        self.command.process_batch([position_msg(230000001, 60.0, 24.0)])
+        old_id = ingest_ais.vessel_cache.get("230000001").id
+
+        # clear_vessels in another process, the cache still has the old id
+        Vessel.objects.all().delete()
+        self.command.process_batch([position_msg(230000001, 60.1, 24.1), position_msg(230000002, 60.2, 24.2)])
+
+        vessel = Vessel.objects.get(mmsi="230000001")
+        self.assertNotEqual(vessel.id, old_id)
+        self.assertEqual(ingest_ais.vessel_cache.get("230000001").id, vessel.id)
+        self.assertEqual(VesselPosition.objects.count(), 2)
+        self.assertEqual(VesselLatestPosition.objects.get(vessel=vessel).latitude, 60.1)
+
+    def test_single_message_path_recovers_too(self):
+        self.command.process_message(position_msg(230000003, 60.0, 24.0))
+        Vessel.objects.all().delete()
+        self.command.process_message(position_msg(230000003, 60.3, 24.3))
+        self.assertEqual(VesselPosition.objects.filter(vessel__mmsi="230000003").count(), 1)
+
+
+class ReplayTests(TransactionTestCase):
+
+    def setUp(self):
+        ingest_ais.vessel_cache.clear()
+        self.command = IngestCommand()
+
+    def test_replayed_batch_skips_stored_positions(self):
+        queued_at = time.time()
+        batch = [position_msg(230000004, 60.0, 24.0), position_msg(230000005, 60.5, 24.5)]
+        self.command.process_batch(batch)
+
+        # Same batch again (its first try failed after the write) plus a report it didn't have
+        self.command.process_batch(batch + [position_msg(230000004, 60.1, 24.1)], replay_since=queued_at)
+
+        self.assertEqual(VesselPosition.objects.filter(vessel__mmsi="230000004").count(), 2)
+        self.assertEqual(VesselPosition.objects.filter(vessel__mmsi="230000005").count(), 1)
+        self.assertEqual(VesselLatestPosition.objects.get(vessel__mmsi="230000004").latitude, 60.1)
@@ -0,0 +1,95 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+from vessels.services.ingest_stream import (
+    MAX_ATTEMPTS, MemoryStreamBuffer, RedisStreamBuffer, StreamSource, streams_for,
+)
+
+
+def fill(buffer, mmsis, reports=3):
+    # reports rounds of one message per vessel, raw is "mmsi:n"
+    buffer.append([(mmsi, f"{mmsi}:{n}") for n in range(reports) for mmsi in mmsis])
+
+
+def drain(source):
+    # Everything the source hands over, acking as it goes
+    raws = []
+    while batch := source.get(0.01):
+        raws.extend(raw for _, raw in batch)
+        source.done(True)
+    return raws
+
+
+class CountingClient:
+    # The bits of a Redis client RedisStreamBuffer.setup uses
+    def __init__(self):
+        self.values = {}
+        self.groups = set()
+
+    def set(self, key, value, nx=False):
+        if not (nx and key in self.values):
+            self.values[key] = str(value).encode()
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def xgroup_create(self, key, group, id, mkstream):
+        self.groups.add((key, group))
+
+
+class StreamSourceTests(SimpleTestCase):
+
+    def setUp(self):
+        self.buffer = MemoryStreamBuffer(4)
+        self.mmsis = [230000000 + i for i in range(12)]
+
+    def test_every_stream_is_read_by_one_processor_in_order(self):
+        fill(self.buffer, self.mmsis)
+        seen = []
+        for processor in range(3):
+            seen.extend(drain(StreamSource(self.buffer, streams_for(processor, 3, 4), batch_size=5)))
+
+        self.assertEqual(len(seen), 36)
+        for mmsi in self.mmsis:
+            self.assertEqual([raw for raw in seen if raw.startswith(f"{mmsi}:")], [f"{mmsi}:{n}" for n in range(3)])
+
+    def test_unacked_batch_is_read_again_after_a_restart(self):
+        fill(self.buffer, self.mmsis, reports=1)
+        first = StreamSource(self.buffer, streams_for(0, 2, 4), batch_size=4)
+        lost = [raw for _, raw in first.get(0.01)]
+        self.assertIsNone(first.replay_since)
+        # Died before done(), then came back as the only processor
+        restarted = StreamSource(self.buffer, range(4), batch_size=8)
+
+        batch = restarted.get(0.01)
+        self.assertEqual([raw for _, raw in batch], lost)
+        self.assertIsNotNone(restarted.replay_since)
+        restarted.done(True)
+        self.assertEqual(sorted(drain(restarted) + lost), sorted(f"{mmsi}:0" for mmsi in self.mmsis))
+        self.assertEqual(sum(self.buffer.lag(shard)["pending"] for shard in range(4)), 0)
+
+    def test_failing_batch_is_dropped_after_max_attempts(self):
+        fill(self.buffer, self.mmsis[:2], reports=1)
+        source = StreamSource(self.buffer, range(4), batch_size=10)
+        batch = source.get(0.01)
+
+        for _ in range(MAX_ATTEMPTS - 1):
+            self.assertFalse(source.done(False))
+            self.assertIs(source.get(0.001), batch)
+            self.assertIsNotNone(source.replay_since)
+        self.assertTrue(source.done(False))
+
+        self.assertEqual(sum(self.buffer.lag(shard)["pending"] for shard in range(4)), 0)
+        self.assertEqual(source.get(0.01), [])
+
+
+class StreamCountTests(SimpleTestCase):
+
+    def test_setup_rejects_a_different_stream_count(self):
+        client = CountingClient()
+        RedisStreamBuffer(client, 16).setup()
+        RedisStreamBuffer(client, 16).setup()
+        self.assertEqual(len(client.groups), 16)
+
+        with self.assertRaises(ImproperlyConfigured):
+            RedisStreamBuffer(client, 8).setup()
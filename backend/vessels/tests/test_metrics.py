@@ -0,0 +1,24 @@
+from django.db import connection
+from django.test import TestCase
+
+from vessels.models import Vessel
+from vessels.services import metrics
+
+
+class QueryTimingTests(TestCase):
+
+    def test_reconnects_dont_stack_wrappers(self):
+        # connection_created fires on every reconnect of the same wrapper
+        for _ in range(3):
+            metrics.instrument_connection(None, connection)
+        self.assertEqual(connection.execute_wrappers.count(metrics.timed_query), 1)
+
+        before = metrics.db_query_seconds.snapshot()
+        Vessel.objects.count()
+        after = metrics.db_query_seconds.snapshot()
+        self.assertEqual(self.count(after) - self.count(before), 1)
+
+    @staticmethod
+    def count(snapshot):
+        # Buckets then the sum, so everything but the last is a count
+        return sum(sum(counts[:-1]) for _, counts in snapshot["values"])
@@ -0,0 +1,71 @@
+import random
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from vessels.services import fastjson, proximity
+from vessels.services.broadcast import stamp
+from vessels.services.proximity import GridIndex, ProximityIndex, haversine_km
+
+
+def update(seq, vessels):
+    return stamp(seq, fastjson.dumps({"type": "vessel_update", "vessels": vessels}))
+
+
+class GridIndexTests(SimpleTestCase):
+
+    def test_nearest_matches_a_scan_near_and_far(self):
+        rng = random.Random(20)
+        grid = GridIndex(0.1)
+        points = {i: (rng.uniform(54, 66), rng.uniform(10, 30)) for i in range(300)}
+        for key, (lat, lng) in points.items():
+            grid.put(key, lat, lng)
+
+        # Inside the Baltic the rings find it, from the far side of the
+        # world it's the scan
+        for lat, lng in [(60, 20), (55.5, 14.2), (-40, -120), (89, 0)]:
+            expected = min((haversine_km(lat, lng, *p), key) for key, p in points.items())
+            self.assertEqual(grid.nearest(lat, lng, ring_km=100), expected)
+        self.assertIsNone(GridIndex().nearest(60, 20))
+
+
+class VesselFeedTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = ProximityIndex(refresh_every=0, reload_every=3600)
+        self.index._ports_version = "fixed"
+        patcher = mock.patch.object(proximity, "table_version", return_value="fixed")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.snapshot = (fastjson.dumps({"type": "initial_data", "seq": 5, "vessels": [
+            {"id": 1, "latitude": 60.0, "longitude": 24.0},
+            {"id": 2, "name": "NO FIX"},
+        ]}), 5)
+        self.deltas = {}
+
+    def refresh(self):
+        with mock.patch.object(proximity.snapshot_cache, "get", return_value=self.snapshot), \
+                mock.patch.object(proximity, "deltas_since", side_effect=lambda since: self.deltas.get(since)):
+            self.index.refresh()
+
+    def test_snapshot_then_deltas(self):
+        self.refresh()
+        self.assertEqual(self.index.vessels.points, {1: (60.0, 24.0)})
+
+        self.deltas[5] = [
+            update(6, [{"id": 1, "latitude": 60.5, "longitude": 24.5}]),
+            stamp(7, fastjson.dumps({"type": "zone_alerts", "alerts": []})),
+            update(8, [{"id": 3, "latitude": 59.0, "longitude": 23.0}]),
+        ]
+        self.refresh()
+        self.assertEqual(self.index.vessels.points, {1: (60.5, 24.5), 3: (59.0, 23.0)})
+        self.assertEqual(self.index._seq, 8)
+
+    def test_falling_behind_reloads_the_snapshot(self):
+        self.refresh()
+        self.index.vessels.put(9, 61.0, 25.0)
+        # deltas_since(5) is None now: the buffer moved past it
+        self.snapshot = (self.snapshot[0].replace('"seq":5', '"seq":50'), 50)
+        self.refresh()
+        self.assertEqual(self.index.vessels.points, {1: (60.0, 24.0)})
+        self.assertEqual(self.index._seq, 50)
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.test import TestCase
+
+from vessels.models import Vessel, VesselLatestPosition, VesselPosition
+from vessels.services.retention import _thin_partition
+
+
+class ThinPartitionTests(TestCase):
+
+    def setUp(self):
+        start = datetime(2026, 1, 1, 12, tzinfo=dt_timezone.utc)
+        vessels = Vessel.objects.bulk_create([Vessel(mmsi=str(230000000 + i), name=f"SHIP {i}") for i in range(3)])
+        positions = VesselPosition.objects.bulk_create([
+            VesselPosition(vessel=vessel, latitude=60, longitude=24) for vessel in vessels for _ in range(360)
+        ])
+        # Two reports every 20 s for an hour (auto_now_add, so set afterwards)
+        for i, position in enumerate(positions):
+            position.timestamp = start + timedelta(seconds=20 * (i % 360 // 2))
+        VesselPosition.objects.bulk_update(positions, ["timestamp"])
+        self.positions = positions
+        self.window = (start, start + timedelta(hours=1))
+
+    def test_small_pages_drop_the_same_ids(self):
+        whole = [pos_id for chunk in _thin_partition(*self.window, 300, 100000) for pos_id in chunk]
+        chunks = list(_thin_partition(*self.window, 300, 7))
+
+        self.assertTrue(all(len(chunk) <= 7 for chunk in chunks))
+        self.assertEqual([pos_id for chunk in chunks for pos_id in chunk], whole)
+        # One report kept per vessel per 5 minute bucket
+        self.assertEqual(len(whole), 3 * 360 - 3 * 12)
+
+    def test_deleting_each_chunk_as_it_comes(self):
+        for chunk in _thin_partition(*self.window, 300, 50):
+            VesselPosition.objects.filter(id__in=chunk).delete()
+        self.assertEqual(VesselPosition.objects.count(), 3 * 12)
+
+    def test_latest_position_is_kept(self):
+        # The first vessel went quiet inside the window, its last report
+        # is what VesselLatestPosition points at
+        last = self.positions[359]
+        VesselLatestPosition.upsert([last])
+
+        for chunk in _thin_partition(*self.window, 300, 50):
+            VesselPosition.objects.filter(id__in=chunk).delete()
+
+        latest = VesselLatestPosition.objects.get(vessel_id=last.vessel_id)
+        self.assertTrue(VesselPosition.objects.filter(id=latest.position_id).exists())
+        self.assertEqual(VesselPosition.objects.count(), 3 * 12 + 1)
@@ -0,0 +1,60 @@
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from vessels import serializers
+from vessels.models import DroneSimulation, Port, Vessel, VesselLatestPosition, VesselPosition, Zone, ZoneAlert
+from vessels.services import rows
+
+
+class RowEncoderTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        moving = Vessel.objects.create(
+            mmsi="230000001", name="ÅLAND STAR", ship_type="passenger", weight_tonnage=12345.5,
+            flag="FI", length=199.9, width=32.0, destination="MARIEHAMN",
+        )
+        Vessel.objects.create(mmsi="230000002", name="NO FIX")
+        position = VesselPosition.objects.create(vessel=moving, latitude=60.1, longitude=19.9, speed=17.3)
+        # The position lands on the second, the auto_now_add timestamps have microseconds
+        VesselPosition.objects.filter(id=position.id).update(timestamp=datetime(2026, 3, 1, 12, tzinfo=dt_timezone.utc))
+        position.refresh_from_db()
+        VesselLatestPosition.upsert([position])
+
+        zone = Zone.objects.create(name="Harbour", polygon_json=json.dumps({
+            "type": "Polygon", "coordinates": [[[19.0, 60.0], [20.0, 60.0], [20.0, 61.0], [19.0, 60.0]]],
+        }), color="#ff0000")
+        ZoneAlert.objects.create(zone=zone, vessel=moving, alert_type="enter")
+        DroneSimulation.objects.create(
+            vessel=moving, start_latitude=1, start_longitude=2, current_latitude=3,
+            current_longitude=4, target_latitude=60.1, target_longitude=19.9,
+        )
+        Port.objects.create(name="Mariehamn", country="Finland", latitude=60.09, longitude=19.93,
+                            locode="FIMHQ", helcom_id="FIMHQ-1")
+
+    def assert_same_json(self, encoder, serializer_class, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        actual = JSONRenderer().render(encoder.encode_all(queryset.values_list(*encoder.columns)))
+        self.assertEqual(actual, expected)
+
+    def check_all(self):
+        self.assert_same_json(rows.VesselRows(), serializers.VesselSerializer,
+                              Vessel.objects.select_related("latest").order_by("id"))
+        self.assert_same_json(rows.ZoneRows(), serializers.ZoneSerializer, Zone.objects.all())
+        self.assert_same_json(rows.AlertRows(), serializers.ZoneAlertSerializer,
+                              ZoneAlert.objects.select_related("zone", "vessel"))
+        self.assert_same_json(rows.DroneRows(), serializers.DroneSimulationSerializer,
+                              DroneSimulation.objects.select_related("vessel"))
+        self.assert_same_json(rows.PortRows(), serializers.PortSerializer, Port.objects.all())
+
+    def test_encoders_match_serializers(self):
+        self.check_all()
+
+    @override_settings(TIME_ZONE="UTC")
+    def test_encoders_match_serializers_in_utc(self):
+        # UTC is the one DRF renders with a Z
+        self.check_all()
+        self.assertTrue(rows.drf_datetime(datetime(2026, 3, 1, 12, tzinfo=dt_timezone.utc)).endswith("Z"))
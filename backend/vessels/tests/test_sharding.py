@@ -0,0 +1,66 @@
+from django.test import SimpleTestCase, TestCase
+
+from vessels.models import Vessel, Zone, ZoneAlert
+from vessels.services import zone_membership
+from vessels.services.ingest_workers import shard_for
+from vessels.services.snapshot import SnapshotPublisher
+
+
+def row(vessel_id, lat):
+    return {"id": vessel_id, "latitude": lat, "longitude": 24.0}
+
+
+class ShardedSnapshotTests(SimpleTestCase):
+
+    def setUp(self):
+        self.publisher = SnapshotPublisher()
+        self.publisher.seq = 10
+        self.publisher.track_shards(2)
+
+    def test_seq_waits_for_the_slower_shard(self):
+        # Shard 1's seq 12 arrives before shard 0's seq 11
+        self.publisher.update([row(2, 60.2)], 12, shard=1)
+        self.assertEqual(self.publisher.seq, 10)
+        self.publisher.update([row(1, 60.1)], 11, shard=0)
+        self.assertEqual(self.publisher.seq, 11)
+        self.assertEqual(set(self.publisher.vessels), {1, 2})
+
+    def test_idle_floor_moves_past_other_seqs(self):
+        # Zone alerts took 13-15, shard 0 had nothing to send
+        self.publisher.update([row(2, 60.2)], 12, shard=1)
+        self.publisher.update([], 15, shard=0)
+        self.assertEqual(self.publisher.seq, 12)
+        self.publisher.update([], 15, shard=1)
+        self.assertEqual(self.publisher.seq, 15)
+
+    def test_unsharded_takes_the_highest(self):
+        publisher = SnapshotPublisher()
+        publisher.update([row(1, 60.1)], 4)
+        publisher.update([row(1, 60.0)], 3)
+        self.assertEqual(publisher.seq, 4)
+
+
+class ShardRebuildTests(TestCase):
+
+    def setUp(self):
+        zone = Zone.objects.create(name="Z", polygon_json="{}")
+        vessels = Vessel.objects.bulk_create([Vessel(mmsi=str(230000000 + i), name=f"SHIP {i}") for i in range(20)])
+        ZoneAlert.objects.bulk_create([ZoneAlert(zone=zone, vessel=v, alert_type="enter") for v in vessels])
+        self.zone = zone
+        self.shard_of = {v.id: shard_for(v.mmsi, 2) for v in vessels}
+        self.addCleanup(setattr, zone_membership, "_store", zone_membership._store)
+        zone_membership._store = zone_membership.MemoryMembershipStore()
+
+    def test_worker_rebuild_leaves_other_shards_alone(self):
+        store = zone_membership.get_store()
+        # Something shard 1 has written since it started
+        theirs = next(vessel_id for vessel_id, shard in self.shard_of.items() if shard == 1)
+        store.set_many({theirs: {999}})
+
+        inside = zone_membership.rebuild_store(lambda mmsi: shard_for(mmsi, 2) == 0)
+
+        mine = [vessel_id for vessel_id, shard in self.shard_of.items() if shard == 0]
+        self.assertEqual(inside, len(mine))
+        for vessel_id in mine:
+            self.assertEqual(store.get(vessel_id), frozenset({self.zone.id}))
+        self.assertEqual(store.get(theirs), frozenset({999}))
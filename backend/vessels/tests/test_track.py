@@ -0,0 +1,75 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from vessels.services.track import encode_polyline, project, segment_distance, simplify
+
+
+def random_track(rng, n):
+    # A wandering vessel, a few km per leg
+    lats = 60 + np.cumsum(rng.normal(0, 0.002, n))
+    lngs = 24 + np.cumsum(rng.normal(0.001, 0.004, n))
+    return lats, lngs
+
+
+def recursive_dp(x, y, tolerance):
+    # Textbook Douglas-Peucker, one segment at a time
+    keep = {0, len(x) - 1}
+
+    def split(a, b):
+        if b - a < 2:
+            return
+        points = np.arange(a + 1, b)
+        dist = segment_distance(x, y, points, np.full(len(points), a), np.full(len(points), b))
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            keep.add(int(points[i]))
+            split(a, int(points[i]))
+            split(int(points[i]), b)
+
+    split(0, len(x) - 1)
+    return sorted(keep)
+
+
+class SimplifyTests(SimpleTestCase):
+
+    def test_matches_recursive_douglas_peucker(self):
+        rng = np.random.default_rng(16)
+        for n in (3, 50, 2000):
+            lats, lngs = random_track(rng, n)
+            x, y = project(lats, lngs)
+            for tolerance in (1, 50, 500):
+                self.assertEqual(simplify(lats, lngs, tolerance=tolerance).tolist(), recursive_dp(x, y, tolerance))
+
+    def test_dropped_points_stay_within_tolerance(self):
+        lats, lngs = random_track(np.random.default_rng(3), 1000)
+        x, y = project(lats, lngs)
+        keep = simplify(lats, lngs, tolerance=200)
+        self.assertLess(len(keep), 1000)
+        for a, b in zip(keep[:-1], keep[1:]):
+            points = np.arange(a + 1, b)
+            if points.size:
+                dist = segment_distance(x, y, points, np.full(points.size, a), np.full(points.size, b))
+                self.assertLessEqual(dist.max(), 200)
+
+    def test_max_points_keeps_the_most_significant(self):
+        lats, lngs = random_track(np.random.default_rng(5), 1000)
+        keep = simplify(lats, lngs, max_points=50)
+        self.assertEqual(len(keep), 50)
+        self.assertEqual((keep[0], keep[-1]), (0, 999))
+        # Nested ranking: a tighter budget is a subset of a looser one
+        self.assertTrue(set(simplify(lats, lngs, max_points=20)) <= set(keep))
+
+    def test_parked_vessel_collapses_to_endpoints(self):
+        lats, lngs = np.full(500, 60.0), np.full(500, 24.0)
+        self.assertEqual(simplify(lats, lngs, max_points=100).tolist(), [0, 499])
+
+    def test_short_tracks_pass_through(self):
+        self.assertEqual(simplify([60.0, 60.1], [24.0, 24.1], tolerance=10).tolist(), [0, 1])
+        self.assertEqual(simplify([], []).tolist(), [])
+
+    def test_encode_polyline(self):
+        # The example from Google's format documentation
+        self.assertEqual(
+            encode_polyline([38.5, 40.7, 43.252], [-120.2, -120.95, -126.453]),
+            "_p~iF~ps|U_ulLnnqC_mqNvxq`@",
+        )
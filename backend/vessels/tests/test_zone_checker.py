@@ -0,0 +1,104 @@
+from collections import Counter
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase
+from shapely.geometry import Point, shape
+
+from vessels.benchmarks.zones import random_zones
+from vessels.models import Vessel, Zone
+from vessels.services import zone_checker, zone_membership
+from vessels.services.zone_index import ZoneIndex, zone_index
+
+
+def random_points(rng, zones, count):
+    # Half near a zone so plenty of them land inside one, half anywhere
+    bounds = settings.BALTIC_BOUNDS
+    lngs = rng.uniform(bounds["min_lng"], bounds["max_lng"], count)
+    lats = rng.uniform(bounds["min_lat"], bounds["max_lat"], count)
+    for i in range(0, count, 2):
+        ring = zones[rng.integers(len(zones))].get_polygon()["coordinates"][0]
+        lngs[i] = ring[0][0] + rng.normal(0, 0.8)
+        lats[i] = ring[0][1] + rng.normal(0, 0.4)
+    return lngs, lats
+
+
+class ContainmentTests(SimpleTestCase):
+
+    def test_matrix_matches_per_zone_shapely_check(self):
+        rng = np.random.default_rng(4)
+        zones = random_zones(rng, 40, settings.BALTIC_BOUNDS)
+        index = ZoneIndex()
+        index.load(zones)
+        lngs, lats = random_points(rng, zones, 2000)
+
+        # What zone checks did before the index: every zone, one point at a time
+        polygons = [shape(zone.get_polygon()) for zone in zones]
+        expected = np.array([[p.contains(Point(lng, lat)) for p in polygons] for lng, lat in zip(lngs, lats)])
+
+        matrix = index.containment_matrix(lngs, lats)
+        self.assertTrue(expected.any())
+        np.testing.assert_array_equal(matrix, expected)
+
+        for row in range(0, 2000, 50):
+            scalar = {zone.id for zone in index.containing(lngs[row], lats[row])}
+            self.assertEqual(scalar, {zones[col].id for col in np.flatnonzero(expected[row])})
+
+
+class BatchTransitionTests(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(9)
+        self.zones = random_zones(rng, 30, settings.BALTIC_BOUNDS)
+        Zone.objects.bulk_create(self.zones)
+        self.vessels = Vessel.objects.bulk_create([
+            Vessel(mmsi=str(230000000 + i), name=f"SHIP {i}") for i in range(150)
+        ])
+        self.rng = rng
+        zone_index._version = None
+        zone_index.invalidate()
+
+        patcher = mock.patch.object(zone_checker, "send_zone_alerts")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, zone_membership, "_store", zone_membership._store)
+
+    def use_store(self, store):
+        zone_membership._store = store
+        return store
+
+    def test_batch_alerts_and_membership_match_scalar_path(self):
+        # Three flushes, the last one with every vessel reporting twice
+        flushes = []
+        for repeat in (1, 1, 2):
+            vessels = self.vessels * repeat
+            lngs, lats = random_points(self.rng, self.zones, len(vessels))
+            flushes.append((vessels, lats, lngs))
+
+        scalar_store = self.use_store(zone_membership.MemoryMembershipStore())
+        scalar_alerts = []
+        for vessels, lats, lngs in flushes:
+            for vessel, lat, lng in zip(vessels, lats, lngs):
+                scalar_alerts += zone_checker.check_vessel_zones(vessel, lat, lng)
+
+        batch_store = self.use_store(zone_membership.MemoryMembershipStore())
+        batch_alerts = []
+        for vessels, lats, lngs in flushes:
+            batch_alerts += zone_checker.check_vessel_zones_batch(vessels, lats, lngs)
+
+        def key(alert):
+            return alert["vessel_id"], alert["zone_id"], alert["alert_type"]
+
+        self.assertTrue(scalar_alerts)
+        self.assertEqual(Counter(map(key, batch_alerts)), Counter(map(key, scalar_alerts)))
+
+        # Per vessel and zone, transitions come out in the order they happened
+        def sequences(alerts):
+            by_pair = {}
+            for alert in alerts:
+                by_pair.setdefault((alert["vessel_id"], alert["zone_id"]), []).append(alert["alert_type"])
+            return by_pair
+
+        self.assertEqual(sequences(batch_alerts), sequences(scalar_alerts))
+        self.assertEqual(batch_store._zones, scalar_store._zones)
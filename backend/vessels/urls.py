@@ -10,6 +10,8 @@ router.register(r"drone", views.DroneViewSet)
 router.register(r"ports", views.PortViewSet)
 urlpatterns = [
     path("test-redis/", views.test_redis),
+    path("positions/export/", views.export_positions),
+    path("metrics/", views.prometheus_metrics),
     path("", include(router.urls)),
 ]
 
@@ -1,11 +1,17 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_GET
 from channels.layers import get_channel_layer
 import asyncio
 import traceback
 import os
+from datetime import timezone as dt_timezone
 
 from .models import Vessel, VesselPosition, Zone, ZoneAlert, DroneSimulation, Port
 from .serializers import (
@@ -13,6 +19,11 @@ from .serializers import (
     ZoneSerializer, ZoneCreateSerializer, ZoneAlertSerializer,
     DroneSimulationSerializer, PortSerializer
 )
+from .services import export, http_cache, metrics, track
+from .services.proximity import proximity_index
+from .services.rows import AlertRows, DroneRows, PortRows, VesselRows, ZoneRows
+
+TRACK_FIELDS = ["id", "latitude", "longitude", "speed", "heading", "course", "timestamp"]
 
 @api_view(['GET'])
 def test_redis(request):
@@ -32,9 +43,73 @@ def test_redis(request):
             "redis_url": os.environ.get("REDIS_URL")
         })
 
-class VesselViewSet(viewsets.ReadOnlyModelViewSet):
+class FastListMixin:
+    # list() through a RowEncoder instead of the serializer, same JSON out
+    row_encoder = None
+
+    def list(self, request, *args, **kwargs):
+        rows = self.filter_queryset(self.get_queryset()).values_list(*self.row_encoder.columns)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.row_encoder.encode_all(page))
+        return Response(self.row_encoder.encode_all(rows))
+
+
+class ConditionalGetMixin:
+    # ETag/Last-Modified on list and retrieve, 304 when the client's copy is
+    # current, and rendered JSON reused from Redis until the table changes
+    cache_resource = None
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().retrieve, *args, **kwargs)
+
+    def conditional_get(self, request, handler, *args, **kwargs):
+        version, modified = http_cache.resource_state(self.cache_resource, self.queryset.model)
+        variant = f"{request.get_full_path()}|{request.accepted_renderer.format}"
+        etag = http_cache.make_etag(self.cache_resource, version, variant)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": http_date(modified),
+            "Cache-Control": "no-cache",
+        }
+
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            not_modified = http_cache.etag_matches(if_none_match, etag)
+        else:
+            since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+            not_modified = since is not None and int(modified) <= since
+        if not_modified:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        # The browsable API isn't worth caching
+        if request.accepted_renderer.format == "json":
+            body = http_cache.get_rendered(self.cache_resource, etag)
+            if body is not None:
+                return HttpResponse(body, content_type="application/json", headers=headers)
+            self._store_as = etag
+
+        response = handler(request, *args, **kwargs)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        etag = getattr(self, "_store_as", None)
+        if etag and isinstance(response, Response) and response.status_code == 200:
+            response.render()
+            http_cache.store_rendered(self.cache_resource, etag, response.content)
+        return response
+
+
+class VesselViewSet(FastListMixin, viewsets.ReadOnlyModelViewSet):
     """API endpoint for vessels."""
-    queryset = Vessel.objects.all()
+    queryset = Vessel.objects.select_related("latest")
+    row_encoder = VesselRows()
 
     def get_serializer_class(self):
         if self.action == "retrieve":
@@ -43,17 +118,82 @@ class VesselViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=True, methods=["get"])
     def history(self, request, pk=None):
-        """Get position history for a vessel."""
+        """
+        Get position history for a vessel.
+        Without parameters it's the last `limit` positions. `start`/`end`
+        pick a time window, `tolerance` (metres) and/or `max_points` simplify
+        the track, and `output=geojson|polyline` returns just the line
+        """
+        vessel = self.get_object()
+        params = request.query_params
+        try:
+            start = _parse_time(params.get("start"))
+            end = _parse_time(params.get("end"))
+            tolerance = float(params["tolerance"]) if params.get("tolerance") else None
+            max_points = int(params["max_points"]) if params.get("max_points") else None
+            limit = int(params["limit"]) if params.get("limit") else None
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        output = params.get("output", "json")
+        if output not in ("json", "geojson", "polyline"):
+            return Response({"error": "output must be json, geojson or polyline"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if start is None and end is None and tolerance is None and max_points is None and output == "json":
+            positions = vessel.positions.all()[:limit or 200]
+            serializer = VesselPositionSerializer(positions, many=True)
+            return Response(serializer.data)
+
+        positions = vessel.positions.all()
+        if start is not None:
+            positions = positions.filter(timestamp__gte=start)
+        if end is not None:
+            positions = positions.filter(timestamp__lt=end)
+        # Newest first up to the cap, then flipped so the track runs forwards
+        rows = list(positions.values_list(*TRACK_FIELDS)[:limit or settings.TRACK_MAX_ROWS])[::-1]
+
+        keep = track.simplify(
+            [row[1] for row in rows], [row[2] for row in rows],
+            tolerance=tolerance, max_points=max_points,
+        )
+        rows = [rows[i] for i in keep]
+
+        if output == "json":
+            # Same shape (and order) as the plain history
+            kept = [VesselPosition(**dict(zip(TRACK_FIELDS, row))) for row in reversed(rows)]
+            return Response(VesselPositionSerializer(kept, many=True).data)
+
+        latitudes = [row[1] for row in rows]
+        longitudes = [row[2] for row in rows]
+        properties = {
+            "vessel_id": vessel.id,
+            "points": len(rows),
+            "start": rows[0][6].isoformat() if rows else None,
+            "end": rows[-1][6].isoformat() if rows else None,
+        }
+        if output == "geojson":
+            return Response(track.geojson_line(latitudes, longitudes, properties))
+        return Response({**properties, "polyline": track.encode_polyline(latitudes, longitudes)})
+
+    @action(detail=True, methods=["get"])
+    def nearest_port(self, request, pk=None):
+        # Closest port to the vessel's latest position, with distance_km
         vessel = self.get_object()
-        limit = int(request.query_params.get("limit", 200))
-        positions = vessel.positions.all()[:limit]
-        serializer = VesselPositionSerializer(positions, many=True)
-        return Response(serializer.data)
+        latest = getattr(vessel, "latest", None)
+        if latest is None:
+            return Response({"error": "Vessel has no known position"}, status=status.HTTP_404_NOT_FOUND)
 
+        hit = proximity_index.nearest_port(latest.latitude, latest.longitude)
+        port = Port.objects.filter(id=hit[1]).values_list(*PortRows.columns).first() if hit else None
+        if port is None:
+            return Response({"error": "No port found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({**PortRows().encode(port), "distance_km": round(hit[0], 3)})
 
-class ZoneViewSet(viewsets.ModelViewSet):
+
+class ZoneViewSet(ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     # API endpoint for zones
     queryset = Zone.objects.all()
+    row_encoder = ZoneRows()
+    cache_resource = "zones"
 
     def get_serializer_class(self):
         if self.action == "create":
@@ -61,9 +201,10 @@ class ZoneViewSet(viewsets.ModelViewSet):
         return ZoneSerializer
 
 
-class ZoneAlertViewSet(viewsets.ReadOnlyModelViewSet):
+class ZoneAlertViewSet(FastListMixin, viewsets.ReadOnlyModelViewSet):
     # API endpoint for zone alerts
-    queryset = ZoneAlert.objects.all()
+    queryset = ZoneAlert.objects.select_related("zone", "vessel")
+    row_encoder = AlertRows()
     serializer_class = ZoneAlertSerializer
 
     def get_queryset(self):
@@ -72,17 +213,53 @@ class ZoneAlertViewSet(viewsets.ReadOnlyModelViewSet):
         return qs[:limit]
 
 
-class DroneViewSet(viewsets.ReadOnlyModelViewSet):
+class DroneViewSet(FastListMixin, viewsets.ReadOnlyModelViewSet):
     # API endpoint for drone simulations.
-    queryset = DroneSimulation.objects.all()
+    queryset = DroneSimulation.objects.select_related("vessel")
+    row_encoder = DroneRows()
     serializer_class = DroneSimulationSerializer
 
 
-class PortViewSet(viewsets.ReadOnlyModelViewSet):
+class PortViewSet(ConditionalGetMixin, FastListMixin, viewsets.ReadOnlyModelViewSet):
     # API endpoint for HELCOM ports.
     queryset = Port.objects.all()
+    row_encoder = PortRows()
+    cache_resource = "ports"
     serializer_class = PortSerializer
 
+    @action(detail=True, methods=["get"])
+    def nearby_vessels(self, request, pk=None):
+        """
+        Vessels whose latest position is within `radius_km` of the port,
+        nearest first, each with distance_km. `limit` caps how many are
+        returned, `total` is how many there are
+        """
+        port = self.get_object()
+        try:
+            radius_km = float(request.query_params.get("radius_km", settings.PROXIMITY_DEFAULT_RADIUS_KM))
+            limit = int(request.query_params.get("limit", 500))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < radius_km <= 1000:
+            return Response({"error": "radius_km must be between 0 and 1000"}, status=status.HTTP_400_BAD_REQUEST)
+
+        hits = proximity_index.vessels_near(port.latitude, port.longitude, radius_km)
+        page = hits[:max(limit, 0)]
+        rows = Vessel.objects.filter(id__in=[key for _, key in page]).values_list(*VesselRows.columns)
+        encoded = {row[0]: VesselRows().encode(row) for row in rows}
+        # A vessel deleted since the last reload just drops out
+        vessels = [
+            {**encoded[key], "distance_km": round(distance, 3)}
+            for distance, key in page if key in encoded
+        ]
+        return Response({
+            "port": port.id,
+            "radius_km": radius_km,
+            "total": len(hits),
+            "count": len(vessels),
+            "results": vessels,
+        })
+
     @action(detail=False, methods=["post"])
     def deploy(self, request):
         # Deploy a drone to a vessel.
@@ -126,5 +303,50 @@ class PortViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+@require_GET
+def export_positions(request):
+    # Stream position history as an Arrow IPC stream, read in id order so
+    # clients can page through it with since_id. Filters: since_id, start, end.
+    # Rows newer than POSITION_EXPORT_LAG_S are left for the next page, see
+    # export.safe_until_id
+    try:
+        since_id = int(request.GET.get("since_id", 0))
+        start = _parse_time(request.GET.get("start"))
+        end = _parse_time(request.GET.get("end"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        export.require_pyarrow()
+    except ImportError as e:
+        return JsonResponse({"error": str(e)}, status=501)
+
+    until_id = export.safe_until_id(settings.POSITION_EXPORT_LAG_S)
+    queryset = export.export_queryset(since_id=since_id, until_id=until_id, start=start, end=end)
+    response = StreamingHttpResponse(
+        export.astream_arrow(queryset, settings.POSITION_EXPORT_CHUNK_SIZE),
+        content_type=export.ARROW_STREAM_TYPE,
+    )
+    response["Content-Disposition"] = 'attachment; filename="positions.arrows"'
+    return response
+
+
+@require_GET
+def prometheus_metrics(request):
+    # This process's counters plus whatever the ingest process last pushed
+    return HttpResponse(
+        metrics.render(metrics.collect()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
 
 
+def _parse_time(value):
+    # ISO 8601 query param, naive times are taken as UTC
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid datetime: {value}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
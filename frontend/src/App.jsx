@@ -21,7 +21,7 @@ export default function App() {
         handleWSMessage,
     } = useVessels();
 
-    const { connected } = useWebSocket(handleWSMessage);
+    const { connected, setViewport } = useWebSocket(handleWSMessage);
     const { ports, selectedPortId, selectedPort, setSelectedPortId } = usePorts();
 
     const [zones, setZones] = useState([]);
@@ -180,6 +180,7 @@ export default function App() {
                     droneState={droneState}
                     ports={ports}
                     onSelectPort={handleSelectPort}
+                    onViewportChange={setViewport}
                 />
 
                 <Sidebar
@@ -26,6 +26,7 @@ export default function MapView({
     droneState,
     ports,
     onSelectPort,
+    onViewportChange,
 }) {
     const mapContainerRef = useRef(null);
     const mapRef = useRef(null);
@@ -514,6 +515,24 @@ export default function MapView({
         };
     }, []);
 
+    // Tell the server what part of the map we're looking at
+    useEffect(() => {
+        if (!mapLoaded || !mapRef.current || !onViewportChange) return;
+        const map = mapRef.current;
+
+        const reportViewport = () => {
+            const bounds = map.getBounds();
+            onViewportChange(
+                [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()],
+                map.getZoom()
+            );
+        };
+
+        reportViewport();
+        map.on('moveend', reportViewport);
+        return () => map.off('moveend', reportViewport);
+    }, [mapLoaded, onViewportChange]);
+
     // Update vessel markers on map
     useEffect(() => {
         if (!mapLoaded || !mapRef.current) return;
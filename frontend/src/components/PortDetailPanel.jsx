@@ -1,7 +1,23 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import { X, Anchor, MapPin, Shield } from 'lucide-react';
+import { fetchNearbyVessels } from '../services/api';
+
+const NEARBY_RADIUS_KM = 25;
 
 export default function PortDetailPanel({ port, onClose }) {
+    const [nearby, setNearby] = useState(null);
+
+    useEffect(() => {
+        if (!port) return;
+        let cancelled = false;
+        setNearby(null);
+        // Only the count is shown, so don't ask for the vessels themselves
+        fetchNearbyVessels(port.id, NEARBY_RADIUS_KM, 0)
+            .then((data) => { if (!cancelled) setNearby(data.total); })
+            .catch(() => {});
+        return () => { cancelled = true; };
+    }, [port?.id]);
+
     if (!port) return null;
 
     return (
@@ -26,8 +42,8 @@ export default function PortDetailPanel({ port, onClose }) {
                             <span style={{ fontSize: '13px', fontWeight: 'bold', color: '#ffffff' }}>Nominal</span>
                         </div>
                         <div style={{ display: 'flex', justifyContent: 'space-between' }}>
-                            <span style={{ fontSize: '12px', color: 'rgba(255,255,255,0.7)' }}>Traffic Congestion</span>
-                            <span style={{ fontSize: '13px', fontWeight: 'bold', color: '#ffffff' }}>Low</span>
+                            <span style={{ fontSize: '12px', color: 'rgba(255,255,255,0.7)' }}>Vessels within {NEARBY_RADIUS_KM} km</span>
+                            <span style={{ fontSize: '13px', fontWeight: 'bold', color: '#ffffff' }}>{nearby ?? '—'}</span>
                         </div>
                     </div>
                 </div>
@@ -1,7 +1,21 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import { getWeightCategory, formatTonnage, SHIP_TYPE_LABELS, SHIP_TYPE_ICONS } from '../utils/colors.js';
+import { fetchNearestPort } from '../services/api';
 
 export default function VesselDetailPanel({ vessel, onClose, onViewHistory, onDeployDrone, showingHistory }) {
+    const [nearestPort, setNearestPort] = useState(null);
+
+    // Once per selected vessel, not on every position update
+    useEffect(() => {
+        if (!vessel) return;
+        let cancelled = false;
+        setNearestPort(null);
+        fetchNearestPort(vessel.id)
+            .then((data) => { if (!cancelled) setNearestPort(data); })
+            .catch(() => {});
+        return () => { cancelled = true; };
+    }, [vessel?.id]);
+
     if (!vessel) return null;
 
     const category = getWeightCategory(vessel.weight_tonnage || 0);
@@ -69,6 +83,15 @@ export default function VesselDetailPanel({ vessel, onClose, onViewHistory, onDe
                     </div>
                 )}
 
+                {nearestPort && (
+                    <div className="detail-stat" style={{ marginBottom: 12 }}>
+                        <div className="detail-stat-label">Nearest Port</div>
+                        <div className="detail-stat-value" style={{ fontSize: 14 }}>
+                            {nearestPort.name} · {nearestPort.distance_km.toFixed(1)} km
+                        </div>
+                    </div>
+                )}
+
                 <div style={{ fontSize: 11, color: 'var(--text-muted)', marginBottom: 16, fontFamily: 'var(--font-mono)' }}>
                     {vessel.latitude?.toFixed(5)}, {vessel.longitude?.toFixed(5)}
                 </div>
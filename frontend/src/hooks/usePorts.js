@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback } from 'react';
-import { API_BASE } from '../services/api';
+import { fetchPortList } from '../services/api';
 
 export function usePorts() {
     const [ports, setPorts] = useState([]);
@@ -11,11 +11,8 @@ export function usePorts() {
         setLoading(true);
         setError(null);
         try {
-            const response = await fetch(`${API_BASE}/ports/`);
-            if (!response.ok) {
-                throw new Error(`Error fetching ports: ${response.statusText}`);
-            }
-            const data = await response.json();
+            // Goes through request() so repeat loads are 304s
+            const data = await fetchPortList();
             // Data pagination handeling
             const portsData = data.results ? data.results : data;
             setPorts(portsData);
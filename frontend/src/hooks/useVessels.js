@@ -18,7 +18,7 @@ export function useVessels() {
                 // Load all vessels from initial message
                 const vesselMap = {};
                 (data.vessels || []).forEach(v => {
-                    vesselMap[v.id] = v;
+                    vesselMap[v.id] = { ...v, lastSeq: data.seq };
                 });
                 setVessels(vesselMap);
                 break;
@@ -28,26 +28,42 @@ export function useVessels() {
                 setVessels(prev => {
                     const next = { ...prev };
                     (data.vessels || []).forEach(v => {
-                        next[v.id] = { ...next[v.id], ...v };
+                        next[v.id] = { ...next[v.id], ...v, lastSeq: data.seq };
                     });
                     return next;
                 });
                 break;
 
-            case 'zone_alert':
-                if (data.alert) {
-                    const { vessel_id, alert_type } = data.alert;
-                    setVesselInZone(prev => {
-                        const next = new Set(prev);
+            case 'viewport_data':
+                // Vessels inside a map area we just subscribed to, from the
+                // snapshot. Skip the ones we've had a newer update for
+                setVessels(prev => {
+                    const next = { ...prev };
+                    (data.vessels || []).forEach(v => {
+                        if ((next[v.id]?.lastSeq ?? -1) > data.seq) return;
+                        next[v.id] = { ...next[v.id], ...v, lastSeq: data.seq };
+                    });
+                    return next;
+                });
+                break;
+
+            case 'zone_alerts': {
+                // zone_alerts carries a whole ingest batch of alerts
+                const alerts = data.alerts || [];
+                if (alerts.length === 0) break;
+                setVesselInZone(prev => {
+                    const next = new Set(prev);
+                    alerts.forEach(({ vessel_id, alert_type }) => {
                         if (alert_type === 'enter') {
                             next.add(vessel_id);
                         } else {
                             next.delete(vessel_id);
                         }
-                        return next;
                     });
-                }
+                    return next;
+                });
                 break;
+            }
 
             default:
                 break;
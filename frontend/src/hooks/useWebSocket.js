@@ -1,13 +1,131 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
 
+// Opt-in packed binary frames for vessel data (see backend binary_codec.py)
+const BINARY_SUBPROTOCOL = 'vessels.bin.v1';
+const USE_BINARY = import.meta.env.VITE_WS_BINARY === 'true';
+
+const SHIP_TYPES = ['cargo', 'tanker', 'passenger', 'tug', 'fishing', 'military', 'pleasure', 'other'];
+const NO_POSITION = -2147483648;
+const textDecoder = new TextDecoder();
+
+/**
+ * Decode a binary vessel_update / initial_data frame into the same shape
+ * as the JSON messages.
+ */
+export function decodeVesselFrame(buffer) {
+    const view = new DataView(buffer);
+    const bytes = new Uint8Array(buffer);
+    const kind = view.getUint8(1);
+    const seq = view.getUint32(2, true);
+    const count = view.getUint32(6, true);
+    let offset = 10;
+
+    const column = (size, read) => {
+        const start = offset;
+        offset += size * count;
+        return (i) => read(start + i * size);
+    };
+    const string = (lengthSize) => {
+        const length = lengthSize === 1 ? view.getUint8(offset) : view.getUint16(offset, true);
+        offset += lengthSize;
+        const value = textDecoder.decode(bytes.subarray(offset, offset + length));
+        offset += length;
+        return value;
+    };
+
+    const id = column(4, (o) => view.getUint32(o, true));
+    const lat = column(4, (o) => view.getInt32(o, true));
+    const lng = column(4, (o) => view.getInt32(o, true));
+    const speed = column(2, (o) => view.getUint16(o, true));
+    const heading = column(2, (o) => view.getUint16(o, true));
+    const course = column(2, (o) => view.getUint16(o, true));
+    const shipType = column(1, (o) => view.getUint8(o));
+    const tonnage = column(4, (o) => view.getUint32(o, true));
+
+    const vessels = [];
+    for (let i = 0; i < count; i++) {
+        const vessel = {
+            id: id(i),
+            mmsi: string(1),
+            name: string(2),
+            ship_type: SHIP_TYPES[shipType(i)] || 'other',
+            weight_tonnage: tonnage(i),
+        };
+        if (lat(i) !== NO_POSITION) {
+            vessel.latitude = lat(i) / 1e6;
+            vessel.longitude = lng(i) / 1e6;
+            vessel.speed = speed(i) / 10;
+            vessel.heading = heading(i) / 10;
+            vessel.course = course(i) / 10;
+        }
+        vessels.push(vessel);
+    }
+
+    if (kind === 2) {
+        vessels.forEach((vessel) => {
+            vessel.length = view.getUint16(offset, true) / 10;
+            vessel.width = view.getUint16(offset + 2, true) / 10;
+            offset += 4;
+            vessel.flag = string(1);
+            vessel.destination = string(2);
+        });
+    }
+
+    return { type: kind === 1 ? 'vessel_update' : 'initial_data', seq, vessels };
+}
+
+// How far past the oldest seq we haven't seen we keep waiting for it. Seqs
+// filtered out by the viewport never arrive, so we can't wait forever
+const SEQ_WINDOW = 32;
+
+/**
+ * Track which broadcast seqs we've applied. Broadcasts come from several
+ * ingest threads/workers, so they can arrive slightly out of order: we keep
+ * the floor (everything up to it is handled) plus the seqs seen above it,
+ * and only drop exact repeats. Returns false for a message to skip.
+ */
+export function acceptSeq(state, data) {
+    if (typeof data.seq !== 'number') return true;
+    // A viewport's slice of the snapshot isn't a broadcast, useVessels
+    // sorts out which of its rows are newer than what we have
+    if (data.type === 'viewport_data') return true;
+    // A snapshot covers everything up to its seq
+    if (data.type === 'initial_data') {
+        state.floor = data.seq;
+        state.seen.clear();
+        return true;
+    }
+    if (state.floor === null) return true;
+    if (data.seq <= state.floor || state.seen.has(data.seq)) return false;
+
+    state.seen.add(data.seq);
+    const highest = Math.max(...state.seen);
+    if (highest - state.floor > SEQ_WINDOW) {
+        state.floor = highest - SEQ_WINDOW;
+        state.seen.forEach((seq) => {
+            if (seq <= state.floor) state.seen.delete(seq);
+        });
+    }
+    while (state.seen.has(state.floor + 1)) {
+        state.floor += 1;
+        state.seen.delete(state.floor);
+    }
+    return true;
+}
+
 /**
  * WebSocket hook for real-time vessel updates.
+ * Every server broadcast carries a seq number. On reconnect we pass our seq
+ * floor so the server resends everything after it (or a snapshot if it
+ * can't), and anything we've already seen is skipped.
  */
 export function useWebSocket(onMessage) {
     const [connected, setConnected] = useState(false);
     const wsRef = useRef(null);
     const reconnectTimerRef = useRef(null);
     const onMessageRef = useRef(onMessage);
+    const seqRef = useRef({ floor: null, seen: new Set() });
+    const viewportRef = useRef(null);
 
     // Keep callback ref fresh
     useEffect(() => {
@@ -19,15 +137,24 @@ export function useWebSocket(onMessage) {
         const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
         const host = window.location.host;
         const defaultUrl = `${protocol}://${host}/ws/vessels/`;
-        const url = import.meta.env.VITE_WS_URL || defaultUrl;
+        const baseUrl = import.meta.env.VITE_WS_URL || defaultUrl;
+        const since = seqRef.current.floor;
+        const url = since === null
+            ? baseUrl
+            : `${baseUrl}${baseUrl.includes('?') ? '&' : '?'}since=${since}`;
 
         try {
-            const ws = new WebSocket(url);
+            const ws = USE_BINARY ? new WebSocket(url, [BINARY_SUBPROTOCOL]) : new WebSocket(url);
+            ws.binaryType = 'arraybuffer';
             wsRef.current = ws;
 
             ws.onopen = () => {
                 console.log('[WS] Connected');
                 setConnected(true);
+                // Re-subscribe to the map bounds we were watching before
+                if (viewportRef.current) {
+                    ws.send(JSON.stringify(viewportRef.current));
+                }
                 if (reconnectTimerRef.current) {
                     clearTimeout(reconnectTimerRef.current);
                     reconnectTimerRef.current = null;
@@ -36,7 +163,10 @@ export function useWebSocket(onMessage) {
 
             ws.onmessage = (event) => {
                 try {
-                    const data = JSON.parse(event.data);
+                    const data = typeof event.data === 'string'
+                        ? JSON.parse(event.data)
+                        : decodeVesselFrame(event.data);
+                    if (!acceptSeq(seqRef.current, data)) return;
                     onMessageRef.current(data);
                 } catch (err) {
                     console.error('[WS] Parse error:', err);
@@ -59,6 +189,19 @@ export function useWebSocket(onMessage) {
         }
     }, []);
 
+    /**
+     * Only receive vessel updates inside the visible map area. The server
+     * answers with a viewport_data slice of the snapshot, so vessels already
+     * sitting in the new area show up without waiting for them to move.
+     */
+    const setViewport = useCallback((bbox, zoom) => {
+        viewportRef.current = { type: 'subscribe_bbox', bbox, zoom };
+        const ws = wsRef.current;
+        if (ws && ws.readyState === WebSocket.OPEN) {
+            ws.send(JSON.stringify(viewportRef.current));
+        }
+    }, []);
+
     useEffect(() => {
         connect();
         return () => {
@@ -67,6 +210,6 @@ export function useWebSocket(onMessage) {
         };
     }, [connect]);
 
-    return { connected };
+    return { connected, setViewport };
 }
 
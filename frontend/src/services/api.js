@@ -4,30 +4,45 @@
 
 export const API_BASE = import.meta.env.VITE_API_URL || '/api';
 
+// Last ETag and body per GET url, so unchanged resources come back as 304s
+const etagCache = new Map();
+
 async function request(path, options = {}) {
     const url = `${API_BASE}${path}`;
+    const isGet = !options.method || options.method === 'GET';
+    const cached = isGet ? etagCache.get(url) : undefined;
     const res = await fetch(url, {
+        ...options,
         headers: {
             'Content-Type': 'application/json',
+            ...(cached ? { 'If-None-Match': cached.etag } : {}),
             ...options.headers,
         },
-        ...options,
     });
 
+    if (res.status === 304 && cached) return cached.data;
+
     if (!res.ok) {
         const error = await res.json().catch(() => ({ detail: res.statusText }));
         throw new Error(error.detail || error.error || 'API Error');
     }
 
     if (res.status === 204) return {};
-    return res.json();
+    const data = await res.json();
+    const etag = res.headers.get('ETag');
+    if (isGet && etag) etagCache.set(url, { etag, data });
+    return data;
 }
 
 // Vessel endpoints
 export const fetchVessels = () => request('/vessels/');
 export const fetchVessel = (id) => request(`/vessels/${id}/`);
-export const fetchVesselHistory = (id, limit = 200) =>
-    request(`/vessels/${id}/history/?limit=${limit}`);
+// Last `hours` of track, simplified server side to at most `maxPoints`
+export const fetchVesselHistory = (id, { hours = 24, maxPoints = 500 } = {}) => {
+    const start = new Date(Date.now() - hours * 3600 * 1000).toISOString();
+    return request(`/vessels/${id}/history/?start=${encodeURIComponent(start)}&max_points=${maxPoints}`);
+};
+export const fetchNearestPort = (id) => request(`/vessels/${id}/nearest_port/`);
 
 // Zone endpoints
 export const fetchZones = () => request('/zones/');
@@ -50,5 +65,11 @@ export const deployDrone = (vesselId) =>
 
 export const fetchDrones = () => request('/drone/');
 
+// Port endpoints
+export const fetchPortList = () => request('/ports/');
+// limit caps the vessels returned, data.total counts all of them
+export const fetchNearbyVessels = (id, radiusKm = 25, limit = 500) =>
+    request(`/ports/${id}/nearby_vessels/?radius_km=${radiusKm}&limit=${limit}`);
+
 
 